@@ -10,7 +10,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 # Import your models and Base
 from app.db.base import Base
-from app.models import User, Category, Transaction, Budget
+from app.models import User, Category, Transaction, Budget, CategoryRollup, Forecast, UserCategoryStats
 from app.config import settings
 
 # this is the Alembic Config object
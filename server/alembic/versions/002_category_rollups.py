@@ -0,0 +1,151 @@
+"""Category rollups maintained by statement-level triggers
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '002'
+down_revision: Union[str, None] = '001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Frozen copy of the rollup SQL as installed by this revision. Later revisions
+# (and app.models.category_rollup) may change it; this migration must not.
+ROLLUP_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION category_rollups_apply() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO category_rollups AS r
+            (user_id, period_start, category_id, expense_sum, expense_count, income_sum, income_count)
+        SELECT user_id, date_trunc('month', date)::date, COALESCE(category_id, 0),
+               SUM(CASE WHEN amount < 0 THEN -amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount < 0 THEN sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN sign ELSE 0 END)
+        FROM (SELECT user_id, date, category_id, amount, 1 FROM new_rows) AS delta(user_id, date, category_id, amount, sign)
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (user_id, period_start, category_id) DO UPDATE SET
+            expense_sum = r.expense_sum + EXCLUDED.expense_sum,
+            expense_count = r.expense_count + EXCLUDED.expense_count,
+            income_sum = r.income_sum + EXCLUDED.income_sum,
+            income_count = r.income_count + EXCLUDED.income_count;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO category_rollups AS r
+            (user_id, period_start, category_id, expense_sum, expense_count, income_sum, income_count)
+        SELECT user_id, date_trunc('month', date)::date, COALESCE(category_id, 0),
+               SUM(CASE WHEN amount < 0 THEN -amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount < 0 THEN sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN sign ELSE 0 END)
+        FROM (
+            SELECT o.user_id, o.date, o.category_id, o.amount, -1 FROM old_rows o
+            WHERE EXISTS (SELECT 1 FROM users u WHERE u.id = o.user_id)) AS delta(user_id, date, category_id, amount, sign)
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (user_id, period_start, category_id) DO UPDATE SET
+            expense_sum = r.expense_sum + EXCLUDED.expense_sum,
+            expense_count = r.expense_count + EXCLUDED.expense_count,
+            income_sum = r.income_sum + EXCLUDED.income_sum,
+            income_count = r.income_count + EXCLUDED.income_count;
+    ELSE
+        INSERT INTO category_rollups AS r
+            (user_id, period_start, category_id, expense_sum, expense_count, income_sum, income_count)
+        SELECT user_id, date_trunc('month', date)::date, COALESCE(category_id, 0),
+               SUM(CASE WHEN amount < 0 THEN -amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount < 0 THEN sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN sign ELSE 0 END)
+        FROM (
+            SELECT n.user_id, n.date, n.category_id, n.amount, 1
+            FROM new_rows n JOIN old_rows o ON o.id = n.id
+            WHERE (o.user_id, o.date, o.category_id, o.amount)
+                IS DISTINCT FROM (n.user_id, n.date, n.category_id, n.amount)
+            UNION ALL
+            SELECT o.user_id, o.date, o.category_id, o.amount, -1
+            FROM new_rows n JOIN old_rows o ON o.id = n.id
+            WHERE (o.user_id, o.date, o.category_id, o.amount)
+                IS DISTINCT FROM (n.user_id, n.date, n.category_id, n.amount)) AS delta(user_id, date, category_id, amount, sign)
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (user_id, period_start, category_id) DO UPDATE SET
+            expense_sum = r.expense_sum + EXCLUDED.expense_sum,
+            expense_count = r.expense_count + EXCLUDED.expense_count,
+            income_sum = r.income_sum + EXCLUDED.income_sum,
+            income_count = r.income_count + EXCLUDED.income_count;
+    END IF;
+    RETURN NULL;
+END;
+$$
+"""
+
+ROLLUP_TRIGGERS_SQL = [
+    """
+    CREATE OR REPLACE TRIGGER transactions_rollup_insert
+    AFTER INSERT ON transactions REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION category_rollups_apply()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER transactions_rollup_update
+    AFTER UPDATE ON transactions REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION category_rollups_apply()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER transactions_rollup_delete
+    AFTER DELETE ON transactions REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION category_rollups_apply()
+    """,
+]
+
+ROLLUP_BACKFILL_SQL = """
+INSERT INTO category_rollups
+    (user_id, period_start, category_id, expense_sum, expense_count, income_sum, income_count)
+SELECT user_id, date_trunc('month', date)::date, COALESCE(category_id, 0),
+       SUM(CASE WHEN amount < 0 THEN -amount::numeric(14, 2) ELSE 0 END),
+       COUNT(*) FILTER (WHERE amount < 0),
+       SUM(CASE WHEN amount >= 0 THEN amount::numeric(14, 2) ELSE 0 END),
+       COUNT(*) FILTER (WHERE amount >= 0)
+FROM transactions
+GROUP BY 1, 2, 3
+"""
+
+
+def upgrade() -> None:
+    # Create category_rollups table: (user, month, category) -> sums and counts
+    op.create_table(
+        'category_rollups',
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('period_start', sa.Date(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column('expense_sum', sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column('expense_count', sa.Integer(), nullable=False),
+        sa.Column('income_sum', sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column('income_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'period_start', 'category_id')
+    )
+
+    # Triggers on transactions keep the rollups up to date (PostgreSQL 14+)
+    op.execute(ROLLUP_FUNCTION_SQL)
+    for statement in ROLLUP_TRIGGERS_SQL:
+        op.execute(statement)
+
+    # Existing transactions
+    op.execute(ROLLUP_BACKFILL_SQL)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS transactions_rollup_delete ON transactions")
+    op.execute("DROP TRIGGER IF EXISTS transactions_rollup_update ON transactions")
+    op.execute("DROP TRIGGER IF EXISTS transactions_rollup_insert ON transactions")
+    op.execute("DROP FUNCTION IF EXISTS category_rollups_apply()")
+    op.drop_table('category_rollups')
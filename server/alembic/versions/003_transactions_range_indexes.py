@@ -0,0 +1,47 @@
+"""Composite covering and BRIN indexes for per-user date range queries
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '003'
+down_revision: Union[str, None] = '002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY: no write lock on transactions while the indexes are built
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_transactions_user_date', 'transactions', ['user_id', 'date'],
+            postgresql_include=['amount', 'category_id'], postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_transactions_user_category_date', 'transactions', ['user_id', 'category_id', 'date'],
+            postgresql_include=['amount'], postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_transactions_date_brin', 'transactions', ['date'],
+            postgresql_using='brin', postgresql_concurrently=True,
+        )
+
+        # Covered by the composite indexes (user_id prefix) and the BRIN index
+        op.drop_index('ix_transactions_user_id', table_name='transactions', postgresql_concurrently=True)
+        op.drop_index('ix_transactions_date', table_name='transactions', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_transactions_date', 'transactions', ['date'], postgresql_concurrently=True)
+        op.create_index('ix_transactions_user_id', 'transactions', ['user_id'], postgresql_concurrently=True)
+
+        op.drop_index('ix_transactions_date_brin', table_name='transactions', postgresql_concurrently=True)
+        op.drop_index('ix_transactions_user_category_date', table_name='transactions', postgresql_concurrently=True)
+        op.drop_index('ix_transactions_user_date', table_name='transactions', postgresql_concurrently=True)
@@ -0,0 +1,42 @@
+"""Running per-user, per-category expense statistics for anomaly detection
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '005'
+down_revision: Union[str, None] = '004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Create user_category_stats table: updated per transaction by anomaly_service,
+    # backfilled by scripts/rescore_anomalies.py
+    op.create_table(
+        'user_category_stats',
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('mean', sa.Float(), nullable=False),
+        sa.Column('m2', sa.Float(), nullable=False),
+        sa.Column('ewma', sa.Float(), nullable=False),
+        sa.Column('ewm_var', sa.Float(), nullable=False),
+        sa.Column('p2_heights', postgresql.ARRAY(sa.Float()), nullable=False),
+        sa.Column('p2_positions', postgresql.ARRAY(sa.Float()), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'category_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('user_category_stats')
@@ -0,0 +1,185 @@
+"""Device-assigned client_id for idempotent bulk ingest, re-planned rollup UPDATE trigger
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '006'
+down_revision: Union[str, None] = '005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Frozen copies of the rollup function: this revision's (UPDATE branch through
+# EXECUTE) and the one from revision 002 that downgrade restores
+ROLLUP_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION category_rollups_apply() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO category_rollups AS r
+            (user_id, period_start, category_id, expense_sum, expense_count, income_sum, income_count)
+        SELECT user_id, date_trunc('month', date)::date, COALESCE(category_id, 0),
+               SUM(CASE WHEN amount < 0 THEN -amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount < 0 THEN sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN sign ELSE 0 END)
+        FROM (SELECT user_id, date, category_id, amount, 1 FROM new_rows) AS delta(user_id, date, category_id, amount, sign)
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (user_id, period_start, category_id) DO UPDATE SET
+            expense_sum = r.expense_sum + EXCLUDED.expense_sum,
+            expense_count = r.expense_count + EXCLUDED.expense_count,
+            income_sum = r.income_sum + EXCLUDED.income_sum,
+            income_count = r.income_count + EXCLUDED.income_count;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO category_rollups AS r
+            (user_id, period_start, category_id, expense_sum, expense_count, income_sum, income_count)
+        SELECT user_id, date_trunc('month', date)::date, COALESCE(category_id, 0),
+               SUM(CASE WHEN amount < 0 THEN -amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount < 0 THEN sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN sign ELSE 0 END)
+        FROM (
+            SELECT o.user_id, o.date, o.category_id, o.amount, -1 FROM old_rows o
+            WHERE EXISTS (SELECT 1 FROM users u WHERE u.id = o.user_id)) AS delta(user_id, date, category_id, amount, sign)
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (user_id, period_start, category_id) DO UPDATE SET
+            expense_sum = r.expense_sum + EXCLUDED.expense_sum,
+            expense_count = r.expense_count + EXCLUDED.expense_count,
+            income_sum = r.income_sum + EXCLUDED.income_sum,
+            income_count = r.income_count + EXCLUDED.income_count;
+    ELSE
+        -- EXECUTE: planned per statement, not from a plan cached on a single-row UPDATE
+        EXECUTE $upsert$
+        INSERT INTO category_rollups AS r
+            (user_id, period_start, category_id, expense_sum, expense_count, income_sum, income_count)
+        SELECT user_id, date_trunc('month', date)::date, COALESCE(category_id, 0),
+               SUM(CASE WHEN amount < 0 THEN -amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount < 0 THEN sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN sign ELSE 0 END)
+        FROM (
+            SELECT n.user_id, n.date, n.category_id, n.amount, 1
+            FROM new_rows n JOIN old_rows o ON o.id = n.id
+            WHERE (o.user_id, o.date, o.category_id, o.amount)
+                IS DISTINCT FROM (n.user_id, n.date, n.category_id, n.amount)
+            UNION ALL
+            SELECT o.user_id, o.date, o.category_id, o.amount, -1
+            FROM new_rows n JOIN old_rows o ON o.id = n.id
+            WHERE (o.user_id, o.date, o.category_id, o.amount)
+                IS DISTINCT FROM (n.user_id, n.date, n.category_id, n.amount)) AS delta(user_id, date, category_id, amount, sign)
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (user_id, period_start, category_id) DO UPDATE SET
+            expense_sum = r.expense_sum + EXCLUDED.expense_sum,
+            expense_count = r.expense_count + EXCLUDED.expense_count,
+            income_sum = r.income_sum + EXCLUDED.income_sum,
+            income_count = r.income_count + EXCLUDED.income_count$upsert$;
+    END IF;
+    RETURN NULL;
+END;
+$$
+"""
+
+PREVIOUS_ROLLUP_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION category_rollups_apply() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO category_rollups AS r
+            (user_id, period_start, category_id, expense_sum, expense_count, income_sum, income_count)
+        SELECT user_id, date_trunc('month', date)::date, COALESCE(category_id, 0),
+               SUM(CASE WHEN amount < 0 THEN -amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount < 0 THEN sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN sign ELSE 0 END)
+        FROM (SELECT user_id, date, category_id, amount, 1 FROM new_rows) AS delta(user_id, date, category_id, amount, sign)
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (user_id, period_start, category_id) DO UPDATE SET
+            expense_sum = r.expense_sum + EXCLUDED.expense_sum,
+            expense_count = r.expense_count + EXCLUDED.expense_count,
+            income_sum = r.income_sum + EXCLUDED.income_sum,
+            income_count = r.income_count + EXCLUDED.income_count;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO category_rollups AS r
+            (user_id, period_start, category_id, expense_sum, expense_count, income_sum, income_count)
+        SELECT user_id, date_trunc('month', date)::date, COALESCE(category_id, 0),
+               SUM(CASE WHEN amount < 0 THEN -amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount < 0 THEN sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN sign ELSE 0 END)
+        FROM (
+            SELECT o.user_id, o.date, o.category_id, o.amount, -1 FROM old_rows o
+            WHERE EXISTS (SELECT 1 FROM users u WHERE u.id = o.user_id)) AS delta(user_id, date, category_id, amount, sign)
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (user_id, period_start, category_id) DO UPDATE SET
+            expense_sum = r.expense_sum + EXCLUDED.expense_sum,
+            expense_count = r.expense_count + EXCLUDED.expense_count,
+            income_sum = r.income_sum + EXCLUDED.income_sum,
+            income_count = r.income_count + EXCLUDED.income_count;
+    ELSE
+        INSERT INTO category_rollups AS r
+            (user_id, period_start, category_id, expense_sum, expense_count, income_sum, income_count)
+        SELECT user_id, date_trunc('month', date)::date, COALESCE(category_id, 0),
+               SUM(CASE WHEN amount < 0 THEN -amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount < 0 THEN sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN sign ELSE 0 END)
+        FROM (
+            SELECT n.user_id, n.date, n.category_id, n.amount, 1
+            FROM new_rows n JOIN old_rows o ON o.id = n.id
+            WHERE (o.user_id, o.date, o.category_id, o.amount)
+                IS DISTINCT FROM (n.user_id, n.date, n.category_id, n.amount)
+            UNION ALL
+            SELECT o.user_id, o.date, o.category_id, o.amount, -1
+            FROM new_rows n JOIN old_rows o ON o.id = n.id
+            WHERE (o.user_id, o.date, o.category_id, o.amount)
+                IS DISTINCT FROM (n.user_id, n.date, n.category_id, n.amount)) AS delta(user_id, date, category_id, amount, sign)
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (user_id, period_start, category_id) DO UPDATE SET
+            expense_sum = r.expense_sum + EXCLUDED.expense_sum,
+            expense_count = r.expense_count + EXCLUDED.expense_count,
+            income_sum = r.income_sum + EXCLUDED.income_sum,
+            income_count = r.income_count + EXCLUDED.income_count;
+    END IF;
+    RETURN NULL;
+END;
+$$
+"""
+
+
+def upgrade() -> None:
+    # Nullable without default: no table rewrite
+    op.add_column('transactions', sa.Column('client_id', postgresql.UUID(as_uuid=True), nullable=True))
+
+    # Conflict target for INSERT ... ON CONFLICT (user_id, client_id) in bulk ingest.
+    # NULL client_id never conflicts, so existing rows need no backfill
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_transactions_user_client_id', 'transactions', ['user_id', 'client_id'],
+            unique=True, postgresql_concurrently=True,
+        )
+
+    # The UPDATE branch now runs through EXECUTE: a plan cached on a single-row
+    # UPDATE joined old_rows/new_rows with a nested loop, quadratic for bulk upserts
+    op.execute(ROLLUP_FUNCTION_SQL)
+
+
+def downgrade() -> None:
+    op.execute(PREVIOUS_ROLLUP_FUNCTION_SQL)
+
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_transactions_user_client_id', table_name='transactions', postgresql_concurrently=True)
+    op.drop_column('transactions', 'client_id')
@@ -0,0 +1,30 @@
+"""Index for delta sync: per-user keyset on (updated_at, id)
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '007'
+down_revision: Union[str, None] = '006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY: no write lock on transactions while the index is built
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_transactions_user_updated_id', 'transactions', ['user_id', 'updated_at', 'id'],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_transactions_user_updated_id', table_name='transactions', postgresql_concurrently=True)
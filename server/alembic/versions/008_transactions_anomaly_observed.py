@@ -0,0 +1,31 @@
+"""Per-row flag: transaction already counted in user_category_stats
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '008'
+down_revision: Union[str, None] = '007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing rows are covered by the statistics backfill (scripts/rescore_anomalies.py):
+    # add the column with a constant default (no table rewrite), then switch the default for new rows
+    op.add_column(
+        'transactions',
+        sa.Column('anomaly_observed', sa.Boolean(), server_default=sa.true(), nullable=False),
+    )
+    op.alter_column('transactions', 'anomaly_observed', server_default=sa.false())
+
+
+def downgrade() -> None:
+    op.drop_column('transactions', 'anomaly_observed')
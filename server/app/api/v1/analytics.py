@@ -1,8 +1,14 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from typing import Dict, List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional
+from uuid import UUID
 from loguru import logger
 
+from app.db.session import get_db
+from app.services.executor_service import ExecutorOverloadedError
+from app.services.analytics_service import analytics_service
+
 router = APIRouter()
 
 
@@ -11,29 +17,26 @@ class SpendingPatternsResponse(BaseModel):
     average_daily: float
     average_weekly: float
     average_monthly: float
-    most_frequent_category: str
-    most_expensive_category: str
+    most_frequent_category: Optional[str]
+    most_expensive_category: Optional[str]
     peak_spending_hours: List[int]
     peak_spending_days: List[str]
 
 
 @router.get("/spending-patterns", response_model=SpendingPatternsResponse)
-async def get_spending_patterns(user_id: str):
+async def get_spending_patterns(user_id: UUID, db: AsyncSession = Depends(get_db)):
     """
     Получить паттерны трат пользователя
+
+    Считается по всем расходам: колонки (сумма, время, категория) одним
+    запросом в массивы NumPy, без ORM объектов; результат кэшируется
+    до следующего изменения транзакций пользователя
     """
     try:
-        # TODO: Реализовать анализ паттернов
-        return SpendingPatternsResponse(
-            average_daily=1500,
-            average_weekly=10500,
-            average_monthly=45000,
-            most_frequent_category="Продукты",
-            most_expensive_category="Транспорт",
-            peak_spending_hours=[12, 18, 19],
-            peak_spending_days=["Friday", "Saturday", "Sunday"]
-        )
+        return SpendingPatternsResponse(**await analytics_service.spending_patterns(db, user_id))
 
+    except ExecutorOverloadedError:
+        raise
     except Exception as e:
         logger.error(f"Spending patterns error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -48,30 +51,18 @@ class CategoryBreakdownResponse(BaseModel):
 
 
 @router.get("/category-breakdown", response_model=CategoryBreakdownResponse)
-async def get_category_breakdown(user_id: str, period: str = "month"):
+async def get_category_breakdown(user_id: UUID, period: str = "month", db: AsyncSession = Depends(get_db)):
     """
-    Детализация по категориям за период
+    Детализация по категориям за период: week | month | year | all
+
+    Считается в PostgreSQL по помесячным агрегатам category_rollups
+    (week — GROUP BY по транзакциям за 7 дней)
     """
     try:
-        # TODO: Реализовать детализацию
-        return CategoryBreakdownResponse(
-            categories={
-                "Продукты": {
-                    "amount": 15000,
-                    "count": 45,
-                    "percentage": 33.3
-                },
-                "Транспорт": {
-                    "amount": 8000,
-                    "count": 20,
-                    "percentage": 17.8
-                }
-            },
-            total_expenses=45000,
-            total_income=50000,
-            net=5000
-        )
+        return CategoryBreakdownResponse(**await analytics_service.category_breakdown(db, user_id, period))
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Category breakdown error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
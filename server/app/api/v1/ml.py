@@ -1,10 +1,20 @@
-from fastapi import APIRouter, HTTPException
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Header, HTTPException
 from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
 import time
 
+from app.config import settings
+from app.db.session import get_db
+
 from app.schemas.ml_request import (
     CategorizationRequest,
     CategorizationResponse,
+    ModelInfoResponse,
+    ModelReloadRequest,
     ForecastRequest,
     ForecastResponse,
     AnomalyDetectionRequest,
@@ -12,6 +22,9 @@ from app.schemas.ml_request import (
     RecommendationsRequest,
     RecommendationsResponse,
 )
+from app.services.anomaly_service import anomaly_service
+from app.services.executor_service import executor_service, ExecutorOverloadedError
+from app.services.forecast_service import forecast_service
 from app.services.ml_service import ml_service
 
 router = APIRouter()
@@ -31,13 +44,14 @@ async def categorize_transaction(request: CategorizationRequest):
     start_time = time.time()
 
     try:
-        # Категоризация через ML сервис
-        category, confidence, alternatives = ml_service.categorize(
-            description=request.description,
-            amount=request.amount,
-            merchant_name=request.merchant_name,
-            items=request.items
-        )
+        # Категоризация через ML сервис (версия — та, что реально обслужила запрос)
+        results, model_version = await executor_service.run_ml(ml_service.categorize_many_versioned, [{
+            "description": request.description,
+            "amount": request.amount,
+            "merchant_name": request.merchant_name,
+            "items": request.items,
+        }])
+        category, confidence, alternatives = results[0]
 
         # Время обработки
         processing_time = int((time.time() - start_time) * 1000)
@@ -46,9 +60,12 @@ async def categorize_transaction(request: CategorizationRequest):
             category=category,
             confidence=confidence,
             alternatives=alternatives,
-            processing_time_ms=processing_time
+            processing_time_ms=processing_time,
+            model_version=model_version
         )
 
+    except ExecutorOverloadedError:
+        raise
     except Exception as e:
         logger.error(f"Categorization error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -58,56 +75,145 @@ async def categorize_transaction(request: CategorizationRequest):
 async def categorize_batch(requests: list[CategorizationRequest]):
     """
     Пакетная категоризация (для чеков с множеством товаров)
+
+    Весь пакет векторизуется одной матрицей и проходит через модель
+    одним вызовом predict_proba
+    """
+    start_time = time.time()
+
+    try:
+        results, model_version = await executor_service.run_ml(ml_service.categorize_many_versioned, [
+            {
+                "description": req.description,
+                "amount": req.amount,
+                "merchant_name": req.merchant_name,
+                "items": req.items,
+            }
+            for req in requests
+        ])
+
+        # Время обработки (общее для всего пакета)
+        processing_time = int((time.time() - start_time) * 1000)
+
+        return [
+            CategorizationResponse(
+                category=category,
+                confidence=confidence,
+                alternatives=alternatives,
+                processing_time_ms=processing_time,
+                model_version=model_version
+            )
+            for category, confidence, alternatives in results
+        ]
+
+    except ExecutorOverloadedError:
+        raise
+    except Exception as e:
+        logger.error(f"Batch categorization error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/stats")
+async def ml_stats():
     """
-    results = []
-    for req in requests:
-        result = await categorize_transaction(req)
-        results.append(result)
-    return results
+    Состояние ML сервиса: загружена ли модель, кэш предсказаний, очередь пула
+    """
+    return {
+        "model_loaded": ml_service.is_loaded,
+        "model_version": ml_service.model_version,
+        "cache": ml_service.cache_stats(),
+        "executor": executor_service.stats(),
+    }
+
+
+@router.get("/model", response_model=ModelInfoResponse)
+async def model_info():
+    """Текущая версия модели категоризации и доступные версии"""
+    state = ml_service.state
+    return ModelInfoResponse(
+        loaded=state is not None,
+        version=state.version if state else None,
+        engine=state.engine if state else None,
+        loaded_at=datetime.fromtimestamp(state.loaded_at) if state else None,
+        available_versions=ml_service.available_versions(),
+    )
+
+
+@router.post("/model/reload", response_model=ModelInfoResponse)
+async def reload_model(
+    request: Optional[ModelReloadRequest] = None,
+    x_admin_token: Optional[str] = Header(None),
+):
+    """
+    Загрузить версию модели без перезапуска
+
+    Новая модель загружается и прогревается в фоновом потоке, затем
+    подменяется атомарно. Запрос затрагивает только воркер, который его
+    принял; для всех воркеров используйте ML_MODEL_WATCH_INTERVAL
+    """
+    if settings.ML_ADMIN_TOKEN and x_admin_token != settings.ML_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+    version = request.version if request else None
+    if version is not None and version not in ml_service.available_versions():
+        raise HTTPException(status_code=404, detail=f"Model version '{version}' not found")
+
+    if not await ml_service.reload_model(version):
+        raise HTTPException(
+            status_code=500,
+            detail=f"Model reload failed, still serving version {ml_service.model_version}",
+        )
+
+    return await model_info()
 
 
 @router.post("/forecast", response_model=ForecastResponse)
-async def forecast_expenses(request: ForecastRequest):
+async def forecast_expenses(request: ForecastRequest, db: AsyncSession = Depends(get_db)):
     """
     Прогноз расходов на следующий период
 
-    Использует Prophet для временных рядов
+    Демпфированное экспоненциальное сглаживание по недельным суммам всех
+    категорий сразу (NumPy). Обученное состояние кэшируется по пользователю
+    и дообучается только на новых неделях; Prophet — FORECAST_ENGINE=prophet
     """
     try:
-        # TODO: Реализовать прогнозирование
-        return ForecastResponse(
-            period=request.period,
-            forecast={
-                "total": 47000,
-                "by_category": {
-                    "Продукты": {"amount": 15000, "confidence": 0.88},
-                    "Транспорт": {"amount": 5000, "confidence": 0.75},
-                }
-            },
-            trend="stable",
-            confidence_interval=[43000, 51000]
-        )
+        user_id = UUID(request.user_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid user_id")
+
+    try:
+        result = await forecast_service.forecast(db, user_id, request.period, request.history_months)
+        return ForecastResponse(period=request.period, **result)
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExecutorOverloadedError:
+        raise
     except Exception as e:
         logger.error(f"Forecast error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/detect-anomaly", response_model=AnomalyDetectionResponse)
-async def detect_anomaly(request: AnomalyDetectionRequest):
+async def detect_anomaly(request: AnomalyDetectionRequest, db: AsyncSession = Depends(get_db)):
     """
     Определение аномальных трат
 
-    Использует Isolation Forest
+    Сравнение с потоковой статистикой пользователя по категории (Welford,
+    EWMA, P² 95-й процентиль) — без обучения модели на запрос. Сохранённая
+    транзакция (transaction.id) учитывается в статистике и помечается
+    is_anomaly; Isolation Forest — пакетный пересчёт (scripts/rescore_anomalies.py)
     """
     try:
-        # TODO: Реализовать детекцию аномалий
-        return AnomalyDetectionResponse(
-            is_anomaly=False,
-            severity="low",
-            explanation="Транзакция в пределах нормы"
-        )
+        user_id = UUID(request.user_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid user_id")
+
+    try:
+        return AnomalyDetectionResponse(**await anomaly_service.detect(db, user_id, request.transaction))
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Anomaly detection error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
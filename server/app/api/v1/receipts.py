@@ -1,9 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, File, HTTPException, UploadFile
 from pydantic import BaseModel
 from typing import List, Optional
 from loguru import logger
 
-from app.services.ocr_service import ocr_service
+from app.config import settings
+from app.services.executor_service import ExecutorOverloadedError, executor_service
+from app.services.fns_service import FNSServiceError, fns_service
+from app.services.image_preprocessing_service import image_preprocessing_service
+from app.services.ml_service import ml_service
+from app.services.ocr_cache import ocr_cache
+from app.services.ocr_worker_pool import ocr_worker_pool
 
 router = APIRouter()
 
@@ -37,42 +43,62 @@ async def parse_qr_receipt(request: QRReceiptRequest):
     Получить детальные данные чека по QR коду
 
     Процесс:
-    1. Парсинг QR кода (извлечение параметров)
-    2. Запрос к API ФНС или proverkacheka.com
-    3. Получение списка товаров
-    4. ML категоризация каждой позиции
+    1. Парсинг QR кода (fn, i, fp — идентификатор фискального документа)
+    2. Запрос к API ФНС (proverkacheka.com) через общий пул соединений;
+       одновременные запросы одного чека объединяются, результат кэшируется
+    3. ML категоризация всех позиций одним пакетом
     """
     try:
-        # TODO: Реализовать парсинг QR и запрос к API
-        # Временная заглушка:
+        params = fns_service.parse_qr(request.qr_raw)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        receipt = await fns_service.get_receipt(params)
+
+        items = receipt["items"]
+        categories = await executor_service.run_ml(ml_service.categorize_many, [
+            {
+                "description": item["name"],
+                "amount": -item["sum"],
+                "merchant_name": receipt["retailer_name"],
+            }
+            for item in items
+        ])
+
         return QRReceiptResponse(
-            retailer_name="Пятёрочка №1234",
-            retailer_inn="1234567890",
+            retailer_name=receipt["retailer_name"],
+            retailer_inn=receipt["retailer_inn"],
             items=[
                 ReceiptItem(
-                    name="Хлеб белый",
-                    price=45.50,
-                    quantity=1,
-                    sum=45.50,
-                    auto_category="Продукты"
-                ),
-                ReceiptItem(
-                    name="Молоко 3.2% 1л",
-                    price=89.90,
-                    quantity=2,
-                    sum=179.80,
-                    auto_category="Продукты"
+                    name=item["name"],
+                    price=item["price"],
+                    # Клиент ждёт целое: весовой товар (0.482 кг) — 1 шт, сумма точная
+                    quantity=max(1, round(item["quantity"])),
+                    sum=item["sum"],
+                    auto_category=category,
                 )
+                for item, (category, _confidence, _alternatives) in zip(items, categories)
             ],
-            total=225.30,
-            scan_date="2024-01-15T14:30:00"
+            total=receipt["total"],
+            scan_date=receipt["scan_date"],
         )
 
+    except FNSServiceError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ExecutorOverloadedError:
+        raise
     except Exception as e:
         logger.error(f"QR parsing error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/parse-qr/stats")
+async def parse_qr_stats():
+    """Запросы к API ФНС: сколько ушло, сколько объединено, попадания в кэш чеков"""
+    return fns_service.stats()
+
+
 class OCRReceiptRequest(BaseModel):
     """Запрос на OCR чека"""
     image_base64: str  # Base64 encoded image (JPEG/PNG)
@@ -93,27 +119,91 @@ async def ocr_receipt(request: OCRReceiptRequest):
     Распознать чек через OCR с предобработкой изображения.
 
     Pipeline предобработки:
-    1. Декодирование base64 → numpy array
-    2. Конвертация в оттенки серого
-    3. Масштабирование (если изображение слишком маленькое)
-    4. Удаление шума (fastNlMeansDenoising)
-    5. Улучшение контраста (CLAHE)
-    6. Бинаризация (адаптивный порог Gaussian)
-    7. Коррекция угла наклона (deskew)
-    8. Tesseract OCR (rus+eng)
-    9. Парсинг: итоговая сумма, дата, магазин, товары
+    1. Декодирование base64 → байты → numpy array в оттенках серого
+    2. Масштабирование (если изображение слишком маленькое)
+    3. Удаление шума (fastNlMeansDenoising)
+    4. Улучшение контраста (CLAHE)
+    5. Бинаризация (адаптивный порог Gaussian)
+    6. Коррекция угла наклона (deskew)
+    7. Tesseract OCR (rus+eng)
+    8. Парсинг: итоговая сумма, дата, магазин, товары
+
+    Для больших фото лучше /ocr/upload (multipart, без base64).
+
+    Результат кэшируется по хэшу изображения: повторная загрузка того же
+    фото отдаётся из кэша без предобработки и OCR.
     """
     try:
-        result = ocr_service.recognize(request.image_base64)
-
-        return OCRReceiptResponse(
-            total=result.get("total"),
-            date=result.get("date"),
-            retailer=result.get("retailer"),
-            items=result.get("items", []),
-            raw_text=result.get("raw_text", ""),
-        )
+        image_bytes = image_preprocessing_service.decode_base64(request.image_base64)
+        return await _recognize_cached(image_bytes)
+
+    except ExecutorOverloadedError:
+        raise
+    except TimeoutError as e:
+        logger.error(f"OCR timeout: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"OCR error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 
+@router.post("/ocr/upload", response_model=OCRReceiptResponse)
+async def ocr_receipt_upload(file: UploadFile = File(..., description="Фото чека (JPEG/PNG)")):
+    """
+    То же, что /ocr, но изображение передаётся как multipart/form-data.
+
+    Без base64 запрос на треть меньше, а сервер не держит одновременно JSON тело,
+    base64 строку и декодированные байты: multipart парсер пишет файл во
+    временный буфер (в памяти до 1 МБ, дальше на диск), откуда байты
+    читаются один раз и декодируются cv2.imdecode. Кэш общий с /ocr.
+    """
+    try:
+        if file.size is not None and file.size > settings.OCR_UPLOAD_MAX_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Image is too large (max {settings.OCR_UPLOAD_MAX_BYTES} bytes)",
+            )
+
+        image_bytes = await file.read()
+        if not image_bytes:
+            raise HTTPException(status_code=400, detail="Empty file")
+
+        return await _recognize_cached(image_bytes)
+
+    except (ExecutorOverloadedError, HTTPException):
+        raise
+    except TimeoutError as e:
+        logger.error(f"OCR timeout: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"OCR error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await file.close()
+
+
+async def _recognize_cached(image_bytes: bytes) -> OCRReceiptResponse:
+    """OCR в пуле процессов с кэшем по хэшу байт изображения"""
+    cache_key = ocr_cache.key_for(image_bytes)
+
+    result = await ocr_cache.get(cache_key)
+    if result is None:
+        result = await ocr_worker_pool.recognize(image_bytes)
+        await ocr_cache.set(cache_key, result)
+
+    return OCRReceiptResponse(
+        total=result.get("total"),
+        date=result.get("date"),
+        retailer=result.get("retailer"),
+        items=result.get("items", []),
+        raw_text=result.get("raw_text", ""),
+    )
+
+
+@router.get("/ocr/stats")
+async def ocr_stats():
+    """
+    Состояние OCR пула (глубина очереди, занятость воркеров, счётчики задач)
+    и кэша результатов (попадания/промахи)
+    """
+    return {"pool": ocr_worker_pool.stats(), "cache": ocr_cache.stats()}
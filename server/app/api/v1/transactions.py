@@ -0,0 +1,81 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from uuid import UUID
+from loguru import logger
+
+from app.db.session import get_db
+from app.schemas.transaction import BulkIngestResponse, SyncResponse, TransactionIn
+from app.services.executor_service import ExecutorOverloadedError
+from app.services.ingest_service import IngestError, ingest_service
+from app.services.sync_service import sync_service
+
+router = APIRouter()
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-seq")
+
+_ROWS_SCHEMA = {"type": "array", "items": TransactionIn.model_json_schema()}
+
+
+@router.post(
+    "/bulk",
+    response_model=BulkIngestResponse,
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": _ROWS_SCHEMA},
+        "application/x-ndjson": {"schema": TransactionIn.model_json_schema()},
+    }}},
+)
+async def bulk_ingest(user_id: UUID, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Пакетная загрузка транзакций с устройства (сотни–тысячи строк)
+
+    Тело — JSON массив или NDJSON (Content-Type: application/x-ndjson),
+    разбирается потоком. Строки без category_id категоризируются одним
+    вызовом модели на пачку; запись — COPY во временную таблицу и один
+    INSERT ... ON CONFLICT: запись с уже известным client_id обновляется,
+    только если её version больше серверной, иначе возвращается в
+    conflicts. Ошибка в любой строке отменяет загрузку целиком
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    try:
+        result = await ingest_service.ingest(
+            db, user_id, request.stream(), ndjson=content_type in NDJSON_MEDIA_TYPES,
+        )
+        return BulkIngestResponse(**result)
+
+    except IngestError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except ExecutorOverloadedError:
+        raise
+    except Exception as e:
+        logger.error(f"Bulk ingest error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/sync", response_model=SyncResponse)
+async def sync_changes(
+    user_id: UUID,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Транзакции, изменённые после водяного знака cursor (без cursor — все)
+
+    Keyset pagination по (updated_at, id): страница читается по индексу
+    независимо от размера истории. Пока has_more — запрашивать следующую
+    страницу с новым cursor; последний cursor клиент сохраняет до следующей
+    синхронизации. Конфликты решаются по version при отправке
+    (POST /bulk): приходит версия, победившая на сервере. Ответ сжимается
+    (Accept-Encoding: gzip)
+    """
+    try:
+        return SyncResponse(**await sync_service.changes(db, user_id, cursor, limit))
+
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Sync error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,3 +1,4 @@
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
 from typing import Optional
 
@@ -34,10 +35,77 @@ class Settings(BaseSettings):
 
     # ML Models
     ML_MODELS_PATH: str = "app/ml/models"
+    ML_MODEL_FORMAT: str = "auto"  # auto | bundle | pickle
+    ML_ENGINE: str = "random_forest"  # random_forest | logreg | sgd | complement_nb
+    ML_CATEGORIZATION_CACHE_SIZE: int = 10000  # Кэш предсказаний по тексту транзакции
+    ML_FALLBACK_KEYWORDS_PATH: Optional[str] = None  # JSON {категория: [ключевые слова]}, по умолчанию app/ml/fallback_keywords.json
+    ML_MODEL_VERSION: Optional[str] = None  # Закрепить версию (имя директории в ML_MODELS_PATH), по умолчанию — последняя
+    ML_MODEL_WATCH_INTERVAL: float = 0  # Проверять новые версии каждые N секунд (0 — выключено)
+    ML_ADMIN_TOKEN: Optional[str] = None  # Заголовок X-Admin-Token для /ml/model/reload
+
+    # Executors (CPU-bound задачи вне event loop)
+    ML_EXECUTOR_THREADS: int = 4
+    ML_EXECUTOR_MAX_QUEUE: int = 64
+    EXECUTOR_RETRY_AFTER_SECONDS: int = 5
+
+    # OCR worker pool (процессы с прогретым Tesseract)
+    OCR_POOL_WORKERS: int = 2
+    OCR_POOL_MAX_QUEUE: int = 8
+    OCR_POOL_JOB_TIMEOUT_SECONDS: float = 30.0
+    OCR_POOL_MAX_JOBS_PER_WORKER: int = 200
+    # full (все стадии, NL-means всегда) | adaptive — включать после проверки точности OCR
+    # (scripts/validate_preprocessing.py с tesseract) и записи её результатов
+    OCR_PREPROCESS_MODE: str = "full"
+    # OCR длинных чеков по полосам: потоков на воркер (итого до OCR_POOL_WORKERS * OCR_STRIP_THREADS
+    # процессов tesseract; с tesserocr каждый поток держит свои языковые модели)
+    OCR_STRIP_THREADS: int = 2
+    OCR_STRIP_MIN_HEIGHT: int = 3000  # px после предобработки; 0 — не резать
+    OCR_STRIP_HEIGHT: int = 1200
+    OCR_STRIP_OVERLAP: int = 80
+
+    # Кэш результатов OCR (ключ — хэш изображения)
+    OCR_CACHE_MAX_ITEMS: int = 1024
+    OCR_CACHE_TTL_SECONDS: int = 86400
+    OCR_CACHE_SHARED: bool = True  # Общий уровень в Redis (REDIS_URL)
+
+    # Загрузка фото чека (multipart)
+    OCR_UPLOAD_MAX_BYTES: int = 10 * 1024 * 1024
+
+    # Аналитика: кэш паттернов трат по пользователю (сверяется с category_rollups)
+    ANALYTICS_CACHE_MAX_USERS: int = 10000
+    ANALYTICS_CACHE_TTL_SECONDS: int = 3600
+
+    # Прогноз расходов: smoothing — NumPy с кэшем состояния, prophet — медленный офлайн режим
+    FORECAST_ENGINE: str = "smoothing"  # smoothing | prophet
+    FORECAST_CACHE_MAX_USERS: int = 10000
+
+    # Пакетная загрузка транзакций с устройств
+    BULK_INGEST_BATCH_SIZE: int = 10000  # Строк на валидацию, вызов модели и COPY
+    BULK_INGEST_MAX_ROWS: int = 100000
+    BULK_INGEST_MAX_BYTES: int = 64 * 1024 * 1024
+
+    # Синхронизация с мобильным клиентом
+    SYNC_PAGE_SIZE: int = 500
+    SYNC_MAX_PAGE_SIZE: int = 5000
+    SYNC_CURSOR_LAG_SECONDS: int = 30  # Водяной знак не новее now - lag: запись ещё идущей транзакции не пропадёт
+    GZIP_MINIMUM_SIZE: int = 1000  # Ответы больше N байт сжимаются (Accept-Encoding: gzip)
 
     # FNS API (для чеков)
     FNS_API_KEY: Optional[str] = None
     FNS_API_URL: str = "https://proverkacheka.com/api/v1"
+    FNS_TIMEOUT_SECONDS: float = 10.0
+    FNS_CONNECT_TIMEOUT_SECONDS: float = 3.0
+    FNS_MAX_CONNECTIONS: int = 20  # Общий пул keep-alive соединений на процесс
+    FNS_RETRIES: int = 2
+    FNS_RETRY_BACKOFF_SECONDS: float = 0.5  # Задержка перед повтором, удваивается
+    FNS_CACHE_MAX_ITEMS: int = 4096  # Чеки по (fn, i, fp), без TTL — фискальный чек не меняется
+
+    @model_validator(mode="after")
+    def check_ocr_strips(self):
+        # Иначе разрез без пустых строк рядом не сдвигает полосу и _split_strips не завершается
+        if not self.OCR_STRIP_HEIGHT > self.OCR_STRIP_OVERLAP >= 0:
+            raise ValueError("OCR_STRIP_HEIGHT must be greater than OCR_STRIP_OVERLAP, and OCR_STRIP_OVERLAP >= 0")
+        return self
 
     class Config:
         env_file = ".env"
@@ -1,10 +1,16 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
 from loguru import logger
 
 from app.config import settings
-from app.api.v1 import ml, receipts, analytics
+from app.api.v1 import ml, receipts, analytics, transactions
+from app.services.ml_service import ml_service
+from app.services.executor_service import executor_service, ExecutorOverloadedError
+from app.services.fns_service import fns_service
+from app.services.ocr_cache import ocr_cache
+from app.services.ocr_worker_pool import ocr_worker_pool
 
 # Инициализация FastAPI
 app = FastAPI(
@@ -22,6 +28,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Сжатие ответов: синхронизация и аналитика отдают JSON, который хорошо сжимается
+app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MINIMUM_SIZE)
+
 
 @app.on_event("startup")
 async def startup_event():
@@ -41,7 +50,6 @@ async def startup_event():
 
     # Загрузка ML моделей
     try:
-        from app.services.ml_service import ml_service
         logger.info("🤖 Loading ML categorization model...")
         ml_service.load_model()
         if ml_service.is_loaded:
@@ -53,13 +61,26 @@ async def startup_event():
         logger.error(f"❌ ML model loading failed: {e}")
         logger.info("💡 Fallback categorization will be used")
 
-    # TODO: Инициализация Redis
+    # Пулы для CPU-bound задач (ML, OCR)
+    executor_service.start()
+    ocr_worker_pool.start()
+
+    # Подхват новых версий модели без перезапуска
+    ml_service.start_watcher()
+
+    # Redis: общий уровень кэша результатов OCR
+    await ocr_cache.connect()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Очистка при остановке"""
     logger.info("👋 Shutting down FinWise API")
+    await ml_service.stop_watcher()
+    executor_service.shutdown()
+    await ocr_worker_pool.shutdown()
+    await ocr_cache.close()
+    await fns_service.close()
 
 
 @app.get("/")
@@ -83,9 +104,20 @@ async def health_check():
 app.include_router(ml.router, prefix="/api/v1/ml", tags=["ML"])
 app.include_router(receipts.router, prefix="/api/v1/receipts", tags=["Receipts"])
 app.include_router(analytics.router, prefix="/api/v1/analytics", tags=["Analytics"])
+app.include_router(transactions.router, prefix="/api/v1/transactions", tags=["Transactions"])
 
 
 # Обработка ошибок
+@app.exception_handler(ExecutorOverloadedError)
+async def executor_overloaded_handler(request, exc: ExecutorOverloadedError):
+    logger.warning(f"Rejected request, {exc.pool_name} executor is overloaded")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please retry later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     logger.error(f"Global exception: {exc}")
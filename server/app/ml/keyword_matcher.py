@@ -0,0 +1,83 @@
+"""
+Fallback категоризация по ключевым словам одним скомпилированным регулярным выражением.
+
+Ключевые слова из таблицы собираются в префиксное дерево (trie), а оно —
+в одно регулярное выражение: движок re проверяет все ~100 слов за один
+проход по строке, отбрасывая позиции по первому символу.
+
+Приоритет совпадений: самое длинное (самое специфичное) ключевое слово;
+при равной длине — категория, которая раньше указана в таблице.
+"""
+import json
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+DEFAULT_KEYWORDS_PATH = Path(__file__).parent / "fallback_keywords.json"
+
+
+def _trie_to_regex(node: dict) -> str:
+    """Превратить trie ({символ: поддерево, "": True для конца слова}) в регулярное выражение."""
+    is_terminal = "" in node
+    branches = [re.escape(char) + _trie_to_regex(child) for char, child in sorted(node.items()) if char]
+
+    if not branches:
+        return ""
+
+    if len(branches) == 1 and not is_terminal:
+        # Цепочка без ветвлений — простая конкатенация
+        return branches[0]
+
+    group = "(?:" + "|".join(branches) + ")"
+
+    # Жадный "?" — сначала пробуем продолжение слова, поэтому выигрывает самое длинное
+    return group + "?" if is_terminal else group
+
+
+class KeywordMatcher:
+    """Поиск категории по ключевым словам в описании транзакции"""
+
+    def __init__(self, table: Dict[str, List[str]]):
+        # keyword -> (category, порядок категории в таблице)
+        self._keywords: Dict[str, Tuple[str, int]] = {}
+        for order, (category, words) in enumerate(table.items()):
+            for word in words:
+                word = word.lower()
+                if word and word not in self._keywords:
+                    self._keywords[word] = (category, order)
+
+        trie: dict = {}
+        for word in self._keywords:
+            node = trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[""] = True
+
+        # Lookahead находит совпадения во всех позициях, включая перекрывающиеся
+        self._pattern = re.compile("(?=(" + _trie_to_regex(trie) + "))") if trie else None
+
+    @classmethod
+    def from_file(cls, path: Path) -> "KeywordMatcher":
+        """Загрузить таблицу {категория: [ключевые слова]} из JSON файла"""
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def match(self, text: str) -> Optional[str]:
+        """Вернуть категорию лучшего совпадения или None"""
+        if self._pattern is None:
+            return None
+
+        best_rank = None
+        best_category = None
+        for match in self._pattern.finditer(text.lower()):
+            keyword = match.group(1)
+            category, order = self._keywords[keyword]
+            rank = (len(keyword), -order)
+            if best_rank is None or rank > best_rank:
+                best_rank = rank
+                best_category = category
+        return best_category
+
+    def __len__(self) -> int:
+        return len(self._keywords)
@@ -0,0 +1,414 @@
+"""
+Компактный формат модели категоризации без pickle.
+
+Бандл — это директория с плоскими массивами .npy и meta.json:
+
+    meta.json            параметры векторизатора и модели (engine, kind)
+    vocabulary.npy       термины TF-IDF (индекс термина = номер столбца)
+    idf.npy              вектор idf
+    classes.npy          названия категорий (столбцы predict_proba)
+
+Random Forest (kind = "forest"):
+
+    children_left.npy    узлы всех деревьев леса подряд (глобальные индексы)
+    children_right.npy
+    feature.npy
+    threshold.npy
+    leaf_index.npy       строка в leaf_values для листа, -1 для внутренних узлов
+    leaf_values.npy      распределение классов в листьях
+    roots.npy            индекс корня каждого дерева
+
+Линейные модели — logreg, sgd, complement_nb (kind = "linear"):
+
+    coef.npy             матрица весов (n_classes, n_features)
+    intercept.npy        смещения (n_classes,)
+
+Массивы открываются через np.load(mmap_mode="r"): все uvicorn воркеры
+разделяют одни и те же страницы через page cache ОС, а загрузка сводится
+к открытию файлов вместо распаковки pickle со 100 деревьями.
+
+Версии моделей: каждый запуск обучения создаёт директорию
+ML_MODELS_PATH/<версия>/ (pickle файлы + bundles/<движок>/). Имя версии —
+метка времени, поэтому последняя версия — максимальная по имени.
+Файлы прямо в ML_MODELS_PATH (старая раскладка) считаются версией "legacy".
+"""
+import json
+import re
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from app.config import settings
+
+
+BUNDLE_FORMAT_VERSION = 1
+
+# Движки категоризации: обучаются train_categorization.py, выбираются через ML_ENGINE
+ENGINES = ("random_forest", "logreg", "sgd", "complement_nb")
+
+LEGACY_VERSION = "legacy"
+
+# Строк за один спуск по лесу в FlatForestClassifier.predict_proba
+_PREDICT_CHUNK_ROWS = 1024
+
+
+def models_root() -> Path:
+    """Директория моделей (ML_MODELS_PATH; относительный путь — от корня сервера)"""
+    path = Path(settings.ML_MODELS_PATH)
+    if not path.is_absolute():
+        path = Path(__file__).parent.parent.parent / path
+    return path
+
+
+def _is_model_dir(path: Path) -> bool:
+    return (path / "vectorizer.pkl").exists() or (path / "bundles").is_dir()
+
+
+def list_model_versions(root: Path) -> List[str]:
+    """
+    Доступные версии, от старой к новой. Директории, которые начинаются с точки,
+    пропускаются: обучение пишет в них, пока версия не готова
+    """
+    root = Path(root)
+    if not root.is_dir():
+        return []
+    versions = sorted(
+        child.name for child in root.iterdir()
+        if child.is_dir() and not child.name.startswith(".") and _is_model_dir(child)
+    )
+    if _is_model_dir(root):
+        versions.insert(0, LEGACY_VERSION)
+    return versions
+
+
+def model_version_dir(root: Path, version: str) -> Path:
+    """Директория конкретной версии"""
+    return Path(root) if version == LEGACY_VERSION else Path(root) / version
+
+
+def bundle_path(model_dir: Path, engine: str) -> Path:
+    """Директория бандла движка внутри директории моделей"""
+    return Path(model_dir) / "bundles" / engine
+
+
+def pickle_model_path(model_dir: Path, engine: str) -> Path:
+    """Pickle файл модели движка (Random Forest сохраняет прежнее имя файла)"""
+    if engine == "random_forest":
+        return Path(model_dir) / "categorization_model.pkl"
+    return Path(model_dir) / f"categorization_model_{engine}.pkl"
+
+
+class BundleVectorizer:
+    """TF-IDF векторизатор, совместимый с обученным TfidfVectorizer (analyzer='word', norm='l2')"""
+
+    def __init__(self, vocabulary: np.ndarray, idf: np.ndarray, meta: dict):
+        self.vocabulary_ = {str(term): i for i, term in enumerate(vocabulary)}
+        self.idf_ = idf
+        self.lowercase = meta["lowercase"]
+        self.ngram_range = tuple(meta["ngram_range"])
+        self._token_re = re.compile(meta["token_pattern"])
+
+    def _analyze(self, text: str) -> List[str]:
+        """Токенизация и n-граммы так же, как в sklearn _word_ngrams"""
+        if self.lowercase:
+            text = text.lower()
+        tokens = self._token_re.findall(text)
+        min_n, max_n = self.ngram_range
+        terms = []
+        for n in range(min_n, max_n + 1):
+            terms.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return terms
+
+    def transform(self, texts: List[str]) -> sp.csr_matrix:
+        indptr = [0]
+        indices: List[int] = []
+        counts: List[float] = []
+        for text in texts:
+            row = {}
+            for term in self._analyze(text):
+                idx = self.vocabulary_.get(term)
+                if idx is not None:
+                    row[idx] = row.get(idx, 0) + 1
+            for idx in sorted(row):
+                indices.append(idx)
+                counts.append(row[idx])
+            indptr.append(len(indices))
+
+        indices_arr = np.asarray(indices, dtype=np.int32)
+        data = np.asarray(counts, dtype=np.float64) * self.idf_[indices_arr]
+
+        # L2 нормировка каждой строки
+        indptr_arr = np.asarray(indptr, dtype=np.int32)
+        row_ids = np.repeat(np.arange(len(texts)), np.diff(indptr_arr))
+        norms = np.sqrt(np.bincount(row_ids, weights=data ** 2, minlength=len(texts)))
+        norms[norms == 0] = 1.0
+        data /= norms[row_ids]
+
+        return sp.csr_matrix((data, indices_arr, indptr_arr), shape=(len(texts), len(self.idf_)))
+
+
+class FlatForestClassifier:
+    """Random Forest в виде плоских массивов узлов, predict_proba как у sklearn"""
+
+    def __init__(self, arrays: dict, meta: dict):
+        self.children_left = arrays["children_left"]
+        self.children_right = arrays["children_right"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.leaf_index = arrays["leaf_index"]
+        self.leaf_values = arrays["leaf_values"]
+        self.roots = np.asarray(arrays["roots"])
+        self.max_depth = meta["max_depth"]
+
+    def predict_proba(self, X) -> np.ndarray:
+        # Пачки строк ограничивают память спуска (n_rows × n_trees на каждом уровне)
+        n_samples = X.shape[0]
+        if n_samples <= _PREDICT_CHUNK_ROWS:
+            return self._predict_chunk(X)
+        return np.vstack([
+            self._predict_chunk(X[start:start + _PREDICT_CHUNK_ROWS])
+            for start in range(0, n_samples, _PREDICT_CHUNK_ROWS)
+        ])
+
+    def _predict_chunk(self, X) -> np.ndarray:
+        # sklearn сравнивает признаки в float32 с порогами в float64.
+        # Разреженный TF-IDF не уплотняется: пачка в 10k строк × словарь — сотни МБ
+        values = _csr_lookup(X) if sp.issparse(X) else _dense_lookup(X)
+        n_samples = X.shape[0]
+        rows = np.arange(n_samples)[:, None]
+
+        # Спускаемся по всем деревьям для всех строк одновременно: nodes — (n_samples, n_trees)
+        nodes = np.tile(self.roots, (n_samples, 1))
+        for _ in range(self.max_depth):
+            left = self.children_left[nodes]
+            active = left >= 0
+            if not active.any():
+                break
+            go_left = values(rows, self.feature[nodes]) <= self.threshold[nodes]
+            nodes = np.where(active, np.where(go_left, left, self.children_right[nodes]), nodes)
+
+        return self.leaf_values[self.leaf_index[nodes]].mean(axis=1)
+
+
+def _dense_lookup(X):
+    """Функция (rows, columns) -> X[rows, columns] для плотной X"""
+    dense = np.asarray(X, dtype=np.float32)
+
+    def lookup(rows: np.ndarray, columns: np.ndarray) -> np.ndarray:
+        return dense[rows, columns]
+
+    return lookup
+
+
+def _csr_lookup(X):
+    """
+    Функция (rows, columns) -> X[rows, columns] для разреженной X без уплотнения.
+
+    Ненулевые элементы CSR с отсортированными индексами упорядочены по ключу
+    row * n_features + column, поэтому значение находится бинарным поиском
+    (np.searchsorted); память — O(nnz) вместо n_samples × n_features.
+    """
+    X = sp.csr_matrix(X)
+    if not X.has_sorted_indices:
+        X = X.sorted_indices()
+    n_features = X.shape[1]
+    row_ids = np.repeat(np.arange(X.shape[0], dtype=np.int64), np.diff(X.indptr))
+    # Сторожевой ключ в конце: searchsorted всегда возвращает допустимую позицию
+    keys = np.append(row_ids * n_features + X.indices, np.iinfo(np.int64).max)
+    data = np.append(X.data.astype(np.float32), np.float32(0))
+
+    def lookup(rows: np.ndarray, columns: np.ndarray) -> np.ndarray:
+        query = rows * n_features + columns
+        positions = np.searchsorted(keys, query)
+        return np.where(keys[positions] == query, data[positions], np.float32(0))
+
+    return lookup
+
+
+class FlatLinearClassifier:
+    """
+    Линейная модель: scores = X @ coef.T + intercept.
+
+    link = "softmax" — LogisticRegression (multinomial) и ComplementNB,
+    link = "ovr"     — SGDClassifier(log_loss): сигмоида по классам с нормировкой
+    """
+
+    def __init__(self, arrays: dict, meta: dict):
+        self.coef = arrays["coef"]
+        self.intercept = arrays["intercept"]
+        self.link = meta["link"]
+
+    def predict_proba(self, X) -> np.ndarray:
+        scores = np.asarray(X @ self.coef.T) + self.intercept
+        if self.link == "ovr":
+            proba = 1.0 / (1.0 + np.exp(-scores))
+            sums = proba.sum(axis=1, keepdims=True)
+            sums[sums == 0] = 1.0
+            return proba / sums
+
+        scores -= scores.max(axis=1, keepdims=True)
+        proba = np.exp(scores)
+        return proba / proba.sum(axis=1, keepdims=True)
+
+
+def _check_vectorizer(vectorizer):
+    """Бандл воспроизводит только стандартный word TF-IDF с l2 нормой"""
+    if (
+        vectorizer.analyzer != "word"
+        or vectorizer.norm != "l2"
+        or vectorizer.sublinear_tf
+        or vectorizer.binary
+        or not vectorizer.use_idf
+        or vectorizer.stop_words is not None
+        or vectorizer.strip_accents is not None
+        or vectorizer.preprocessor is not None
+        or vectorizer.tokenizer is not None
+    ):
+        raise ValueError("Bundle export supports only word TF-IDF with l2 norm and default preprocessing")
+
+
+def _save_bundle(bundle_dir: Path, vectorizer, class_names: np.ndarray, arrays: dict, meta: dict):
+    """Записать массивы векторизатора и модели и meta.json"""
+    bundle_dir = Path(bundle_dir)
+    bundle_dir.mkdir(parents=True, exist_ok=True)
+
+    vocabulary = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+    arrays = {
+        "vocabulary": np.array(vocabulary, dtype=str),
+        "idf": vectorizer.idf_.astype(np.float64),
+        "classes": np.asarray(class_names, dtype=str),
+        **arrays,
+    }
+    for name, array in arrays.items():
+        np.save(bundle_dir / f"{name}.npy", array)
+
+    meta = {
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "lowercase": vectorizer.lowercase,
+        "token_pattern": vectorizer.token_pattern,
+        "ngram_range": list(vectorizer.ngram_range),
+        **meta,
+    }
+    with open(bundle_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def export_forest_bundle(bundle_dir: Path, vectorizer, model, class_names: np.ndarray):
+    """
+    Сохранить TfidfVectorizer + RandomForestClassifier в формате бандла.
+
+    Args:
+        bundle_dir: Директория бандла (создаётся)
+        vectorizer: Обученный TfidfVectorizer
+        model: Обученный RandomForestClassifier
+        class_names: Названия категорий в порядке столбцов model.predict_proba
+    """
+    _check_vectorizer(vectorizer)
+
+    children_left, children_right, feature, threshold, leaf_index, leaf_values, roots = [], [], [], [], [], [], []
+    offset = 0
+    n_leaves = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        is_leaf = tree.children_left < 0
+        roots.append(offset)
+        children_left.append(np.where(is_leaf, -1, tree.children_left + offset))
+        children_right.append(np.where(is_leaf, -1, tree.children_right + offset))
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(tree.threshold)
+
+        index = np.full(tree.node_count, -1, dtype=np.int64)
+        index[is_leaf] = np.arange(n_leaves, n_leaves + is_leaf.sum())
+        leaf_index.append(index)
+
+        values = tree.value[is_leaf, 0, :]
+        leaf_values.append(values / values.sum(axis=1, keepdims=True))
+
+        offset += tree.node_count
+        n_leaves += int(is_leaf.sum())
+
+    arrays = {
+        "children_left": np.concatenate(children_left).astype(np.int32),
+        "children_right": np.concatenate(children_right).astype(np.int32),
+        "feature": np.concatenate(feature).astype(np.int32),
+        "threshold": np.concatenate(threshold).astype(np.float64),
+        "leaf_index": np.concatenate(leaf_index).astype(np.int32),
+        "leaf_values": np.concatenate(leaf_values).astype(np.float64),
+        "roots": np.asarray(roots, dtype=np.int32),
+    }
+    meta = {
+        "engine": "random_forest",
+        "kind": "forest",
+        "max_depth": int(max(estimator.tree_.max_depth for estimator in model.estimators_)),
+        "n_trees": len(model.estimators_),
+    }
+    _save_bundle(bundle_dir, vectorizer, class_names, arrays, meta)
+
+
+def export_linear_bundle(bundle_dir: Path, engine: str, vectorizer, model, class_names: np.ndarray):
+    """
+    Сохранить TfidfVectorizer + линейную модель в формате бандла.
+
+    Args:
+        bundle_dir: Директория бандла (создаётся)
+        engine: logreg | sgd | complement_nb
+        vectorizer: Обученный TfidfVectorizer
+        model: LogisticRegression, SGDClassifier(loss="log_loss") или ComplementNB
+        class_names: Названия категорий в порядке столбцов model.predict_proba
+    """
+    _check_vectorizer(vectorizer)
+
+    if engine == "complement_nb":
+        # predict_proba ComplementNB — softmax от X @ feature_log_prob_.T
+        coef = model.feature_log_prob_
+        intercept = np.zeros(coef.shape[0])
+        link = "softmax"
+    elif engine == "logreg":
+        coef, intercept, link = model.coef_, model.intercept_, "softmax"
+    elif engine == "sgd":
+        coef, intercept, link = model.coef_, model.intercept_, "ovr"
+    else:
+        raise ValueError(f"Unknown linear engine: {engine}")
+
+    if coef.shape[0] != len(class_names):
+        raise ValueError("Binary linear models are not supported in bundles")
+
+    arrays = {
+        "coef": np.ascontiguousarray(coef, dtype=np.float64),
+        "intercept": np.asarray(intercept, dtype=np.float64),
+    }
+    meta = {"engine": engine, "kind": "linear", "link": link}
+    _save_bundle(bundle_dir, vectorizer, class_names, arrays, meta)
+
+
+def load_bundle(bundle_dir: Path) -> Tuple[BundleVectorizer, object, np.ndarray]:
+    """
+    Открыть бандл через mmap.
+
+    Returns:
+        (vectorizer, model, class_names)
+    """
+    bundle_dir = Path(bundle_dir)
+    with open(bundle_dir / "meta.json", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    if meta.get("format_version") != BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported bundle format version: {meta.get('format_version')}")
+
+    def load(name: str) -> np.ndarray:
+        return np.load(bundle_dir / f"{name}.npy", mmap_mode="r")
+
+    vectorizer = BundleVectorizer(load("vocabulary"), load("idf"), meta)
+
+    kind = meta.get("kind", "forest")
+    if kind == "forest":
+        names = ("children_left", "children_right", "feature", "threshold", "leaf_index", "leaf_values", "roots")
+        model = FlatForestClassifier({name: load(name) for name in names}, meta)
+    elif kind == "linear":
+        model = FlatLinearClassifier({name: load(name) for name in ("coef", "intercept")}, meta)
+    else:
+        raise ValueError(f"Unknown bundle model kind: {kind}")
+
+    return vectorizer, model, np.asarray(load("classes"))
@@ -1,11 +1,32 @@
 """
 Скрипт для обучения ML модели категоризации транзакций
+
+Движки (--engine, можно несколько): random_forest (по умолчанию), logreg, sgd,
+complement_nb или all.
+Все движки обучаются на одном разбиении train/test и сравниваются по точности,
+задержке p50/p99 одиночного предсказания и размеру модели.
+
+Результат — новая версия ML_MODELS_PATH/vYYYYmmdd-HHMMSS/. Файлы пишутся
+в скрытую директорию и переименовываются одним rename, поэтому сервис
+(ML_MODEL_WATCH_INTERVAL) никогда не видит недописанную версию.
+Версия без движка из ML_ENGINE не публикуется: сервис не смог бы её
+загрузить. Движки прошлой версии не копируются — они обучены с другим
+векторизатором.
+
+    python -m app.ml.training.train_categorization --engine all
 """
+import argparse
+import shutil
+import time
+from datetime import datetime
 import pandas as pd
+import numpy as np
 import pickle
 from pathlib import Path
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.naive_bayes import ComplementNB
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import classification_report, accuracy_score
@@ -17,13 +38,74 @@ sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
 
 from loguru import logger
 
+from app.config import settings
+from app.ml.model_bundle import (
+    ENGINES,
+    bundle_path,
+    export_forest_bundle,
+    export_linear_bundle,
+    load_bundle,
+    models_root,
+    pickle_model_path,
+)
+
+
+def build_model(engine: str):
+    """Создать необученную модель для движка"""
+    if engine == "random_forest":
+        return RandomForestClassifier(
+            n_estimators=100,
+            max_depth=20,
+            min_samples_split=2,
+            random_state=42,
+            n_jobs=-1
+        )
+    if engine == "logreg":
+        return LogisticRegression(C=10.0, max_iter=2000)
+    if engine == "sgd":
+        return SGDClassifier(loss="log_loss", alpha=1e-4, max_iter=1000, random_state=42)
+    if engine == "complement_nb":
+        return ComplementNB(alpha=0.3)
+    raise ValueError(f"Unknown engine: {engine}")
+
+
+def benchmark_bundle(bundle_dir: Path, texts: list, expected: list) -> dict:
+    """Точность, задержка одиночного предсказания и размер бандла — так, как его использует сервис"""
+    vectorizer, model, class_names = load_bundle(bundle_dir)
+
+    predicted = class_names[model.predict_proba(vectorizer.transform(texts)).argmax(axis=1)]
+    accuracy = float(np.mean(predicted == np.asarray(expected)))
 
-def train_categorization_model():
+    latencies = []
+    for text in texts:
+        started = time.perf_counter()
+        model.predict_proba(vectorizer.transform([text]))
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    size_kb = sum(f.stat().st_size for f in bundle_dir.iterdir()) / 1024
+    return {
+        "accuracy": accuracy,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "size_kb": size_kb,
+    }
+
+
+def train_categorization_model(engines=("random_forest",)):
     """Обучить модель категоризации"""
 
+    if settings.ML_ENGINE not in engines:
+        logger.error(
+            f"❌ Engine {settings.ML_ENGINE} (ML_ENGINE) is not among trained engines {list(engines)}: "
+            f"the service could not load this version. Train it too (--engine {settings.ML_ENGINE} ...) or use --engine all"
+        )
+        return False
+
     # Пути
     data_path = Path(__file__).parent.parent.parent.parent / "data" / "training" / "transactions_dataset.csv"
-    model_dir = Path(__file__).parent.parent / "models"
+    version = datetime.now().strftime("v%Y%m%d-%H%M%S")
+    final_dir = models_root() / version
+    model_dir = models_root() / f".{version}.tmp"
     model_dir.mkdir(parents=True, exist_ok=True)
 
     logger.info(f"📂 Loading dataset from {data_path}")
@@ -37,6 +119,7 @@ def train_categorization_model():
     except FileNotFoundError:
         logger.error(f"❌ Dataset not found at {data_path}")
         logger.error("Please create the dataset first using the provided CSV template")
+        shutil.rmtree(model_dir, ignore_errors=True)
         return False
 
     # Подготовка данных
@@ -67,48 +150,11 @@ def train_categorization_model():
     X_test_vec = vectorizer.transform(X_test)
     logger.info(f"✅ Vocabulary size: {len(vectorizer.vocabulary_)}")
 
-    # Обучение модели
-    logger.info("🤖 Training Random Forest model...")
-    model = RandomForestClassifier(
-        n_estimators=100,
-        max_depth=20,
-        min_samples_split=2,
-        random_state=42,
-        n_jobs=-1
-    )
-    model.fit(X_train_vec, y_train)
-    logger.info("✅ Model trained successfully")
-
-    # Оценка модели
-    logger.info("📊 Evaluating model...")
-    y_pred = model.predict(X_test_vec)
-    accuracy = accuracy_score(y_test, y_pred)
-    logger.info(f"🎯 Test Accuracy: {accuracy:.4f} ({accuracy*100:.2f}%)")
-
-    # Детальный отчет (только для классов, присутствующих в тесте)
-    try:
-        unique_labels = sorted(set(y_test) | set(y_pred))
-        target_names_filtered = [label_encoder.classes_[i] for i in unique_labels]
-        report = classification_report(
-            y_test, y_pred,
-            labels=unique_labels,
-            target_names=target_names_filtered,
-            zero_division=0
-        )
-        logger.info(f"📋 Classification Report:\n{report}")
-    except Exception as e:
-        logger.warning(f"Could not generate classification report: {e}")
-
-    # Сохранение модели
-    logger.info("💾 Saving model...")
-    model_path = model_dir / "categorization_model.pkl"
+    # Векторизатор и энкодер общие для всех движков
+    logger.info("💾 Saving vectorizer and label encoder...")
     vectorizer_path = model_dir / "vectorizer.pkl"
     encoder_path = model_dir / "label_encoder.pkl"
 
-    with open(model_path, "wb") as f:
-        pickle.dump(model, f)
-    logger.info(f"✅ Model saved to {model_path}")
-
     with open(vectorizer_path, "wb") as f:
         pickle.dump(vectorizer, f)
     logger.info(f"✅ Vectorizer saved to {vectorizer_path}")
@@ -117,24 +163,95 @@ def train_categorization_model():
         pickle.dump(label_encoder, f)
     logger.info(f"✅ Label encoder saved to {encoder_path}")
 
-    # Feature importance (топ-10 фичей)
-    feature_names = vectorizer.get_feature_names_out()
-    importances = model.feature_importances_
-    top_indices = importances.argsort()[-10:][::-1]
+    benchmarks = {}
+    for engine in engines:
+        # Обучение модели
+        logger.info(f"🤖 Training {engine} model...")
+        model = build_model(engine)
+        model.fit(X_train_vec, y_train)
+        logger.info("✅ Model trained successfully")
 
-    logger.info("🔝 Top 10 most important features:")
-    for idx in top_indices:
-        logger.info(f"  - {feature_names[idx]}: {importances[idx]:.4f}")
+        # Оценка модели
+        logger.info("📊 Evaluating model...")
+        y_pred = model.predict(X_test_vec)
+        accuracy = accuracy_score(y_test, y_pred)
+        logger.info(f"🎯 Test Accuracy: {accuracy:.4f} ({accuracy*100:.2f}%)")
+
+        # Детальный отчет (только для классов, присутствующих в тесте)
+        try:
+            unique_labels = sorted(set(y_test) | set(y_pred))
+            target_names_filtered = [label_encoder.classes_[i] for i in unique_labels]
+            report = classification_report(
+                y_test, y_pred,
+                labels=unique_labels,
+                target_names=target_names_filtered,
+                zero_division=0
+            )
+            logger.info(f"📋 Classification Report:\n{report}")
+        except Exception as e:
+            logger.warning(f"Could not generate classification report: {e}")
+
+        # Сохранение модели
+        logger.info("💾 Saving model...")
+        model_path = pickle_model_path(model_dir, engine)
+        with open(model_path, "wb") as f:
+            pickle.dump(model, f)
+        logger.info(f"✅ Model saved to {model_path}")
+
+        # Бандл без pickle: плоские массивы для mmap загрузки в сервисе
+        bundle_dir = bundle_path(model_dir, engine)
+        class_names = label_encoder.classes_[model.classes_]
+        if engine == "random_forest":
+            export_forest_bundle(bundle_dir, vectorizer, model, class_names)
+        else:
+            export_linear_bundle(bundle_dir, engine, vectorizer, model, class_names)
+        logger.info(f"✅ Model bundle saved to {bundle_dir}")
+
+        benchmarks[engine] = benchmark_bundle(
+            bundle_dir, list(X_test), list(label_encoder.classes_[y_test])
+        )
+
+        if engine == "random_forest":
+            # Feature importance (топ-10 фичей)
+            feature_names = vectorizer.get_feature_names_out()
+            importances = model.feature_importances_
+            top_indices = importances.argsort()[-10:][::-1]
+
+            logger.info("🔝 Top 10 most important features:")
+            for idx in top_indices:
+                logger.info(f"  - {feature_names[idx]}: {importances[idx]:.4f}")
+
+    # Сравнение движков на одном и том же тестовом разбиении
+    table = [f"{'engine':<15}{'accuracy':>10}{'p50, ms':>10}{'p99, ms':>10}{'size, KB':>11}"]
+    for engine, result in benchmarks.items():
+        table.append(
+            f"{engine:<15}{result['accuracy']:>10.4f}{result['p50_ms']:>10.3f}"
+            f"{result['p99_ms']:>10.3f}{result['size_kb']:>11.1f}"
+        )
+    logger.info("⏱️  Engine comparison (held-out split, single-item latency via bundle):\n" + "\n".join(table))
+
+    # Публикация версии: rename атомарен в пределах одной файловой системы
+    model_dir.rename(final_dir)
 
     logger.info("✅ Training completed successfully!")
-    logger.info(f"📦 Model files saved in: {model_dir}")
+    logger.info(f"📦 Model files saved in: {final_dir} (version {version})")
 
     return True
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Обучение модели категоризации транзакций")
+    parser.add_argument(
+        "--engine",
+        choices=[*ENGINES, "all"],
+        nargs="+",
+        default=["random_forest"],
+        help="Движки для обучения (all — все движки и сравнение между ними)",
+    )
+    args = parser.parse_args()
+
     logger.info("🚀 Starting ML model training...")
-    success = train_categorization_model()
+    success = train_categorization_model(ENGINES if "all" in args.engine else tuple(dict.fromkeys(args.engine)))
     if success:
         logger.info("✅ Training script completed")
     else:
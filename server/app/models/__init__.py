@@ -2,5 +2,8 @@ from app.models.user import User
 from app.models.category import Category
 from app.models.transaction import Transaction
 from app.models.budget import Budget
+from app.models.category_rollup import CategoryRollup
+from app.models.forecast import Forecast
+from app.models.user_category_stats import UserCategoryStats
 
-__all__ = ["User", "Category", "Transaction", "Budget"]
+__all__ = ["User", "Category", "Transaction", "Budget", "CategoryRollup", "Forecast", "UserCategoryStats"]
@@ -0,0 +1,122 @@
+from sqlalchemy import Column, Integer, Date, ForeignKey, Numeric, event, text
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.db.base import Base
+
+
+class CategoryRollup(Base):
+    """
+    Агрегаты транзакций по (пользователь, месяц, категория)
+    Поддерживаются триггерами на transactions (ROLLUP_DDL), читаются аналитикой
+    вместо сканирования всей истории пользователя
+    """
+    __tablename__ = "category_rollups"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    period_start = Column(Date, primary_key=True)  # Первый день месяца
+    category_id = Column(Integer, primary_key=True)  # 0 — без категории
+
+    # Расходы хранятся положительными; numeric — без накопления ошибки float при +/- дельтах
+    expense_sum = Column(Numeric(14, 2), default=0, nullable=False)
+    expense_count = Column(Integer, default=0, nullable=False)
+    income_sum = Column(Numeric(14, 2), default=0, nullable=False)
+    income_count = Column(Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<CategoryRollup(user_id={self.user_id}, period_start={self.period_start}, category_id={self.category_id})>"
+
+
+# Применение дельт: delta — (user_id, date, category_id, amount, sign), sign = +1/-1.
+# Сортировка по ключу: параллельные операторы блокируют строки агрегата в одном порядке
+_UPSERT_DELTA = """
+        INSERT INTO category_rollups AS r
+            (user_id, period_start, category_id, expense_sum, expense_count, income_sum, income_count)
+        SELECT user_id, date_trunc('month', date)::date, COALESCE(category_id, 0),
+               SUM(CASE WHEN amount < 0 THEN -amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount < 0 THEN sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN amount::numeric(14, 2) * sign ELSE 0 END),
+               SUM(CASE WHEN amount >= 0 THEN sign ELSE 0 END)
+        FROM ({delta}) AS delta(user_id, date, category_id, amount, sign)
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (user_id, period_start, category_id) DO UPDATE SET
+            expense_sum = r.expense_sum + EXCLUDED.expense_sum,
+            expense_count = r.expense_count + EXCLUDED.expense_count,
+            income_sum = r.income_sum + EXCLUDED.income_sum,
+            income_count = r.income_count + EXCLUDED.income_count;"""
+
+# UPDATE учитывает только строки, где поменялись поля агрегата (не receipt_data, is_anomaly...)
+_CHANGED_ROWS = """
+            FROM new_rows n JOIN old_rows o ON o.id = n.id
+            WHERE (o.user_id, o.date, o.category_id, o.amount)
+                IS DISTINCT FROM (n.user_id, n.date, n.category_id, n.amount)"""
+
+# Удаление пользователя каскадом удаляет его транзакции — агрегаты для него не пишем
+_DELETED_ROWS = """
+            SELECT o.user_id, o.date, o.category_id, o.amount, -1 FROM old_rows o
+            WHERE EXISTS (SELECT 1 FROM users u WHERE u.id = o.user_id)"""
+
+# Триггеры уровня оператора с transition tables: один INSERT ... ON CONFLICT
+# на оператор (пакетная вставка, синхронизация), а не на каждую строку
+ROLLUP_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION category_rollups_apply() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+{_UPSERT_DELTA.format(delta="SELECT user_id, date, category_id, amount, 1 FROM new_rows")}
+    ELSIF TG_OP = 'DELETE' THEN
+{_UPSERT_DELTA.format(delta=_DELETED_ROWS)}
+    ELSE
+        -- EXECUTE: план строится на каждый оператор. Закэшированный план PL/pgSQL,
+        -- построенный на UPDATE одной строки, соединял бы old_rows и new_rows
+        -- вложенным циклом — квадратично для пакетного UPDATE (ON CONFLICT DO UPDATE)
+        EXECUTE $upsert${_UPSERT_DELTA.format(delta=f'''
+            SELECT n.user_id, n.date, n.category_id, n.amount, 1 {_CHANGED_ROWS}
+            UNION ALL
+            SELECT o.user_id, o.date, o.category_id, o.amount, -1 {_CHANGED_ROWS}''').rstrip(";")}$upsert$;
+    END IF;
+    RETURN NULL;
+END;
+$$
+"""
+
+ROLLUP_TRIGGERS_SQL = [
+    """
+    CREATE OR REPLACE TRIGGER transactions_rollup_insert
+    AFTER INSERT ON transactions REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION category_rollups_apply()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER transactions_rollup_update
+    AFTER UPDATE ON transactions REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION category_rollups_apply()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER transactions_rollup_delete
+    AFTER DELETE ON transactions REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION category_rollups_apply()
+    """,
+]
+
+# Заполнение по уже существующим транзакциям (при создании таблицы)
+ROLLUP_BACKFILL_SQL = """
+INSERT INTO category_rollups
+    (user_id, period_start, category_id, expense_sum, expense_count, income_sum, income_count)
+SELECT user_id, date_trunc('month', date)::date, COALESCE(category_id, 0),
+       SUM(CASE WHEN amount < 0 THEN -amount::numeric(14, 2) ELSE 0 END),
+       COUNT(*) FILTER (WHERE amount < 0),
+       SUM(CASE WHEN amount >= 0 THEN amount::numeric(14, 2) ELSE 0 END),
+       COUNT(*) FILTER (WHERE amount >= 0)
+FROM transactions
+GROUP BY 1, 2, 3
+"""
+
+ROLLUP_DDL = [ROLLUP_FUNCTION_SQL, *ROLLUP_TRIGGERS_SQL, ROLLUP_BACKFILL_SQL]
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _install_rollup_triggers(target, connection, tables=(), **kw):
+    """init_db (create_all): триггеры ставятся вместе с созданием таблицы агрегатов"""
+    if any(table.name == CategoryRollup.__tablename__ for table in tables):
+        for statement in ROLLUP_DDL:
+            connection.execute(text(statement))
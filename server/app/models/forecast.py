@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+from datetime import datetime
+
+from app.db.base import Base
+
+
+class Forecast(Base):
+    """
+    Предрассчитанный прогноз расходов (scripts/precompute_forecasts.py)
+    /ml/forecast отдаёт его для того же движка (engine), пока не изменилась
+    учтённая история пользователя (checksum) и не завершилась новая неделя (fitted_until)
+    """
+    __tablename__ = "forecasts"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    history_months = Column(Integer, primary_key=True)
+    period = Column(String(10), primary_key=True)  # week | month | quarter
+
+    engine = Column(String(20), nullable=False)  # smoothing | prophet
+    result = Column(JSONB, nullable=False)  # forecast, trend, confidence_interval — как в ForecastResponse
+    fitted_until = Column(DateTime, nullable=False)  # Конец окна обучения (понедельник 00:00)
+    checksum = Column(String(100), nullable=False)  # Подпись истории расходов до fitted_until
+
+    computed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<Forecast(user_id={self.user_id}, period={self.period}, history_months={self.history_months})>"
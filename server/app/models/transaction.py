@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, Integer, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, String, Float, Integer, DateTime, ForeignKey, Text, Boolean, Index, false
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -12,15 +12,27 @@ class Transaction(Base):
     Хранит историю финансовых операций пользователя
     """
     __tablename__ = "transactions"
+    __table_args__ = (
+        # Запросы аналитики: "этот пользователь, этот период, может быть эта категория".
+        # INCLUDE — чтобы суммы читались index-only scan без обращения к таблице
+        Index("ix_transactions_user_date", "user_id", "date", postgresql_include=["amount", "category_id"]),
+        Index("ix_transactions_user_category_date", "user_id", "category_id", "date", postgresql_include=["amount"]),
+        # Диапазоны дат по всем пользователям: таблица растёт по времени, BRIN в сотни раз меньше B-tree
+        Index("ix_transactions_date_brin", "date", postgresql_using="brin"),
+        # Загрузка с устройства: повторная отправка той же записи обновляет её, а не создаёт дубликат
+        Index("ix_transactions_user_client_id", "user_id", "client_id", unique=True),
+        # Синхронизация: изменения пользователя после водяного знака (updated_at, id) — keyset pagination
+        Index("ix_transactions_user_updated_id", "user_id", "updated_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     category_id = Column(Integer, ForeignKey("categories.id", ondelete="SET NULL"), nullable=True, index=True)
 
     # Основные данные
     amount = Column(Float, nullable=False)  # Положительное = доход, отрицательное = расход
     description = Column(Text, nullable=True)
-    date = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    date = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     # Данные чека (опционально)
     receipt_data = Column(JSONB, nullable=True)  # JSON с данными чека: QR, items, retailer
@@ -29,9 +41,12 @@ class Transaction(Base):
     ml_category = Column(String(100), nullable=True)  # Категория от ML модели
     ml_confidence = Column(Float, nullable=True)  # Уверенность ML модели (0-1)
     is_anomaly = Column(Boolean, default=False, nullable=False)  # Флаг аномальной транзакции
+    # Сумма уже учтена в user_category_stats (повторная оценка её не учитывает ещё раз)
+    anomaly_observed = Column(Boolean, default=False, server_default=false(), nullable=False)
 
     # Метаданные синхронизации
     device_id = Column(String(100), nullable=True)  # ID устройства (для синхронизации)
+    client_id = Column(UUID(as_uuid=True), nullable=True)  # ID записи, выданный устройством (офлайн создание)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     version = Column(Integer, default=1, nullable=False)  # Версия для разрешения конфликтов
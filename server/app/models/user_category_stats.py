@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
+from sqlalchemy.dialects.postgresql import UUID, ARRAY
+from datetime import datetime
+
+from app.db.base import Base
+
+
+# category_id строки со статистикой по всем расходам пользователя (0 — расходы без категории)
+ALL_CATEGORIES = -1
+
+
+class UserCategoryStats(Base):
+    """
+    Потоковая статистика расходов по (пользователь, категория)
+    Обновляется за O(1) на каждую новую транзакцию (anomaly_service),
+    по ней оценивается аномальность суммы без обучения модели
+    """
+    __tablename__ = "user_category_stats"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    category_id = Column(Integer, primary_key=True)  # 0 — без категории, ALL_CATEGORIES — все расходы
+
+    # Welford: число наблюдений, среднее и сумма квадратов отклонений
+    count = Column(Integer, default=0, nullable=False)
+    mean = Column(Float, default=0, nullable=False)
+    m2 = Column(Float, default=0, nullable=False)
+
+    # Экспоненциально взвешенные среднее и дисперсия — "обычная" сумма последнего времени
+    ewma = Column(Float, default=0, nullable=False)
+    ewm_var = Column(Float, default=0, nullable=False)
+
+    # P² (Jain & Chlamtac): 5 маркеров оценки квантиля без хранения сумм
+    p2_heights = Column(ARRAY(Float), default=list, nullable=False)
+    p2_positions = Column(ARRAY(Float), default=list, nullable=False)
+
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<UserCategoryStats(user_id={self.user_id}, category_id={self.category_id}, count={self.count})>"
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -14,10 +14,27 @@ class CategorizationRequest(BaseModel):
 
 class CategorizationResponse(BaseModel):
     """Ответ категоризации"""
+    model_config = ConfigDict(protected_namespaces=())
+
     category: str = Field(..., description="Определённая категория")
     confidence: float = Field(..., ge=0, le=1, description="Уверенность модели")
     alternatives: List[dict] = Field(default_factory=list, description="Альтернативные категории")
     processing_time_ms: int = Field(..., description="Время обработки в мс")
+    model_version: Optional[str] = Field(None, description="Версия модели (None — fallback по ключевым словам)")
+
+
+class ModelReloadRequest(BaseModel):
+    """Запрос на перезагрузку модели категоризации"""
+    version: Optional[str] = Field(None, description="Версия; по умолчанию ML_MODEL_VERSION или последняя")
+
+
+class ModelInfoResponse(BaseModel):
+    """Текущая модель категоризации"""
+    loaded: bool
+    version: Optional[str] = None
+    engine: Optional[str] = None
+    loaded_at: Optional[datetime] = None
+    available_versions: List[str] = Field(default_factory=list)
 
 
 class ForecastRequest(BaseModel):
@@ -37,8 +54,13 @@ class ForecastResponse(BaseModel):
 
 class AnomalyDetectionRequest(BaseModel):
     """Запрос на определение аномалий"""
-    transaction: dict
-    user_stats: dict
+    user_id: str = Field(..., description="ID пользователя")
+    transaction: dict = Field(
+        ...,
+        description="id сохранённой транзакции (учитывается в статистике и помечается is_anomaly) "
+                    "или amount и category_id для проверки без сохранения",
+    )
+    user_stats: Optional[dict] = Field(None, description="Не используется: статистика ведётся на сервере")
 
 
 class AnomalyDetectionResponse(BaseModel):
@@ -0,0 +1,85 @@
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from typing import List, Optional
+from datetime import datetime, timezone
+from uuid import UUID
+
+
+class TransactionIn(BaseModel):
+    """Транзакция с устройства (строка пакетной загрузки)"""
+    client_id: Optional[UUID] = Field(
+        None,
+        description="ID записи на устройстве: повторная отправка обновляет запись, а не создаёт дубликат",
+    )
+    amount: float = Field(..., allow_inf_nan=False, description="Положительное — доход, отрицательное — расход")
+    description: Optional[str] = None
+    date: datetime
+    category_id: Optional[int] = Field(None, description="Без категории — категоризация ML моделью")
+    merchant_name: Optional[str] = Field(None, description="Только для категоризации, не сохраняется")
+    receipt_data: Optional[dict] = None
+    device_id: Optional[str] = Field(None, max_length=100)
+    version: int = Field(1, ge=1, description="Версия записи на устройстве: принимается, если новее серверной")
+
+    @field_validator("date")
+    @classmethod
+    def to_naive_utc(cls, value: datetime) -> datetime:
+        # В БД даты хранятся в UTC без часового пояса
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
+class IngestedTransaction(BaseModel):
+    """Серверный id записи с client_id"""
+    client_id: UUID
+    id: int
+    version: int
+
+
+class BulkIngestResponse(BaseModel):
+    """Результат пакетной загрузки"""
+    model_config = ConfigDict(protected_namespaces=())
+
+    received: int
+    inserted: int
+    updated: int
+    skipped: int = Field(..., description="Записи с client_id, у которых серверная версия не старше присланной")
+    categorized: int
+    anomalies: int
+    model_version: Optional[str] = None
+    transactions: List[IngestedTransaction] = Field(
+        default_factory=list, description="Вставленные и обновлённые записи с client_id"
+    )
+    conflicts: List[IngestedTransaction] = Field(
+        default_factory=list,
+        description="Пропущенные записи: версия на сервере не старше присланной, серверная копия придёт при синхронизации",
+    )
+    processing_time_ms: int
+
+
+class TransactionOut(BaseModel):
+    """Серверная копия транзакции для синхронизации"""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    client_id: Optional[UUID] = None
+    amount: float
+    description: Optional[str] = None
+    date: datetime
+    category_id: Optional[int] = None
+    receipt_data: Optional[dict] = None
+    ml_category: Optional[str] = None
+    ml_confidence: Optional[float] = None
+    is_anomaly: bool
+    device_id: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    version: int
+
+
+class SyncResponse(BaseModel):
+    """Страница изменений после водяного знака"""
+    transactions: List[TransactionOut]
+    cursor: Optional[str] = Field(
+        ..., description="Водяной знак для следующего запроса (непрозрачная строка); None — изменений ещё не было"
+    )
+    has_more: bool = Field(..., description="Есть следующая страница: запросить сразу с cursor")
@@ -0,0 +1,294 @@
+"""
+Аналитика трат пользователя: агрегации выполняются в PostgreSQL,
+в Python приходят только итоговые строки.
+
+Детализация по категориям читает category_rollups — агрегаты по
+(пользователь, месяц, категория), которые поддерживают триггеры на
+transactions. Запрос за год или всю историю читает не больше
+(месяцев x категорий) строк вместо всех транзакций пользователя; текущий
+месяц до end (и запрос за месяц целиком) считается GROUP BY по
+transactions, поэтому траты с датой в будущем не попадают ни в один
+период. Период "week" не совпадает с границами месяцев и считается
+GROUP BY по transactions за последние 7 дней (индекс по date). Границы
+периодов и месяцы агрегатов — в UTC, как и date транзакций.
+
+Паттерны трат считаются по всем расходам пользователя, но без ORM:
+PostgreSQL отдаёт одну строку с тремя массивами (сумма, локальное время,
+категория) — index-only scan по ix_transactions_user_date, — дальше всё
+считается bincount в NumPy за один проход. Результат кэшируется по
+пользователю; кэш сверяется с "водяным знаком" (AnalyticsService.watermark):
+подпись строк category_rollups по (месяц, категория), последний
+updated_at транзакций (одна строка индекса ix_transactions_user_updated_id)
+и часовой пояс пользователя. Вставка и удаление меняют агрегаты, смена
+категории — агрегаты двух категорий (в том числе SET NULL при удалении
+категории, который updated_at не трогает), любая правка через приложение
+(например, перенос на другой день того же месяца) поднимает updated_at.
+Остальное покрывает TTL.
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import Float, case, cast, func, literal, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.category import Category
+from app.models.category_rollup import CategoryRollup
+from app.models.transaction import Transaction
+from app.models.user import User
+from app.services.executor_service import executor_service
+from app.utils.lru_cache import LRUCache
+
+
+PERIODS = ("week", "month", "year", "all")
+UNCATEGORIZED = "Без категории"
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+PEAK_SIZE = 3
+
+
+class AnalyticsService:
+    """Аналитические запросы поверх транзакций и агрегатов"""
+
+    def __init__(self):
+        self._patterns_cache = LRUCache(
+            maxsize=settings.ANALYTICS_CACHE_MAX_USERS,
+            ttl_seconds=settings.ANALYTICS_CACHE_TTL_SECONDS,
+        )
+
+    def invalidate(self, user_id: UUID):
+        """Сбросить кэш пользователя (после записи транзакций в этом процессе)"""
+        self._patterns_cache.pop(user_id)
+
+    async def watermark(self, db: AsyncSession, user_id: UUID) -> tuple:
+        """
+        (подпись category_rollups, последний updated_at, часовой пояс):
+        меняется при любой записи транзакций пользователя
+        """
+        # md5 по строкам (месяц, категория): счётчики и суммы каждой категории за каждый месяц
+        rollup = func.concat_ws(
+            ":", CategoryRollup.period_start, CategoryRollup.category_id, CategoryRollup.expense_count,
+            CategoryRollup.expense_sum, CategoryRollup.income_count, CategoryRollup.income_sum,
+        )
+        rollups = (
+            select(func.md5(func.string_agg(
+                rollup, aggregate_order_by(literal(","), CategoryRollup.period_start, CategoryRollup.category_id),
+            )))
+            .where(CategoryRollup.user_id == user_id)
+            .scalar_subquery()
+        )
+        last_update = select(func.max(Transaction.updated_at)).where(Transaction.user_id == user_id).scalar_subquery()
+        timezone = select(User.timezone).where(User.id == user_id).scalar_subquery()
+        return tuple((await db.execute(select(rollups, last_update, timezone))).one())
+
+    async def spending_patterns(self, db: AsyncSession, user_id: UUID) -> dict:
+        """
+        Паттерны трат: средние траты за день/неделю/месяц, самые частые и
+        самые дорогие категории, пиковые часы и дни недели (по локальному
+        времени пользователя).
+        """
+        watermark = await self.watermark(db, user_id)
+        cached = self._patterns_cache.get(user_id)
+        if cached is not None and cached[0] == watermark:
+            return cached[1]
+
+        amounts, epochs, category_ids = await self._fetch_expense_columns(db, user_id)
+        patterns = await executor_service.run_ml(self._compute_patterns, amounts, epochs, category_ids)
+
+        names = await self.category_names(db, [patterns.pop("most_frequent_id"), patterns.pop("most_expensive_id")])
+        patterns["most_frequent_category"] = names[0]
+        patterns["most_expensive_category"] = names[1]
+
+        self._patterns_cache.set(user_id, (watermark, patterns))
+        return patterns
+
+    @staticmethod
+    async def _fetch_expense_columns(db: AsyncSession, user_id: UUID) -> tuple:
+        """Расходы пользователя тремя массивами: сумма (> 0), локальное время (секунды), категория (0 — нет)"""
+        # date хранится в UTC; timezone(tz, timezone('UTC', date)) — локальное время пользователя
+        local_time = func.timezone(User.timezone, func.timezone("UTC", Transaction.date))
+        row = (await db.execute(
+            select(
+                func.array_agg(-Transaction.amount),
+                func.array_agg(cast(func.extract("epoch", local_time), Float)),
+                func.array_agg(func.coalesce(Transaction.category_id, 0)),
+            )
+            .select_from(Transaction)
+            .join(User, User.id == Transaction.user_id)
+            .where(Transaction.user_id == user_id, Transaction.amount < 0)
+        )).one()
+        return (
+            np.asarray(row[0] or [], dtype=np.float64),
+            np.asarray(row[1] or [], dtype=np.float64),
+            np.asarray(row[2] or [], dtype=np.int64),
+        )
+
+    @staticmethod
+    def _compute_patterns(amounts: np.ndarray, epochs: np.ndarray, category_ids: np.ndarray) -> dict:
+        """Все показатели за один проход bincount по массивам"""
+        if amounts.size == 0:
+            return {
+                "average_daily": 0.0, "average_weekly": 0.0, "average_monthly": 0.0,
+                "most_frequent_id": None, "most_expensive_id": None,
+                "peak_spending_hours": [], "peak_spending_days": [],
+            }
+
+        days = np.floor_divide(epochs, 86400).astype(np.int64)
+        # Средние — по периоду активности: от первого до последнего дня с расходами
+        average_daily = float(amounts.sum()) / int(days.max() - days.min() + 1)
+
+        codes, inverse = np.unique(category_ids, return_inverse=True)
+        category_counts = np.bincount(inverse)
+        category_sums = np.bincount(inverse, weights=amounts)
+
+        hours = np.floor_divide(epochs, 3600).astype(np.int64) % 24
+        weekdays = (days + 3) % 7  # 1970-01-01 — четверг; 0 — понедельник
+
+        return {
+            "average_daily": round(average_daily, 2),
+            "average_weekly": round(average_daily * 7, 2),
+            "average_monthly": round(average_daily * 365.25 / 12, 2),
+            "most_frequent_id": int(codes[category_counts.argmax()]),
+            "most_expensive_id": int(codes[category_sums.argmax()]),
+            "peak_spending_hours": _peaks(np.bincount(hours, minlength=24)),
+            "peak_spending_days": [WEEKDAYS[day] for day in _peaks(np.bincount(weekdays, minlength=7))],
+        }
+
+    @staticmethod
+    async def category_names(db: AsyncSession, category_ids: List[Optional[int]]) -> List[Optional[str]]:
+        ids = {category_id for category_id in category_ids if category_id}
+        names = {}
+        if ids:
+            names = dict((await db.execute(select(Category.id, Category.name).where(Category.id.in_(ids)))).all())
+        return [
+            None if category_id is None else names.get(category_id, UNCATEGORIZED)
+            for category_id in category_ids
+        ]
+
+    @staticmethod
+    def period_bounds(period: str, now: Optional[datetime] = None) -> Tuple[Optional[datetime], datetime]:
+        """
+        Границы периода [start, end). start = None — вся история.
+
+        Raises:
+            ValueError: неизвестный период
+        """
+        now = now or datetime.utcnow()
+        end = now
+        if period == "week":
+            return now - timedelta(days=7), end
+        if period == "month":
+            return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0), end
+        if period == "year":
+            return now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0), end
+        if period == "all":
+            return None, end
+        raise ValueError(f"Unknown period '{period}', expected one of: {', '.join(PERIODS)}")
+
+    async def category_breakdown(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        period: str = "month",
+        now: Optional[datetime] = None,
+    ) -> dict:
+        """
+        Расходы и доходы по категориям за период.
+
+        Returns:
+            dict: categories {название: {amount, count, percentage}} (только расходы),
+            total_expenses, total_income, net
+        """
+        start, end = self.period_bounds(period, now)
+        if period == "week":
+            rows = await self._breakdown_from_transactions(db, user_id, start, end)
+        else:
+            rows = await self._breakdown_from_rollups(db, user_id, start, end)
+
+        categories = {}
+        total_expenses = 0.0
+        total_income = 0.0
+        for name, expense_sum, expense_count, income_sum, _income_count in rows:
+            total_expenses += float(expense_sum)
+            total_income += float(income_sum)
+            if expense_count:
+                # Одинаковые названия (своя и стандартная категория) складываются
+                entry = categories.setdefault(name or UNCATEGORIZED, {"amount": 0.0, "count": 0})
+                entry["amount"] += float(expense_sum)
+                entry["count"] += int(expense_count)
+
+        for entry in categories.values():
+            entry["amount"] = round(entry["amount"], 2)
+            entry["percentage"] = round(entry["amount"] / total_expenses * 100, 1) if total_expenses else 0.0
+
+        return {
+            "categories": dict(sorted(categories.items(), key=lambda item: -item[1]["amount"])),
+            "total_expenses": round(total_expenses, 2),
+            "total_income": round(total_income, 2),
+            "net": round(total_income - total_expenses, 2),
+        }
+
+    async def _breakdown_from_rollups(self, db: AsyncSession, user_id: UUID, start: Optional[datetime], end: datetime):
+        """
+        Суммы по категориям за [start, end): полные месяцы до месяца end — из
+        помесячных агрегатов, остаток месяца end до end — из transactions
+        """
+        end_month = end.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        tail_start = end_month if start is None else max(start, end_month)
+        rows = list(await self._breakdown_from_transactions(db, user_id, tail_start, end))
+        if start is not None and start >= end_month:
+            return rows
+
+        query = (
+            select(
+                Category.name,
+                func.sum(CategoryRollup.expense_sum),
+                func.sum(CategoryRollup.expense_count),
+                func.sum(CategoryRollup.income_sum),
+                func.sum(CategoryRollup.income_count),
+            )
+            .select_from(CategoryRollup)
+            .outerjoin(Category, Category.id == CategoryRollup.category_id)
+            .where(CategoryRollup.user_id == user_id)
+            .group_by(CategoryRollup.category_id, Category.name)
+            # Строки, обнулённые удалениями, не показываем
+            .having(func.sum(CategoryRollup.expense_count + CategoryRollup.income_count) > 0)
+        )
+        query = query.where(CategoryRollup.period_start < end_month.date())
+        if start is not None:
+            query = query.where(CategoryRollup.period_start >= start.date())
+        return rows + list((await db.execute(query)).all())
+
+    async def _breakdown_from_transactions(self, db: AsyncSession, user_id: UUID, start: datetime, end: datetime):
+        """GROUP BY category_id по транзакциям за короткий период"""
+        return (await db.execute(self._transactions_breakdown_query(user_id, start, end))).all()
+
+    @staticmethod
+    def _transactions_breakdown_query(user_id: UUID, start: datetime, end: datetime):
+        """Index-only scan по ix_transactions_user_date (проверка: scripts/check_query_plans.py)"""
+        is_expense = Transaction.amount < 0
+        return (
+            select(
+                Category.name,
+                func.coalesce(func.sum(case((is_expense, -Transaction.amount), else_=0)), 0),
+                func.count().filter(is_expense),
+                func.coalesce(func.sum(case((is_expense, 0), else_=Transaction.amount)), 0),
+                func.count().filter(~is_expense),
+            )
+            .select_from(Transaction)
+            .outerjoin(Category, Category.id == Transaction.category_id)
+            .where(Transaction.user_id == user_id, Transaction.date >= start, Transaction.date < end)
+            .group_by(Transaction.category_id, Category.name)
+        )
+
+
+def _peaks(counts: np.ndarray) -> List[int]:
+    """Индексы PEAK_SIZE самых больших ненулевых значений, по возрастанию индекса"""
+    top = np.argsort(-counts, kind="stable")[:PEAK_SIZE]
+    return sorted(int(index) for index in top if counts[index] > 0)
+
+
+# Singleton instance
+analytics_service = AnalyticsService()
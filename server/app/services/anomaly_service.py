@@ -0,0 +1,360 @@
+"""
+Определение аномальных трат по потоковой статистике пользователя.
+
+Для каждой пары (пользователь, категория) и для всех расходов
+пользователя (ALL_CATEGORIES) в user_category_stats хранится:
+- Welford: count, mean, m2 — долгосрочные среднее и дисперсия
+- EWMA: ewma, ewm_var — "обычная" сумма последнего времени, привыкает к
+  сдвигу уровня трат (переезд, новая подписка)
+- P²: пять маркеров оценки 95-го процентиля без хранения самих сумм
+
+Новая транзакция обновляет статистику за O(1) — без переобучения модели —
+и ровно один раз: учтённые строки помечены transactions.anomaly_observed.
+Оценка идёт по статистике до учёта самой транзакции: аномалия — сумма
+выше 95-го процентиля и больше чем на Z_THRESHOLD стандартных отклонений
+выше и долгосрочного, и недавнего уровня. Если по категории меньше
+MIN_HISTORY трат, сравнение идёт со всеми расходами пользователя.
+
+Isolation Forest остаётся периодическим пакетным пересчётом
+(scripts/rescore_anomalies.py), он же перестраивает статистику по истории.
+"""
+import math
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.transaction import Transaction
+from app.models.user_category_stats import ALL_CATEGORIES, UserCategoryStats
+
+
+QUANTILE = 0.95
+EWMA_ALPHA = 0.1
+MIN_HISTORY = 5
+Z_THRESHOLD = 3.0
+# Нижняя граница стандартного отклонения: при одинаковых суммах любая другая не должна давать z = inf
+MIN_STD_SHARE = 0.1
+
+# Приращения желаемых позиций маркеров P² на одно наблюдение
+P2_INCREMENTS = (0.0, QUANTILE / 2, QUANTILE, (1 + QUANTILE) / 2, 1.0)
+
+
+@dataclass
+class RunningStats:
+    """Статистика одной строки user_category_stats; update — O(1)"""
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    ewma: float = 0.0
+    ewm_var: float = 0.0
+    p2_heights: List[float] = field(default_factory=list)
+    p2_positions: List[float] = field(default_factory=list)
+
+    @classmethod
+    def from_values(cls, values: np.ndarray) -> "RunningStats":
+        """Статистика по истории (суммы по возрастанию даты): то же состояние, что даёт update по одной"""
+        stats = cls()
+        if not len(values):
+            return stats
+        values = np.asarray(values, dtype=np.float64)
+        stats.count = len(values)
+        stats.mean = float(values.mean())
+        stats.m2 = float(((values - stats.mean) ** 2).sum())
+        # EWMA — рекурсия по порядку, но без P²: маркеры берутся из точных квантилей истории
+        stats.ewma = float(values[0])
+        for value in values[1:]:
+            stats._update_ewma(float(value))
+        ordered = np.sort(values)
+        if stats.count < 5:
+            stats.p2_heights = [float(value) for value in ordered]
+            return stats
+        # Маркеры — точные порядковые статистики на ближайших к желаемым позициях (строго возрастающих)
+        positions = [int(round(1 + (stats.count - 1) * increment)) for increment in P2_INCREMENTS]
+        for i in (1, 2, 3):
+            positions[i] = max(positions[i], positions[i - 1] + 1)
+        for i in (3, 2, 1):
+            positions[i] = min(positions[i], positions[i + 1] - 1)
+        stats.p2_positions = [float(position) for position in positions]
+        stats.p2_heights = [float(ordered[position - 1]) for position in positions]
+        return stats
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    @property
+    def quantile(self) -> float:
+        """Оценка QUANTILE: P² после пяти наблюдений, до этого — по самим суммам"""
+        if not self.p2_heights:
+            return 0.0
+        if self.count < 5:
+            return self.p2_heights[min(len(self.p2_heights) - 1, int(QUANTILE * len(self.p2_heights)))]
+        return self.p2_heights[2]
+
+    def update(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        if self.count == 1:
+            self.ewma, self.ewm_var = value, 0.0
+        else:
+            self._update_ewma(value)
+        self._update_p2(value)
+
+    def _update_ewma(self, value: float):
+        delta = value - self.ewma
+        increment = EWMA_ALPHA * delta
+        self.ewma += increment
+        self.ewm_var = (1 - EWMA_ALPHA) * (self.ewm_var + delta * increment)
+
+    def _update_p2(self, value: float):
+        heights, positions = self.p2_heights, self.p2_positions
+        if self.count <= 5:
+            heights.append(value)
+            heights.sort()
+            if self.count == 5:
+                positions[:] = [1.0, 2.0, 3.0, 4.0, 5.0]
+            return
+
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = max(i for i in range(4) if heights[i] <= value)
+        for i in range(cell + 1, 5):
+            positions[i] += 1
+
+        for i in (1, 2, 3):
+            desired = 1 + (self.count - 1) * P2_INCREMENTS[i]
+            shift = desired - positions[i]
+            if (shift >= 1 and positions[i + 1] - positions[i] > 1) or (shift <= -1 and positions[i - 1] - positions[i] < -1):
+                step = 1 if shift > 0 else -1
+                height = _p2_parabolic(heights, positions, i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + step * (heights[i + step] - heights[i]) / (positions[i + step] - positions[i])
+                heights[i] = height
+                positions[i] += step
+
+    def z_scores(self, value: float) -> Tuple[float, float]:
+        """Отклонение от долгосрочного и от недавнего уровня, в стандартных отклонениях"""
+        floor = max(MIN_STD_SHARE * abs(self.mean), 1e-9)
+        return (
+            (value - self.mean) / max(self.std, floor),
+            (value - self.ewma) / max(math.sqrt(max(self.ewm_var, 0.0)), floor),
+        )
+
+    def as_row(self) -> dict:
+        return {
+            "count": self.count, "mean": self.mean, "m2": self.m2,
+            "ewma": self.ewma, "ewm_var": self.ewm_var,
+            "p2_heights": self.p2_heights, "p2_positions": self.p2_positions,
+        }
+
+
+def _p2_parabolic(heights: List[float], positions: List[float], i: int, step: int) -> float:
+    n_prev, n, n_next = positions[i - 1], positions[i], positions[i + 1]
+    return heights[i] + step / (n_next - n_prev) * (
+        (n - n_prev + step) * (heights[i + 1] - heights[i]) / (n_next - n)
+        + (n_next - n - step) * (heights[i] - heights[i - 1]) / (n - n_prev)
+    )
+
+
+def score(amount: float, category_stats: Optional[RunningStats], user_stats: Optional[RunningStats]) -> dict:
+    """
+    Оценка расхода amount (> 0) по статистике до его учёта.
+    Возвращает поля AnomalyDetectionResponse.
+    """
+    scope, stats = "category", category_stats
+    if stats is None or stats.count < MIN_HISTORY:
+        scope, stats = "user", user_stats
+    if stats is None or stats.count < MIN_HISTORY:
+        return {"is_anomaly": False, "severity": "low", "explanation": "Недостаточно истории для оценки"}
+
+    z_long, z_recent = stats.z_scores(amount)
+    z = min(z_long, z_recent)
+    quantile = stats.quantile
+    if z < Z_THRESHOLD or amount <= quantile:
+        return {"is_anomaly": False, "severity": "low", "explanation": "Транзакция в пределах нормы"}
+
+    where = "в этой категории" if scope == "category" else "у вас"
+    return {
+        "is_anomaly": True,
+        "anomaly_type": "unusual_amount" if scope == "category" else "unusual_amount_overall",
+        "severity": "high" if z >= 2 * Z_THRESHOLD else "medium" if z >= 1.5 * Z_THRESHOLD else "low",
+        "explanation": (
+            f"Сумма {amount:.2f} в {amount / max(stats.ewma, 0.01):.1f} раза больше обычной {where} "
+            f"({stats.ewma:.2f}) и выше 95% трат ({quantile:.2f})"
+        ),
+        "suggestion": "Проверьте, что операция ваша и сумма указана верно",
+    }
+
+
+class AnomalyService:
+    """Оценка транзакций и обновление потоковой статистики в user_category_stats"""
+
+    async def detect(self, db: AsyncSession, user_id: UUID, transaction: dict) -> dict:
+        """
+        Оценить транзакцию. С id — сохранённая транзакция пользователя:
+        сумма и категория берутся из БД, при первой оценке статистика
+        обновляется и ставится is_anomaly. Без id — только оценка по amount
+        и category_id.
+
+        Raises:
+            ValueError: нет суммы или транзакция не найдена
+        """
+        transaction_id = transaction.get("id")
+        if transaction_id is not None:
+            row = (await db.execute(
+                select(Transaction.amount, Transaction.category_id)
+                .where(Transaction.id == int(transaction_id), Transaction.user_id == user_id)
+            )).first()
+            if row is None:
+                raise ValueError(f"Transaction {transaction_id} not found")
+            amount, category_id = row
+        else:
+            if transaction.get("amount") is None:
+                raise ValueError("Transaction amount is required")
+            amount, category_id = float(transaction["amount"]), transaction.get("category_id")
+
+        if amount >= 0:
+            return {"is_anomaly": False, "severity": "low", "explanation": "Доходы не проверяются"}
+
+        if transaction_id is None:
+            stats = await self._load(db, user_id, [category_id or 0], lock=False)
+            return score(-amount, stats.get(category_id or 0), stats.get(ALL_CATEGORIES))
+
+        result = (await self.observe_many(db, user_id, [(int(transaction_id), category_id, amount)]))[0]
+        return result
+
+    async def observe_many(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        transactions: List[Tuple[int, Optional[int], float]],
+    ) -> List[dict]:
+        """
+        Оценить и учесть новые транзакции пользователя (id, category_id,
+        amount) по порядку: каждая оценивается по статистике до неё. Строки
+        статистики блокируются до конца транзакции БД; is_anomaly
+        проставляется одним UPDATE. Доходы не оцениваются и не учитываются.
+
+        Учитываются только строки, ещё не учтённые в статистике
+        (Transaction.anomaly_observed): повторная оценка той же транзакции
+        только оценивает её и не сдвигает статистику.
+        """
+        expense_ids = [tx_id for tx_id, _, amount in transactions if amount < 0]
+        claimed = set()
+        if expense_ids:
+            # Отметка и проверка одним UPDATE: конкурентный повтор ждёт блокировку строки и её уже не получит.
+            # updated_at не трогаем — флаг не уходит клиентам при синхронизации
+            claimed = set((await db.execute(
+                update(Transaction)
+                .where(
+                    Transaction.id.in_(expense_ids), Transaction.user_id == user_id,
+                    Transaction.anomaly_observed.is_(False),
+                )
+                .values(anomaly_observed=True, updated_at=Transaction.updated_at)
+                .returning(Transaction.id)
+            )).scalars().all())
+        category_ids = sorted({category_id or 0 for _, category_id, amount in transactions if amount < 0})
+        if claimed:
+            await self._ensure_rows(db, user_id, category_ids)
+        stats = await self._load(db, user_id, category_ids, lock=bool(claimed))
+
+        results, scored = [], {}
+        for tx_id, category_id, amount in transactions:
+            if amount >= 0:
+                results.append({"is_anomaly": False, "severity": "low", "explanation": "Доходы не проверяются"})
+                continue
+            category_id = category_id or 0
+            result = score(-amount, stats.get(category_id), stats.get(ALL_CATEGORIES))
+            results.append(result)
+            if tx_id not in claimed:
+                continue
+            # Один id дважды в одном вызове учитывается один раз
+            claimed.discard(tx_id)
+            for key in (category_id, ALL_CATEGORIES):
+                stats.setdefault(key, RunningStats()).update(-amount)
+            scored[tx_id] = result["is_anomaly"]
+
+        if scored:
+            await self._save(db, user_id, stats)
+        flagged = [tx_id for tx_id, is_anomaly in scored.items() if is_anomaly]
+        if flagged:
+            # Только изменившиеся строки: updated_at и version — чтобы флаг приехал клиентам при синхронизации
+            await db.execute(
+                update(Transaction)
+                .where(Transaction.id.in_(flagged), Transaction.user_id == user_id, Transaction.is_anomaly.is_(False))
+                .values(is_anomaly=True, updated_at=datetime.utcnow(), version=Transaction.version + 1)
+            )
+        return results
+
+    @staticmethod
+    async def _ensure_rows(db: AsyncSession, user_id: UUID, category_ids: List[int]):
+        """
+        Пустые строки статистики для ещё не встречавшихся ключей, в порядке ключа:
+        FOR UPDATE в _load блокирует только существующие строки, и два первых
+        наблюдения одной категории иначе начали бы с пустой статистики и
+        перезаписали бы друг друга. Конкурентная вставка того же ключа ждёт
+        коммита первой и ничего не делает
+        """
+        empty = RunningStats().as_row()
+        now = datetime.utcnow()
+        await db.execute(
+            insert(UserCategoryStats).on_conflict_do_nothing(
+                index_elements=[UserCategoryStats.user_id, UserCategoryStats.category_id],
+            ),
+            [
+                {"user_id": user_id, "category_id": category_id, **empty, "updated_at": now}
+                for category_id in sorted({ALL_CATEGORIES, *category_ids})
+            ],
+        )
+
+    @staticmethod
+    async def _load(db: AsyncSession, user_id: UUID, category_ids: List[int], lock: bool) -> Dict[int, RunningStats]:
+        """Строки статистики категорий и ALL_CATEGORIES; lock — SELECT ... FOR UPDATE в порядке ключа"""
+        keys = [(user_id, category_id) for category_id in [ALL_CATEGORIES, *category_ids]]
+        query = (
+            select(UserCategoryStats)
+            .where(tuple_(UserCategoryStats.user_id, UserCategoryStats.category_id).in_(keys))
+            .order_by(UserCategoryStats.category_id)
+        )
+        if lock:
+            query = query.with_for_update()
+        rows = (await db.execute(query)).scalars().all()
+        return {
+            row.category_id: RunningStats(
+                count=row.count, mean=row.mean, m2=row.m2, ewma=row.ewma, ewm_var=row.ewm_var,
+                p2_heights=list(row.p2_heights), p2_positions=list(row.p2_positions),
+            )
+            for row in rows
+        }
+
+    @staticmethod
+    async def _save(db: AsyncSession, user_id: UUID, stats: Dict[int, RunningStats]):
+        now = datetime.utcnow()
+        statement = insert(UserCategoryStats)
+        await db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[UserCategoryStats.user_id, UserCategoryStats.category_id],
+                set_={column: statement.excluded[column] for column in (*RunningStats().as_row(), "updated_at")},
+            ),
+            [
+                {"user_id": user_id, "category_id": category_id, **running.as_row(), "updated_at": now}
+                for category_id, running in sorted(stats.items())
+            ],
+        )
+
+
+# Singleton instance
+anomaly_service = AnomalyService()
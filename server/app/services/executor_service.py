@@ -0,0 +1,98 @@
+"""
+Слой исполнения CPU-bound задач вне asyncio event loop.
+
+- Пул потоков для sklearn/numpy (они отпускают GIL в тяжёлых участках)
+- OCR/OpenCV выполняется в отдельном пуле процессов (app.services.ocr_worker_pool)
+
+Backpressure: у каждого пула ограничено число задач "в полёте"
+(выполняющихся + ожидающих). Когда лимит исчерпан, задача не ставится
+в очередь, а сразу отклоняется с ExecutorOverloadedError — API отвечает
+503 с заголовком Retry-After вместо бесконечного роста задержки.
+"""
+import asyncio
+import functools
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from loguru import logger
+
+from app.config import settings
+
+
+class ExecutorOverloadedError(Exception):
+    """Очередь пула заполнена — запрос нужно повторить позже"""
+
+    def __init__(self, pool_name: str, retry_after: int):
+        super().__init__(f"{pool_name} executor queue is full")
+        self.pool_name = pool_name
+        self.retry_after = retry_after
+
+
+class _BoundedPool:
+    """Пул исполнителя с ограничением на число задач в полёте"""
+
+    def __init__(self, name: str, factory: Callable[[], Executor], max_in_flight: int):
+        self.name = name
+        self._factory = factory
+        self._executor: Optional[Executor] = None
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = self._factory()
+        return self._executor
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        # Счётчик меняется только из event loop, поэтому блокировка не нужна
+        if self.in_flight >= self.max_in_flight:
+            raise ExecutorOverloadedError(self.name, settings.EXECUTOR_RETRY_AFTER_SECONDS)
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {"in_flight": self.in_flight, "max_in_flight": self.max_in_flight}
+
+
+class ExecutorService:
+    """Пулы для CPU-bound задач"""
+
+    def __init__(self):
+        self.ml_pool = _BoundedPool(
+            "ml",
+            lambda: ThreadPoolExecutor(
+                max_workers=settings.ML_EXECUTOR_THREADS,
+                thread_name_prefix="ml-worker",
+            ),
+            max_in_flight=settings.ML_EXECUTOR_THREADS + settings.ML_EXECUTOR_MAX_QUEUE,
+        )
+
+    def start(self):
+        """Создать пулы заранее, чтобы первый запрос не платил за их запуск"""
+        _ = self.ml_pool.executor
+        logger.info(f"Executors started: ml threads={settings.ML_EXECUTOR_THREADS}")
+
+    def shutdown(self):
+        self.ml_pool.shutdown()
+
+    async def run_ml(self, func: Callable, *args, **kwargs) -> Any:
+        """Выполнить функцию в пуле потоков для ML"""
+        return await self.ml_pool.run(func, *args, **kwargs)
+
+    def stats(self) -> dict:
+        return {"ml": self.ml_pool.stats()}
+
+
+# Singleton instance
+executor_service = ExecutorService()
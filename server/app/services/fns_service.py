@@ -0,0 +1,230 @@
+"""
+Получение данных чека по QR коду через API проверки чеков ФНС
+(proverkacheka.com, FNS_API_URL).
+
+- Один httpx.AsyncClient на процесс: пул keep-alive соединений, без
+  TCP/TLS рукопожатия на каждый чек; таймауты и повторы с экспоненциальной
+  задержкой при сетевых ошибках, 5xx/429 и ответах "повторите позже"
+- Одновременные запросы одного и того же чека (двойное сканирование,
+  ретрай клиента) объединяются в один запрос к API
+- Фискальный чек не меняется, поэтому результат кэшируется по
+  (fn, i, fp) без TTL — ограничен только размер LRU
+"""
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional
+from urllib.parse import parse_qs
+
+import httpx
+from loguru import logger
+
+from app.config import settings
+from app.utils.lru_cache import LRUCache
+
+
+# Коды ответа proverkacheka.com
+_CODE_OK = 1
+_CODE_INCORRECT = 0
+_CODE_NOT_READY = 2
+_CODES_RETRY = (3, 4)  # лимит запросов / подождите перед повтором
+
+
+class FNSServiceError(Exception):
+    """Ошибка получения чека; status_code — код ответа нашего API"""
+
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class _RetryableError(Exception):
+    """Временная ошибка: запрос к API стоит повторить"""
+
+
+@dataclass(frozen=True)
+class QRParams:
+    """Параметры из QR кода чека: t=20240115T1430&s=1250.00&fn=...&i=...&fp=...&n=1"""
+    t: str
+    s: str
+    fn: str
+    i: str
+    fp: str
+    n: str = "1"
+
+    @property
+    def key(self) -> tuple:
+        """Идентификатор фискального документа: номер ФН, номер документа, фискальный признак"""
+        return self.fn, self.i, self.fp
+
+
+class FNSService:
+    """Клиент API проверки чеков с объединением запросов и кэшем"""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._cache = LRUCache(maxsize=settings.FNS_CACHE_MAX_ITEMS)
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+        self.upstream_requests = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    @staticmethod
+    def parse_qr(qr_raw: str) -> QRParams:
+        """
+        Разобрать строку QR кода чека.
+
+        Raises:
+            ValueError: нет обязательных параметров
+        """
+        params = {key: values[0].strip() for key, values in parse_qs(qr_raw.strip()).items() if values}
+        missing = [key for key in ("t", "s", "fn", "i", "fp") if not params.get(key)]
+        if missing:
+            raise ValueError(f"QR code is missing parameters: {', '.join(missing)}")
+        return QRParams(
+            t=params["t"], s=params["s"], fn=params["fn"],
+            i=params["i"], fp=params["fp"], n=params.get("n", "1"),
+        )
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=settings.FNS_API_URL,
+                timeout=httpx.Timeout(settings.FNS_TIMEOUT_SECONDS, connect=settings.FNS_CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(
+                    max_connections=settings.FNS_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.FNS_MAX_CONNECTIONS,
+                ),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_receipt(self, params: QRParams) -> dict:
+        """
+        Данные чека: retailer_name, retailer_inn, total, scan_date,
+        items [{name, price, quantity, sum}] (суммы в рублях).
+
+        Raises:
+            FNSServiceError: чек не найден или API недоступно
+        """
+        key = params.key
+        receipt = self._cache.get(key)
+        if receipt is not None:
+            return receipt
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(params))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+
+        # shield: отмена одного из ожидающих запросов не отменяет общий запрос к API
+        return await asyncio.shield(task)
+
+    def _forget(self, key: tuple, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        # Ошибку получают ожидающие запросы; если все они отменены — не шумим в лог
+        if not task.cancelled():
+            task.exception()
+
+    async def _fetch(self, params: QRParams) -> dict:
+        if not settings.FNS_API_KEY:
+            raise FNSServiceError("FNS API key is not configured", status_code=503)
+
+        form = {
+            "token": settings.FNS_API_KEY,
+            "fn": params.fn, "fd": params.i, "fp": params.fp,
+            "t": params.t, "n": params.n, "s": params.s, "qr": "0",
+        }
+
+        for attempt in range(settings.FNS_RETRIES + 1):
+            try:
+                payload = await self._request(form)
+                break
+            except _RetryableError as e:
+                if attempt == settings.FNS_RETRIES:
+                    self.failures += 1
+                    logger.error(f"FNS API unavailable for receipt fn={params.fn} i={params.i}: {e}")
+                    raise FNSServiceError("FNS API is unavailable, please retry later", status_code=503)
+                delay = settings.FNS_RETRY_BACKOFF_SECONDS * 2 ** attempt
+                logger.warning(f"FNS API request failed ({e}), retry {attempt + 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+        receipt = self._normalize(payload)
+        self._cache.set(params.key, receipt)
+        return receipt
+
+    async def _request(self, form: dict) -> dict:
+        """Один запрос к API; временные ошибки — _RetryableError"""
+        self.upstream_requests += 1
+        try:
+            response = await self._get_client().post("/check/get", data=form)
+        except httpx.TransportError as e:
+            raise _RetryableError(f"{type(e).__name__}: {e}")
+
+        if response.status_code == 429 or response.status_code >= 500:
+            raise _RetryableError(f"HTTP {response.status_code}")
+        if response.status_code != 200:
+            raise FNSServiceError(f"FNS API returned HTTP {response.status_code}")
+
+        try:
+            payload = response.json()
+        except ValueError:
+            raise FNSServiceError("FNS API returned invalid JSON")
+
+        code = payload.get("code")
+        if code == _CODE_OK:
+            return payload
+        if code in _CODES_RETRY:
+            raise _RetryableError(f"API code {code}")
+        if code == _CODE_INCORRECT:
+            raise FNSServiceError("Receipt not found", status_code=404)
+        if code == _CODE_NOT_READY:
+            # Чек ещё не передан оператором фискальных данных — не кэшируем
+            raise FNSServiceError("Receipt data is not available yet, please retry later", status_code=404)
+        raise FNSServiceError(f"FNS API error: {payload.get('data')}")
+
+    @staticmethod
+    def _normalize(payload: dict) -> dict:
+        """Ответ API → данные чека (копейки → рубли)"""
+        try:
+            document = payload["data"]["json"]
+            scan_date = document["dateTime"]
+            if isinstance(scan_date, (int, float)):
+                scan_date = datetime.utcfromtimestamp(scan_date).isoformat()
+            return {
+                "retailer_name": (document.get("user") or document.get("retailPlace") or "").strip(),
+                "retailer_inn": str(document.get("userInn") or "").strip(),
+                "total": document["totalSum"] / 100,
+                "scan_date": scan_date,
+                "items": [
+                    {
+                        "name": str(item["name"]).strip(),
+                        "price": item["price"] / 100,
+                        "quantity": item.get("quantity", 1),
+                        "sum": item["sum"] / 100,
+                    }
+                    for item in document.get("items", [])
+                ],
+            }
+        except (KeyError, TypeError) as e:
+            raise FNSServiceError(f"Unexpected FNS API response: missing {e}")
+
+    def stats(self) -> dict:
+        return {
+            "upstream_requests": self.upstream_requests,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+            "failures": self.failures,
+            "cache": self._cache.stats(),
+        }
+
+
+# Singleton instance
+fns_service = FNSService()
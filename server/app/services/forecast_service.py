@@ -0,0 +1,581 @@
+"""
+Прогноз расходов пользователя по категориям.
+
+Основной движок — демпфированное экспоненциальное сглаживание Холта на
+недельных суммах, векторизованное в NumPy: одна рекурсия по неделям
+считает сразу все категории пользователя и сетку alpha (ALPHAS), для
+каждой категории берётся alpha с наименьшей ошибкой прогноза на шаг.
+Недельные суммы приходят одним GROUP BY date_bin (index-only scan по
+ix_transactions_user_date), 24 месяца истории — около 105 шагов.
+
+Состояние модели (уровень, тренд, ошибки) кэшируется по пользователю:
+- подпись расходов не изменилась (ForecastService.fingerprint: число и
+  сумма расходов по каждой категории из category_rollups и последний
+  updated_at транзакций) — прогноз из кэша
+- изменилась только текущая, незавершённая неделя — модель не меняется
+- завершились новые недели — рекурсия продолжается с сохранённого
+  состояния только по новым неделям
+- изменилась уже учтённая история (ForecastService.checksums: строки
+  category_rollups по месяцам и категориям, суммы по категориям за начало
+  текущего месяца, правки старых строк после конца окна) или окно
+  устарело — полное переобучение
+
+Ночной предрасчёт (scripts/precompute_forecasts.py) пишет прогнозы в
+таблицу forecasts; они отдаются, пока совпадают движок, окно
+(fitted_until) и подпись истории, иначе прогноз считается на месте.
+
+Prophet (FORECAST_ENGINE=prophet) — медленный офлайн режим: модель на
+каждую категорию, без кэша состояния.
+"""
+import hashlib
+import math
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+from loguru import logger
+from sqlalchemy import Integer, Numeric, cast, func, literal, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.category_rollup import CategoryRollup
+from app.models.forecast import Forecast
+from app.models.transaction import Transaction
+from app.services.analytics_service import analytics_service
+from app.services.executor_service import executor_service
+from app.utils.lru_cache import LRUCache
+
+
+HORIZON_DAYS = {"week": 7, "month": 30, "quarter": 91}
+PERIODS = list(HORIZON_DAYS)
+ENGINES = ("smoothing", "prophet")
+
+ALPHAS = np.array([0.05, 0.1, 0.2, 0.3, 0.5])[:, None]  # (A, 1): сетка подбирается по категориям
+BETA = 0.1
+PHI = 0.9  # Демпфирование тренда: прогноз на квартал не улетает по прямой
+INIT_WEEKS = 4  # Начальный уровень — среднее первых недель
+RECENT_WEEKS = 13  # Последние фактические недели — для тренда и уверенности
+Z_95 = 1.96
+TREND_THRESHOLD = 0.05
+# Окно растёт при дообучении; полное переобучение, когда оно длиннее нужного на столько недель
+MAX_EXTRA_WEEKS = 8
+
+
+@dataclass
+class _SmoothingState:
+    """Состояние рекурсии после последней завершённой недели"""
+    start: datetime  # Понедельник первой недели окна
+    fitted_until: datetime  # Понедельник после последней учтённой недели
+    category_ids: np.ndarray  # (C,)
+    level: np.ndarray  # (A, C)
+    trend: np.ndarray  # (A, C)
+    sse: np.ndarray  # (A, C) сумма квадратов ошибок прогноза на шаг
+    steps: int  # Шагов с учтённой ошибкой
+    recent: np.ndarray  # (C, RECENT_WEEKS) последние фактические недельные суммы
+    checksum: str  # Подпись расходов до fitted_until (ForecastService.checksums)
+    fingerprint: tuple = ()  # Подпись всех расходов при обучении (ForecastService.fingerprint)
+    forecasts: Dict[str, dict] = field(default_factory=dict)  # Готовые ответы по периоду
+
+
+class ForecastService:
+    """Прогноз расходов с кэшем обученного состояния по пользователю"""
+
+    def __init__(self):
+        self._states = LRUCache(maxsize=settings.FORECAST_CACHE_MAX_USERS)
+        self.full_fits = 0
+        self.incremental_fits = 0
+        self.cache_hits = 0
+        self.stored_hits = 0
+
+    async def forecast(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        period: str = "month",
+        history_months: int = 6,
+        engine: Optional[str] = None,
+        now: Optional[datetime] = None,
+    ) -> dict:
+        """
+        Прогноз расходов на следующий период: из кэша состояния, из
+        таблицы forecasts (ночной предрасчёт), иначе — обучение на месте.
+
+        Returns:
+            dict: forecast {total, by_category {название: {amount, confidence}}, engine},
+            trend (increasing | stable | decreasing), confidence_interval [нижняя, верхняя]
+
+        Raises:
+            ValueError: неизвестный период или движок
+        """
+        if period not in HORIZON_DAYS:
+            raise ValueError(f"Unknown period '{period}', expected one of: {', '.join(HORIZON_DAYS)}")
+        engine = engine or settings.FORECAST_ENGINE
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown forecast engine '{engine}', expected one of: {', '.join(ENGINES)}")
+
+        start, cutoff = training_window(now or datetime.utcnow(), history_months)
+
+        if engine == "prophet" and not prophet_available():
+            logger.warning("Forecast: prophet is not installed, falling back to smoothing")
+            engine = "smoothing"
+        if engine == "prophet":
+            checksum = (await self.checksums(db, [user_id], cutoff))[user_id]
+            stored = await self._stored(db, user_id, history_months, period, engine, cutoff, checksum)
+            if stored is not None:
+                self.stored_hits += 1
+                return stored
+            weekly, category_ids = await self._fetch_weekly(db, user_id, start, cutoff)
+            result = await executor_service.run_ml(_prophet_forecast, weekly, category_ids, start, HORIZON_DAYS[period])
+            return await self._with_names(db, result, "prophet")
+
+        key = (user_id, history_months)
+        fingerprint = await self.fingerprint(db, user_id)
+        state: Optional[_SmoothingState] = self._states.get(key)
+
+        if state is not None and state.fingerprint == fingerprint and state.fitted_until == cutoff:
+            self.cache_hits += 1
+        else:
+            checksum = (await self.checksums(db, [user_id], cutoff))[user_id]
+            stored = await self._stored(db, user_id, history_months, period, engine, cutoff, checksum)
+            if stored is not None:
+                self.stored_hits += 1
+                return stored
+
+            state = await self._refresh(db, user_id, state, start, cutoff, checksum)
+            state.fingerprint = fingerprint
+            self._states.set(key, state)
+
+        if period not in state.forecasts:
+            result = _smoothing_forecast(state, HORIZON_DAYS[period])
+            state.forecasts[period] = await self._with_names(db, result, "smoothing")
+        return state.forecasts[period]
+
+    def invalidate(self, user_id: UUID):
+        """Сбросить состояние пользователя для всех длин истории"""
+        for months in range(1, 25):
+            self._states.pop((user_id, months))
+
+    async def _refresh(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        state: Optional[_SmoothingState],
+        start: datetime,
+        cutoff: datetime,
+        checksum: str,
+    ) -> _SmoothingState:
+        """Проверить кэшированное состояние и дообучить его, либо обучить заново"""
+        if state is not None and (cutoff - state.start).days // 7 <= (cutoff - start).days // 7 + MAX_EXTRA_WEEKS:
+            if state.fitted_until == cutoff and state.checksum == checksum:
+                # Изменилась только текущая неделя — она в модель не входит
+                return state
+            if state.fitted_until < cutoff:
+                fitted = (await self.checksums(db, [user_id], state.fitted_until))[user_id]
+                if fitted == state.checksum:
+                    weekly, category_ids = await self._fetch_weekly(db, user_id, state.fitted_until, cutoff)
+                    self.incremental_fits += 1
+                    return await executor_service.run_ml(_extend_state, state, weekly, category_ids, cutoff, checksum)
+            logger.info(f"Forecast: history changed for user {user_id}, refitting")
+
+        weekly, category_ids = await self._fetch_weekly(db, user_id, start, cutoff)
+        self.full_fits += 1
+        return await executor_service.run_ml(_fit_state, weekly, category_ids, start, cutoff, checksum)
+
+    async def _stored(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        history_months: int,
+        period: str,
+        engine: str,
+        cutoff: datetime,
+        checksum: str,
+    ) -> Optional[dict]:
+        """Предрассчитанный прогноз, если он посчитан тем же движком по той же истории"""
+        row = (await db.execute(
+            select(Forecast.result).where(
+                Forecast.user_id == user_id,
+                Forecast.history_months == history_months,
+                Forecast.period == period,
+                Forecast.engine == engine,
+                Forecast.fitted_until == cutoff,
+                Forecast.checksum == checksum,
+            )
+        )).first()
+        return row[0] if row else None
+
+    async def _fetch_weekly(self, db: AsyncSession, user_id: UUID, start: datetime, end: datetime) -> Tuple[np.ndarray, np.ndarray]:
+        """Недельные суммы расходов: матрица (категории, недели) и id категорий (0 — без категории)"""
+        series = await self.fetch_weekly_many(db, [user_id], start, end)
+        return series.get(user_id, (np.zeros((0, (end - start).days // 7)), np.zeros(0, dtype=np.int64)))
+
+    @staticmethod
+    async def fetch_weekly_many(
+        db: AsyncSession, user_ids: List[UUID], start: datetime, end: datetime,
+    ) -> Dict[UUID, Tuple[np.ndarray, np.ndarray]]:
+        """Недельные суммы расходов нескольких пользователей одним запросом (пользователи без расходов не попадают)"""
+        weeks = (end - start).days // 7
+        # date_bin (PostgreSQL 14+) заметно дешевле extract(epoch ...) на десятках тысяч строк
+        week = func.date_bin(timedelta(weeks=1), Transaction.date, start)
+        category = func.coalesce(Transaction.category_id, 0)
+        grouped = (
+            select(
+                Transaction.user_id,
+                week.label("week"),
+                category.label("category_id"),
+                func.sum(-Transaction.amount).label("amount"),
+            )
+            .where(
+                Transaction.user_id.in_(user_ids), Transaction.amount < 0,
+                Transaction.date >= start, Transaction.date < end,
+            )
+            .group_by(Transaction.user_id, week, category)
+            .subquery()
+        )
+        # Строка на пользователя с тремя массивами: без разбора десятков тысяч строк в Python
+        week_index = cast(func.extract("epoch", grouped.c.week - start) / (7 * 86400), Integer)
+        rows = (await db.execute(
+            select(
+                grouped.c.user_id,
+                func.array_agg(week_index),
+                func.array_agg(grouped.c.category_id),
+                func.array_agg(grouped.c.amount),
+            ).group_by(grouped.c.user_id)
+        )).all()
+
+        series = {}
+        for user_id, week_indexes, categories, sums in rows:
+            category_ids, category_index = np.unique(np.asarray(categories, dtype=np.int64), return_inverse=True)
+            weekly = np.zeros((len(category_ids), weeks))
+            # (неделя, категория) уникальны после GROUP BY
+            weekly[category_index, np.asarray(week_indexes, dtype=np.int64)] = np.asarray(sums, dtype=np.float64)
+            series[user_id] = (weekly, category_ids)
+        return series
+
+    @staticmethod
+    async def fingerprint(db: AsyncSession, user_id: UUID) -> tuple:
+        """
+        Подпись расходов пользователя для кэша состояния: (категория, число,
+        сумма) по каждой категории из category_rollups и последний updated_at
+        транзакций (одна строка индекса ix_transactions_user_updated_id).
+        Смена категории меняет строки двух категорий, перенос даты и любая
+        другая правка через приложение поднимает updated_at
+        """
+        per_category = (
+            select(
+                CategoryRollup.category_id,
+                func.sum(CategoryRollup.expense_count).label("count"),
+                func.sum(CategoryRollup.expense_sum).label("sum"),
+            )
+            .where(CategoryRollup.user_id == user_id)
+            .group_by(CategoryRollup.category_id)
+            .subquery()
+        )
+        categories = select(func.string_agg(
+            func.concat_ws(":", per_category.c.category_id, per_category.c.count, per_category.c.sum),
+            aggregate_order_by(literal(","), per_category.c.category_id),
+        )).scalar_subquery()
+        last_update = select(func.max(Transaction.updated_at)).where(Transaction.user_id == user_id).scalar_subquery()
+        return tuple((await db.execute(select(categories, last_update))).one())
+
+    @staticmethod
+    async def checksums(db: AsyncSession, user_ids: List[UUID], until: datetime) -> Dict[UUID, str]:
+        """
+        Подпись расходов до until по пользователям (md5), из трёх частей:
+        - месяцы целиком — строки category_rollups по (месяц, категория)
+        - хвост с начала месяца until — число и сумма по категориям из
+          transactions (не больше пяти недель)
+        - правки после until строк с датой до until — число и последний
+          updated_at (ix_transactions_user_updated_id: только строки,
+          изменённые после начала текущей недели). Ловит правки, которые не
+          меняют помесячные суммы категорий: перенос даты внутри месяца,
+          изменения с той же суммой
+        Меняется при любой правке уже учтённой истории.
+        """
+        month = until.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        rollup = func.concat_ws(
+            ":", CategoryRollup.period_start, CategoryRollup.category_id,
+            CategoryRollup.expense_count, CategoryRollup.expense_sum,
+        )
+        rollups = dict((await db.execute(
+            select(
+                CategoryRollup.user_id,
+                func.md5(func.string_agg(
+                    rollup, aggregate_order_by(literal(","), CategoryRollup.period_start, CategoryRollup.category_id),
+                )),
+            )
+            .where(
+                CategoryRollup.user_id.in_(user_ids), CategoryRollup.period_start < month.date(),
+                # Строки только с доходами и обнулённые удалениями — как отсутствующие
+                CategoryRollup.expense_count != 0,
+            )
+            .group_by(CategoryRollup.user_id)
+        )).all())
+
+        category = func.coalesce(Transaction.category_id, 0)
+        tails: Dict[UUID, list] = {}
+        for user_id, category_id, count, total in (await db.execute(
+            select(Transaction.user_id, category, func.count(), func.sum(cast(Transaction.amount, Numeric(14, 2))))
+            .where(
+                Transaction.user_id.in_(user_ids), Transaction.amount < 0,
+                Transaction.date >= month, Transaction.date < until,
+            )
+            .group_by(Transaction.user_id, category)
+            .order_by(Transaction.user_id, category)
+        )).all():
+            tails.setdefault(user_id, []).append(f"{category_id}:{count}:{Decimal(total):.2f}")
+
+        edits = {row[0]: row[1:] for row in (await db.execute(
+            select(Transaction.user_id, func.count(), func.max(Transaction.updated_at))
+            .where(
+                Transaction.user_id.in_(user_ids), Transaction.updated_at >= until,
+                Transaction.amount < 0, Transaction.date < until,
+            )
+            .group_by(Transaction.user_id)
+        )).all()}
+
+        return {
+            user_id: _signature(rollups.get(user_id), tails.get(user_id, []), *edits.get(user_id, (0, None)))
+            for user_id in user_ids
+        }
+
+    @staticmethod
+    async def _with_names(db: AsyncSession, result: dict, engine: str) -> dict:
+        names = await analytics_service.category_names(db, [int(category_id) for category_id, _, _ in result["per_category"]])
+        return with_names(result, names, engine)
+
+    def stats(self) -> dict:
+        return {
+            "full_fits": self.full_fits,
+            "incremental_fits": self.incremental_fits,
+            "cache_hits": self.cache_hits,
+            "stored_hits": self.stored_hits,
+            "cached_users": len(self._states),
+        }
+
+
+def with_names(result: dict, names: List[Optional[str]], engine: str) -> dict:
+    """Ответ API из результата с id категорий: names — по порядку per_category (одинаковые складываются)"""
+    by_category = {}
+    for name, (_, amount, confidence) in zip(names, result["per_category"]):
+        entry = by_category.setdefault(name, {"amount": 0.0, "confidence": confidence})
+        entry["amount"] = round(entry["amount"] + amount, 2)
+        entry["confidence"] = min(entry["confidence"], confidence)
+    return {
+        "forecast": {
+            "total": result["total"],
+            "by_category": dict(sorted(by_category.items(), key=lambda item: -item[1]["amount"])),
+            "engine": engine,
+        },
+        "trend": result["trend"],
+        "confidence_interval": result["confidence_interval"],
+    }
+
+
+def fit_forecasts(
+    series: List[Tuple[np.ndarray, np.ndarray]],
+    start: datetime,
+    cutoff: datetime,
+    periods: List[str],
+    engine: str = "smoothing",
+) -> List[Dict[str, dict]]:
+    """
+    Прогнозы на несколько периодов для пачки рядов (weekly, category_ids)
+    с одним окном — для предрасчёта в пуле процессов. Категории всех рядов
+    сглаживаются одной рекурсией, затем состояние делится по рядам.
+    """
+    if engine == "prophet":
+        return [
+            {period: _prophet_forecast(weekly, category_ids, start, HORIZON_DAYS[period]) for period in periods}
+            for weekly, category_ids in series
+        ]
+
+    weeks = (cutoff - start).days // 7
+    weekly = np.concatenate([weekly for weekly, _ in series] + [np.zeros((0, weeks))])
+    state = _fit_state(weekly, np.zeros(len(weekly), dtype=np.int64), start, cutoff, "")
+
+    bounds = np.cumsum([0] + [len(category_ids) for _, category_ids in series])
+    results = []
+    for (_, category_ids), low, high in zip(series, bounds[:-1], bounds[1:]):
+        part = replace(
+            state, category_ids=category_ids,
+            level=state.level[:, low:high], trend=state.trend[:, low:high], sse=state.sse[:, low:high],
+            recent=state.recent[low:high],
+        )
+        results.append({period: _smoothing_forecast(part, HORIZON_DAYS[period]) for period in periods})
+    return results
+
+
+def _signature(rollups: Optional[str], tails: List[str], edit_count: int, last_edit: Optional[datetime]) -> str:
+    last_edit = last_edit.isoformat() if last_edit else ""
+    return hashlib.md5(f"{rollups or ''}|{','.join(tails)}|{edit_count}:{last_edit}".encode()).hexdigest()
+
+
+def _week_start(moment: datetime) -> datetime:
+    """Понедельник 00:00 недели, в которую попадает moment"""
+    return (moment - timedelta(days=moment.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def training_window(now: datetime, history_months: int) -> Tuple[datetime, datetime]:
+    """Окно обучения [start, cutoff): завершённые недели за history_months"""
+    cutoff = _week_start(now)
+    return cutoff - timedelta(weeks=math.ceil(history_months * 365.25 / 12 / 7)), cutoff
+
+
+def _smooth(level, trend, sse, weekly: np.ndarray, skip: int = 0):
+    """Рекурсия Холта по неделям (столбцы weekly) для всех alpha и категорий сразу"""
+    for week in range(weekly.shape[1]):
+        observed = weekly[:, week]
+        predicted = level + PHI * trend
+        if week >= skip:
+            sse = sse + (observed - predicted) ** 2
+        new_level = ALPHAS * observed + (1 - ALPHAS) * predicted
+        trend = BETA * (new_level - level) + (1 - BETA) * PHI * trend
+        level = new_level
+    return level, trend, sse
+
+
+def _fit_state(weekly, category_ids, start, cutoff, checksum) -> _SmoothingState:
+    categories, weeks = weekly.shape
+    init = weekly[:, :INIT_WEEKS].mean(axis=1) if weeks else np.zeros(categories)
+    level = np.broadcast_to(init, (len(ALPHAS), categories)).copy()
+    trend = np.zeros_like(level)
+    level, trend, sse = _smooth(level, trend, np.zeros_like(level), weekly, skip=INIT_WEEKS)
+
+    recent = np.zeros((categories, RECENT_WEEKS))
+    tail = weekly[:, -RECENT_WEEKS:]
+    if tail.shape[1]:
+        recent[:, -tail.shape[1]:] = tail
+    return _SmoothingState(
+        start=start, fitted_until=cutoff, category_ids=category_ids,
+        level=level, trend=trend, sse=sse, steps=max(weeks - INIT_WEEKS, 0),
+        recent=recent, checksum=checksum,
+    )
+
+
+def _extend_state(state: _SmoothingState, weekly, category_ids, cutoff, checksum) -> _SmoothingState:
+    """Продолжить рекурсию по новым завершённым неделям (новые категории — с нулевого уровня)"""
+    all_ids = np.union1d(state.category_ids, category_ids)
+    old_index = np.searchsorted(all_ids, state.category_ids)
+    new_index = np.searchsorted(all_ids, category_ids)
+
+    def widen(array, axis_size):
+        wide = np.zeros(array.shape[:-1] + (len(all_ids),)) if axis_size is None else np.zeros((len(all_ids), axis_size))
+        if axis_size is None:
+            wide[..., old_index] = array
+        else:
+            wide[old_index] = array
+        return wide
+
+    new_weeks = (cutoff - state.fitted_until).days // 7
+    observed = np.zeros((len(all_ids), new_weeks))
+    if len(category_ids):
+        observed[new_index] = weekly
+
+    level, trend, sse = _smooth(widen(state.level, None), widen(state.trend, None), widen(state.sse, None), observed)
+    recent = np.concatenate([widen(state.recent, RECENT_WEEKS), observed], axis=1)[:, -RECENT_WEEKS:]
+    return _SmoothingState(
+        start=state.start, fitted_until=cutoff, category_ids=all_ids,
+        level=level, trend=trend, sse=sse, steps=state.steps + new_weeks,
+        recent=recent, checksum=checksum,
+    )
+
+
+def _smoothing_forecast(state: _SmoothingState, horizon_days: int) -> dict:
+    """Прогноз на horizon_days из состояния: лучшая alpha по каждой категории"""
+    categories = len(state.category_ids)
+    if not categories:
+        return {"total": 0.0, "per_category": [], "trend": "stable", "confidence_interval": [0.0, 0.0]}
+
+    columns = np.arange(categories)
+    best = state.sse.argmin(axis=0)
+    level = state.level[best, columns]
+    trend = state.trend[best, columns]
+    rmse = np.sqrt(state.sse[best, columns] / max(state.steps, 1))
+
+    # Сумма прогнозов на h недель: level * h + trend * (phi + phi^2 + ... + phi^h), h может быть дробным
+    horizon_weeks = horizon_days / 7
+    damped = PHI * (1 - PHI ** horizon_weeks) / (1 - PHI)
+    amounts = np.clip(level * horizon_weeks + trend * damped, 0, None)
+
+    weekly_mean = state.recent.mean(axis=1)
+    confidence = 1 / (1 + rmse / np.maximum(weekly_mean, 1e-9))
+    total = float(amounts.sum())
+    half_width = Z_95 * math.sqrt(horizon_weeks * float((rmse ** 2).sum()))
+
+    recent_weeks = state.recent[:, -max(1, min(RECENT_WEEKS, round(horizon_weeks))):]
+    recent_total = float(recent_weeks.sum(axis=0).mean()) * horizon_weeks
+
+    return {
+        "total": round(total, 2),
+        "per_category": [
+            (category_id, round(float(amount), 2), round(float(conf), 2))
+            for category_id, amount, conf in zip(state.category_ids, amounts, confidence)
+            if amount >= 0.01
+        ],
+        "trend": _trend(total, recent_total),
+        "confidence_interval": [round(max(total - half_width, 0.0), 2), round(total + half_width, 2)],
+    }
+
+
+def prophet_available() -> bool:
+    try:
+        import prophet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _prophet_forecast(weekly: np.ndarray, category_ids: np.ndarray, start: datetime, horizon_days: int) -> dict:
+    """Офлайн режим: Prophet на каждую категорию (секунды на категорию)"""
+    import pandas as pd
+    from prophet import Prophet
+
+    categories, weeks = weekly.shape
+    dates = pd.date_range(start, periods=weeks, freq="7D")
+    horizon_weeks = horizon_days / 7
+    periods = math.ceil(horizon_weeks)
+    scale = horizon_weeks / periods if periods else 0.0
+
+    per_category, lower, upper = [], 0.0, 0.0
+    for index in range(categories):
+        model = Prophet(weekly_seasonality=False, daily_seasonality=False, yearly_seasonality=weeks >= 104)
+        model.fit(pd.DataFrame({"ds": dates, "y": weekly[index]}))
+        future = model.make_future_dataframe(periods=periods, freq="7D", include_history=False)
+        prediction = model.predict(future)
+        amount = max(float(prediction["yhat"].sum()) * scale, 0.0)
+        lower += max(float(prediction["yhat_lower"].sum()) * scale, 0.0)
+        upper += max(float(prediction["yhat_upper"].sum()) * scale, 0.0)
+        spread = float((prediction["yhat_upper"] - prediction["yhat_lower"]).mean())
+        confidence = 1 / (1 + spread / max(float(weekly[index].mean()), 1e-9) / (2 * Z_95))
+        per_category.append((int(category_ids[index]), round(amount, 2), round(confidence, 2)))
+
+    total = sum(amount for _, amount, _ in per_category)
+    recent = weekly[:, -max(1, round(horizon_weeks)):]
+    recent_total = float(recent.sum(axis=0).mean()) * horizon_weeks if weeks else 0.0
+    return {
+        "total": round(total, 2),
+        "per_category": [item for item in per_category if item[1] >= 0.01],
+        "trend": _trend(total, recent_total),
+        "confidence_interval": [round(lower, 2), round(upper, 2)],
+    }
+
+
+def _trend(forecast_total: float, recent_total: float) -> str:
+    """Сравнение прогноза с фактом за такой же срок в последних неделях"""
+    if recent_total <= 0:
+        return "increasing" if forecast_total > 0 else "stable"
+    change = forecast_total / recent_total - 1
+    if change > TREND_THRESHOLD:
+        return "increasing"
+    if change < -TREND_THRESHOLD:
+        return "decreasing"
+    return "stable"
+
+
+# Singleton instance
+forecast_service = ForecastService()
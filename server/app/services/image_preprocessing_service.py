@@ -2,24 +2,38 @@
 Сервис предобработки изображений для улучшения качества OCR.
 
 Pipeline:
-1. Декодирование base64 → numpy array
-2. Конвертация в оттенки серого
-3. Масштабирование (если изображение слишком маленькое)
-4. Удаление шума (fastNlMeansDenoising)
-5. Улучшение контраста (CLAHE)
-6. Бинаризация (адаптивный порог Otsu)
-7. Коррекция угла наклона (deskew)
+1. Декодирование байт файла (cv2.imdecode) → numpy array в оттенках серого
+2. Масштабирование (если изображение слишком маленькое)
+3. Удаление шума (fastNlMeansDenoising)
+4. Улучшение контраста (CLAHE)
+5. Бинаризация (адаптивный порог Otsu)
+6. Коррекция угла наклона (deskew)
+
+Режим adaptive (OCR_PREPROCESS_MODE=adaptive) сначала находит чек
+на фото и вырезает его с выравниванием перспективы (если чек не найден —
+работает со всем кадром), затем оценивает шум
+и контраст изображения и подбирает стадии под него: чистый скан не
+шумоподавляется, умеренный шум снимается median/bilateral фильтром, и только
+сильный — NL-means (самая дорогая стадия). Шумоподавление выполняется до
+масштабирования, на исходном разрешении. CLAHE пропускается при достаточном
+контрасте. Режим full (по умолчанию) — прежний pipeline со всеми стадиями;
+adaptive включается после проверки точности OCR scripts/validate_preprocessing.py.
 
 Ожидаемое улучшение точности OCR: 60-70% → 85-95%
 """
 import base64
+import math
+import time
 from io import BytesIO
+from typing import Optional, Tuple
 
 import cv2
 import numpy as np
 from PIL import Image
 from loguru import logger
 
+from app.config import settings
+
 
 class ImagePreprocessingService:
     """Предобработка изображений для OCR"""
@@ -28,6 +42,23 @@ class ImagePreprocessingService:
     MIN_WIDTH = 1000
     MIN_HEIGHT = 1000
 
+    # Пороги адаптивного режима: оценка σ шума (уровни яркости 0-255)
+    NOISE_NONE_MAX = 2.0       # ниже — шумоподавление не нужно
+    NOISE_MEDIAN_MAX = 5.0     # ниже — median 3x3
+    NOISE_BILATERAL_MAX = 10.0  # ниже — bilateral, выше — NL-means
+    # Разброс яркости между 2-м и 98-м перцентилем, при котором CLAHE не нужен
+    CONTRAST_SPREAD_OK = 150.0
+    # Оценки считаются по центральному фрагменту не больше этого размера
+    ESTIMATE_MAX_SIDE = 1024
+    # Угол наклона оценивается на копии не больше этого размера
+    DESKEW_MAX_SIDE = 800
+
+    # Поиск контура чека на фото (на копии не больше DOCUMENT_MAX_SIDE)
+    DOCUMENT_MAX_SIDE = 640
+    DOCUMENT_MIN_AREA = 0.10   # доля кадра: меньше — скорее всего не чек
+    DOCUMENT_MAX_AREA = 0.90   # больше — чек и так занимает весь кадр
+    DOCUMENT_MIN_FILL = 0.85   # площадь контура / площадь описанного прямоугольника
+
     def preprocess_from_base64(self, image_base64: str) -> np.ndarray:
         """
         Полный pipeline предобработки из base64 строки.
@@ -35,34 +66,103 @@ class ImagePreprocessingService:
         Returns:
             numpy array (grayscale, бинаризованное изображение)
         """
-        img = self._decode_base64(image_base64)
-        img = self._to_grayscale(img)
-        img = self._scale_up(img)
-        img = self._denoise(img)
-        img = self._enhance_contrast(img)
-        img = self._binarize(img)
-        img = self._deskew(img)
+        return self.preprocess_from_bytes(self.decode_base64(image_base64))
+
+    def preprocess_from_bytes(self, image_bytes: bytes, mode: Optional[str] = None) -> np.ndarray:
+        """
+        Полный pipeline предобработки из байт файла изображения (JPEG/PNG).
+
+        Args:
+            mode: adaptive | full, по умолчанию OCR_PREPROCESS_MODE
+
+        Returns:
+            numpy array (grayscale, бинаризованное изображение)
+        """
+        img, _report = self.preprocess_with_report(image_bytes, mode)
         return img
 
-    def preprocess_to_pil(self, image_base64: str) -> Image.Image:
+    def preprocess_with_report(self, image_bytes: bytes, mode: Optional[str] = None) -> Tuple[np.ndarray, dict]:
+        """
+        Pipeline предобработки с отчётом: выбранные стадии, оценки шума/контраста
+        и время каждой стадии в мс.
+
+        Returns:
+            (изображение, {"mode", "document", "noise_sigma", "contrast_spread",
+            "denoise", "clahe", "timings_ms": {стадия: мс}})
+        """
+        mode = mode or settings.OCR_PREPROCESS_MODE
+        timings = {}
+
+        def timed(stage, func, *args):
+            started = time.perf_counter()
+            result = func(*args)
+            timings[stage] = round((time.perf_counter() - started) * 1000, 2)
+            return result
+
+        img = timed("decode", self._decode_image, image_bytes)
+        img = timed("grayscale", self._to_grayscale, img)
+
+        if mode == "full":
+            report = {"mode": "full", "noise_sigma": None, "contrast_spread": None,
+                      "denoise": "nl_means", "clahe": True}
+            img = timed("scale_up", self._scale_up, img)
+            img = timed("denoise", self._denoise, img)
+            img = timed("contrast", self._enhance_contrast, img)
+        else:
+            # Фото чека на столе: дальше работаем только с выровненным чеком
+            img, document = timed("document", self._crop_document, img)
+
+            noise_sigma, contrast_spread = timed("estimate", self._estimate_quality, img)
+            denoise = self._choose_denoise(noise_sigma)
+            clahe = contrast_spread < self.CONTRAST_SPREAD_OK
+            report = {"mode": "adaptive", "document": document, "noise_sigma": round(noise_sigma, 2),
+                      "contrast_spread": round(contrast_spread, 1), "denoise": denoise, "clahe": clahe}
+
+            # На исходном разрешении: меньше пикселей, и фильтр соответствует измеренному шуму
+            if denoise != "none":
+                img = timed("denoise", self._denoise_adaptive, img, denoise)
+            img = timed("scale_up", self._scale_up, img)
+            if clahe:
+                img = timed("contrast", self._enhance_contrast, img)
+
+        img = timed("binarize", self._binarize, img)
+        img = timed("deskew", self._deskew, img)
+
+        report["timings_ms"] = timings
+        report["total_ms"] = round(sum(timings.values()), 2)
+        logger.debug(f"Preprocessing report: {report}")
+        return img, report
+
+    def preprocess_to_pil(self, image_bytes: bytes) -> Image.Image:
         """Вернуть предобработанное изображение как PIL Image (для pytesseract)."""
-        processed = self.preprocess_from_base64(image_base64)
+        processed = self.preprocess_from_bytes(image_bytes)
         return Image.fromarray(processed)
 
+    def decode_base64(self, image_base64: str) -> bytes:
+        """Декодировать base64 строку (в том числе data URI) в байты файла изображения."""
+        # Убираем data URI prefix если есть: "data:image/jpeg;base64,..."
+        if "," in image_base64:
+            image_base64 = image_base64.split(",", 1)[1]
+        return base64.b64decode(image_base64)
+
     # ------------------------------------------------------------------
     # Приватные методы pipeline
     # ------------------------------------------------------------------
 
-    def _decode_base64(self, image_base64: str) -> np.ndarray:
-        """Декодировать base64 → numpy array (BGR)."""
-        # Убираем data URI prefix если есть: "data:image/jpeg;base64,..."
-        if "," in image_base64:
-            image_base64 = image_base64.split(",", 1)[1]
+    def _decode_image(self, image_bytes: bytes) -> np.ndarray:
+        """
+        Декодировать байты файла изображения → numpy array.
 
-        image_bytes = base64.b64decode(image_base64)
-        pil_image = Image.open(BytesIO(image_bytes)).convert("RGB")
-        img = np.array(pil_image)
-        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+        cv2.imdecode читает прямо из буфера байт в одноканальный массив:
+        без промежуточного PIL изображения и RGB/BGR копий. EXIF ориентация
+        игнорируется, как и раньше при декодировании через PIL. Форматы,
+        которых нет в OpenCV (например, GIF), декодируются через PIL.
+        """
+        buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+        img = cv2.imdecode(buffer, cv2.IMREAD_GRAYSCALE | cv2.IMREAD_IGNORE_ORIENTATION)
+        if img is None:
+            pil_image = Image.open(BytesIO(image_bytes)).convert("L")
+            img = np.array(pil_image)
         logger.debug(f"Decoded image: {img.shape[1]}x{img.shape[0]}px")
         return img
 
@@ -93,6 +193,101 @@ class ImagePreprocessingService:
         """
         return cv2.fastNlMeansDenoising(img, h=10, templateWindowSize=7, searchWindowSize=21)
 
+    def _crop_document(self, img: np.ndarray) -> Tuple[np.ndarray, bool]:
+        """
+        Найти чек на фото и выровнять его перспективным преобразованием.
+
+        Контуры ищутся на уменьшенной копии: границы (Canny) → замыкание
+        разрывов → внешние контуры → первый крупный выпуклый четырёхугольник.
+        Если уверенного четырёхугольника нет, возвращается исходный кадр.
+
+        Returns:
+            (изображение, найден ли чек)
+        """
+        h, w = img.shape[:2]
+        scale = min(1.0, self.DOCUMENT_MAX_SIDE / max(h, w))
+        small = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else img
+
+        blurred = cv2.GaussianBlur(small, (5, 5), 0)
+        edges = cv2.Canny(blurred, 50, 150)
+        edges = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        frame_area = small.shape[0] * small.shape[1]
+        quad = None
+        for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+            area = cv2.contourArea(contour)
+            if area < self.DOCUMENT_MIN_AREA * frame_area:
+                break
+            approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+            if len(approx) != 4 or not cv2.isContourConvex(approx):
+                continue
+            rect_w, rect_h = cv2.minAreaRect(approx)[1]
+            if area < self.DOCUMENT_MIN_FILL * rect_w * rect_h:
+                continue
+            quad = approx.reshape(4, 2).astype(np.float32)
+            break
+
+        if quad is None or cv2.contourArea(quad) > self.DOCUMENT_MAX_AREA * frame_area:
+            logger.debug("No document quad found, using full frame")
+            return img, False
+
+        # Углы по порядку: левый верхний, правый верхний, правый нижний, левый нижний
+        quad /= scale
+        sums, diffs = quad.sum(axis=1), np.diff(quad, axis=1).ravel()
+        corners = np.array([
+            quad[sums.argmin()], quad[diffs.argmin()], quad[sums.argmax()], quad[diffs.argmax()]
+        ], dtype=np.float32)
+
+        width = int(max(np.linalg.norm(corners[1] - corners[0]), np.linalg.norm(corners[2] - corners[3])))
+        height = int(max(np.linalg.norm(corners[3] - corners[0]), np.linalg.norm(corners[2] - corners[1])))
+        target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+
+        matrix = cv2.getPerspectiveTransform(corners, target)
+        cropped = cv2.warpPerspective(img, matrix, (width, height), flags=cv2.INTER_LINEAR)
+        logger.debug(f"Document cropped: {w}x{h} → {width}x{height}px")
+        return cropped, True
+
+    def _estimate_quality(self, img: np.ndarray) -> Tuple[float, float]:
+        """
+        Оценить σ шума и разброс контраста по центральному фрагменту.
+
+        Шум — метод Immerkær (1996): свёртка с маской, гасящей структуру
+        изображения (разность двух лапласианов), и среднее абсолютное значение
+        отклика. Контраст — разница 98-го и 2-го перцентилей яркости.
+        """
+        h, w = img.shape[:2]
+        side = self.ESTIMATE_MAX_SIDE
+        top, left = max((h - side) // 2, 0), max((w - side) // 2, 0)
+        sample = img[top:top + side, left:left + side]
+
+        kernel = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+        response = cv2.filter2D(sample.astype(np.float32), -1, kernel)[1:-1, 1:-1]
+        noise_sigma = math.sqrt(math.pi / 2) * float(np.abs(response).mean()) / 6
+
+        histogram = cv2.calcHist([sample], [0], None, [256], [0, 256]).ravel().cumsum()
+        low = int(np.searchsorted(histogram, histogram[-1] * 0.02))
+        high = int(np.searchsorted(histogram, histogram[-1] * 0.98))
+        return noise_sigma, float(high - low)
+
+    def _choose_denoise(self, noise_sigma: float) -> str:
+        """Самый дешёвый фильтр, достаточный для измеренного шума"""
+        if noise_sigma < self.NOISE_NONE_MAX:
+            return "none"
+        if noise_sigma < self.NOISE_MEDIAN_MAX:
+            return "median"
+        if noise_sigma < self.NOISE_BILATERAL_MAX:
+            return "bilateral"
+        return "nl_means"
+
+    def _denoise_adaptive(self, img: np.ndarray, method: str) -> np.ndarray:
+        """Шумоподавление выбранным фильтром (median и bilateral на порядки дешевле NL-means)"""
+        if method == "median":
+            return cv2.medianBlur(img, 3)
+        if method == "bilateral":
+            return cv2.bilateralFilter(img, d=5, sigmaColor=50, sigmaSpace=50)
+        return self._denoise(img)
+
     def _enhance_contrast(self, img: np.ndarray) -> np.ndarray:
         """
         Улучшить контраст с помощью CLAHE (Contrast Limited Adaptive Histogram Equalization).
@@ -120,27 +315,14 @@ class ImagePreprocessingService:
         Коррекция угла наклона (deskew).
 
         Алгоритм:
-        1. Найти координаты ненулевых пикселей
-        2. Вычислить угол наклона через minAreaRect
-        3. Если угол > 0.5° — повернуть изображение
+        1. Оценить угол на уменьшенной копии (_skew_angle)
+        2. Если угол > 0.5° — повернуть изображение в полном разрешении
         """
-        # Инвертируем: текст должен быть белым на чёрном для minAreaRect
-        inverted = cv2.bitwise_not(img)
-        coords = np.column_stack(np.where(inverted > 0))
-
-        if len(coords) < 50:
+        angle = self._skew_angle(img)
+        if angle is None:
             logger.debug("Not enough points for deskew, skipping")
             return img
 
-        angle = cv2.minAreaRect(coords)[-1]
-
-        # minAreaRect возвращает угол в диапазоне [-90, 0)
-        # Корректируем до [-45, 45]
-        if angle < -45:
-            angle = 90 + angle
-        else:
-            angle = -angle  # cv2 использует противоположное направление
-
         if abs(angle) < 0.5:
             logger.debug(f"Skew angle {angle:.2f}° is negligible, skipping")
             return img
@@ -158,6 +340,46 @@ class ImagePreprocessingService:
         )
         return rotated
 
+    def _skew_angle(self, img: np.ndarray) -> Optional[float]:
+        """
+        Угол поворота для выравнивания бинарного изображения (None — мало текста).
+
+        1. Уменьшить изображение до DESKEW_MAX_SIDE по большей стороне
+        2. Найти координаты пикселей текста на копии (cv2.findNonZero)
+        3. Вычислить угол наклона через minAreaRect
+
+        Угол не зависит от равномерного масштаба, а массив координат для
+        уменьшенной копии в сотни раз меньше, чем для полного разрешения
+        """
+        h, w = img.shape[:2]
+
+        # Пиксели текста — чёрные; считаем их без инвертированной копии
+        if h * w - cv2.countNonZero(img) < 50:
+            return None
+
+        scale = min(1.0, self.DESKEW_MAX_SIDE / max(h, w))
+        thumbnail = img
+        if scale < 1.0:
+            thumbnail = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        # Текст должен быть белым на чёрном; INTER_AREA сохраняет тонкие штрихи серыми
+        _, thumbnail = cv2.threshold(thumbnail, 127, 255, cv2.THRESH_BINARY_INV)
+
+        points = cv2.findNonZero(thumbnail)
+        if points is None or len(points) < 50:
+            return None
+
+        # findNonZero возвращает (x, y); порядок (строка, столбец), как раньше
+        # у np.where, задаёт знак угла ниже
+        angle = cv2.minAreaRect(np.ascontiguousarray(points[:, 0, ::-1]))[-1]
+
+        # OpenCV >= 4.5 возвращает угол в (0, 90], более старые — в [-90, 0).
+        # Приводим к (-45, 45]: почти ровный чек даёт угол около 0, а не 90
+        if angle > 45:
+            angle -= 90
+        elif angle <= -45:
+            angle += 90
+        return -angle  # cv2 использует противоположное направление
+
 
 # Singleton instance
 image_preprocessing_service = ImagePreprocessingService()
@@ -0,0 +1,300 @@
+"""
+Пакетная загрузка транзакций с устройств (офлайн режим приложения)
+
+Тело запроса (JSON массив или NDJSON) разбирается потоком и обрабатывается
+пачками по BULK_INGEST_BATCH_SIZE строк:
+1. Валидация пачки одним вызовом pydantic TypeAdapter
+2. Категоризация строк без category_id одним вызовом модели на пачку
+   (ml_category, ml_confidence)
+3. COPY пачки в временную таблицу transactions_ingest (asyncpg
+   copy_records_to_table, бинарный протокол)
+
+В конце — один INSERT ... SELECT ... ON CONFLICT (user_id, client_id) из
+временной таблицы: новые записи вставляются, присланные повторно
+обновляются, только если версия с устройства новее серверной (иначе запись
+возвращается в conflicts, а серверная копия приходит клиенту при
+синхронизации). Всё в одной транзакции БД: ошибка в любой строке отменяет
+загрузку целиком.
+"""
+import json
+import time
+from datetime import datetime
+from typing import AsyncIterator, List, Set
+from uuid import UUID
+
+from loguru import logger
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import or_, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.category import Category
+from app.models.user import User
+from app.schemas.transaction import TransactionIn
+from app.services.analytics_service import analytics_service
+from app.services.anomaly_service import anomaly_service
+from app.services.executor_service import executor_service
+from app.services.forecast_service import forecast_service
+from app.services.ml_service import ml_service
+from app.utils.json_stream import iter_json_objects
+
+# Сколько ошибок валидации возвращать клиенту
+MAX_REPORTED_ERRORS = 20
+
+_ROWS = TypeAdapter(List[TransactionIn])
+
+STAGING_COLUMNS = (
+    "ord", "client_id", "category_id", "amount", "description", "date", "receipt_data",
+    "ml_category", "ml_confidence", "device_id", "version",
+)
+
+# ON COMMIT DELETE ROWS: таблица создаётся один раз на соединение пула, строки живут до конца транзакции
+CREATE_STAGING = text("""
+    CREATE TEMP TABLE IF NOT EXISTS transactions_ingest (
+        ord integer,
+        client_id uuid,
+        category_id integer,
+        amount double precision,
+        description text,
+        date timestamp,
+        receipt_data jsonb,
+        ml_category varchar(100),
+        ml_confidence double precision,
+        device_id varchar(100),
+        version integer
+    ) ON COMMIT DELETE ROWS
+""")
+
+MERGE_STAGING = text("""
+    INSERT INTO transactions AS t (
+        user_id, client_id, category_id, amount, description, date, receipt_data,
+        ml_category, ml_confidence, is_anomaly, device_id, created_at, updated_at, version
+    )
+    SELECT
+        :user_id, client_id, category_id, amount, description, date, receipt_data,
+        ml_category, ml_confidence, false, device_id, :now, :now, version
+    FROM transactions_ingest
+    ORDER BY ord
+    ON CONFLICT (user_id, client_id) DO UPDATE SET
+        category_id = EXCLUDED.category_id,
+        amount = EXCLUDED.amount,
+        description = EXCLUDED.description,
+        date = EXCLUDED.date,
+        receipt_data = EXCLUDED.receipt_data,
+        ml_category = EXCLUDED.ml_category,
+        ml_confidence = EXCLUDED.ml_confidence,
+        device_id = EXCLUDED.device_id,
+        updated_at = EXCLUDED.updated_at,
+        version = EXCLUDED.version
+    WHERE t.version < EXCLUDED.version
+    -- Обновлённые строки сохраняют свой created_at
+    RETURNING t.id, t.client_id, t.version, t.category_id, t.amount, t.date, t.created_at = :now AS inserted
+""")
+
+# Записи с client_id, которые MERGE_STAGING не тронул (серверная версия не старше) — в той же транзакции
+SELECT_CONFLICTS = text("""
+    SELECT t.client_id, t.id, t.version
+    FROM transactions_ingest s
+    JOIN transactions t ON t.user_id = :user_id AND t.client_id = s.client_id
+    WHERE t.updated_at <> :now
+    ORDER BY s.ord
+""")
+
+
+class IngestError(Exception):
+    """Загрузку нельзя принять: detail и HTTP статус для ответа"""
+
+    def __init__(self, detail, status_code: int = 400):
+        super().__init__(str(detail))
+        self.detail = detail
+        self.status_code = status_code
+
+
+class IngestService:
+    """Пакетная загрузка транзакций пользователя"""
+
+    async def ingest(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        chunks: AsyncIterator[bytes],
+        ndjson: bool = False,
+    ) -> dict:
+        """
+        Загрузить транзакции из потока тела запроса
+
+        Returns:
+            Счётчики загрузки и серверные id записей с client_id (BulkIngestResponse)
+
+        Raises:
+            IngestError: пользователь не найден (404), некорректный JSON (400),
+                ошибки валидации (422), превышены лимиты (413)
+        """
+        started = time.perf_counter()
+        if await db.scalar(select(User.id).where(User.id == user_id)) is None:
+            raise IngestError(f"User {user_id} not found", status_code=404)
+
+        await db.execute(CREATE_STAGING)
+        connection = await (await db.connection()).get_raw_connection()
+
+        received, categorized, model_version = 0, 0, None
+        client_ids: Set[UUID] = set()
+        category_ids: Set[int] = set()
+        batch: List = []
+
+        async def stage():
+            nonlocal received, categorized, model_version
+            staged, version = await self._stage(connection.driver_connection, batch, received, client_ids, category_ids)
+            received += len(batch)
+            categorized += staged
+            model_version = version or model_version
+            batch.clear()
+
+        try:
+            async for items in iter_json_objects(self._limited(chunks), ndjson):
+                batch.extend(items)
+                if received + len(batch) > settings.BULK_INGEST_MAX_ROWS:
+                    raise IngestError(f"Too many rows (max {settings.BULK_INGEST_MAX_ROWS})", status_code=413)
+                if len(batch) >= settings.BULK_INGEST_BATCH_SIZE:
+                    await stage()
+            if batch:
+                await stage()
+        except ValueError as e:
+            raise IngestError(str(e))
+
+        result = {
+            "received": received, "inserted": 0, "updated": 0, "skipped": 0,
+            "categorized": categorized, "anomalies": 0, "model_version": model_version,
+            "transactions": [], "conflicts": [],
+        }
+        if received == 0:
+            result["processing_time_ms"] = int((time.perf_counter() - started) * 1000)
+            return result
+
+        await self._check_categories(db, user_id, category_ids)
+
+        now = datetime.utcnow()
+        rows = (await db.execute(MERGE_STAGING, {"user_id": user_id, "now": now})).all()
+        inserted = [row for row in rows if row.inserted]
+        if len(rows) < received:
+            conflicts = (await db.execute(SELECT_CONFLICTS, {"user_id": user_id, "now": now})).all()
+            result["conflicts"] = [
+                {"client_id": row.client_id, "id": row.id, "version": row.version} for row in conflicts
+            ]
+
+        # Новые расходы — в потоковую статистику аномалий, по порядку дат (как пришли бы по одной)
+        if inserted:
+            observed = await anomaly_service.observe_many(db, user_id, [
+                (row.id, row.category_id, row.amount) for row in sorted(inserted, key=lambda row: (row.date, row.id))
+            ])
+            result["anomalies"] = sum(item["is_anomaly"] for item in observed)
+
+        analytics_service.invalidate(user_id)
+        forecast_service.invalidate(user_id)
+
+        result.update(
+            inserted=len(inserted),
+            updated=len(rows) - len(inserted),
+            skipped=received - len(rows),
+            transactions=[
+                {"client_id": row.client_id, "id": row.id, "version": row.version}
+                for row in rows if row.client_id is not None
+            ],
+            processing_time_ms=int((time.perf_counter() - started) * 1000),
+        )
+        logger.info(
+            f"Ingested {received} transactions for {user_id}: {result['inserted']} inserted, "
+            f"{result['updated']} updated, {result['skipped']} skipped, {categorized} categorized "
+            f"in {result['processing_time_ms']} ms"
+        )
+        return result
+
+    @staticmethod
+    async def _limited(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        size = 0
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > settings.BULK_INGEST_MAX_BYTES:
+                raise IngestError(f"Body too large (max {settings.BULK_INGEST_MAX_BYTES} bytes)", status_code=413)
+            yield chunk
+
+    async def _stage(
+        self,
+        connection,
+        items: List,
+        offset: int,
+        client_ids: Set[UUID],
+        category_ids: Set[int],
+    ) -> tuple:
+        """Провалидировать, категоризировать и скопировать пачку во временную таблицу. Возвращает (категоризовано, версия модели)"""
+        try:
+            rows = _ROWS.validate_python(items)
+        except ValidationError as e:
+            raise IngestError(_validation_errors(e, offset), status_code=422)
+
+        for index, row in enumerate(rows):
+            if row.client_id is not None:
+                if row.client_id in client_ids:
+                    raise IngestError(f"Duplicate client_id {row.client_id} in row {offset + index}", status_code=422)
+                client_ids.add(row.client_id)
+            if row.category_id is not None:
+                category_ids.add(row.category_id)
+
+        # Без категории и без текста модели нечего категоризировать
+        to_categorize = [
+            index for index, row in enumerate(rows)
+            if row.category_id is None and (row.description or row.merchant_name)
+        ]
+        predictions, model_version = {}, None
+        if to_categorize:
+            results, model_version = await executor_service.run_ml(ml_service.categorize_many_versioned, [
+                {
+                    "description": rows[index].description or "",
+                    "amount": rows[index].amount,
+                    "merchant_name": rows[index].merchant_name,
+                }
+                for index in to_categorize
+            ])
+            predictions = {index: (category, confidence) for index, (category, confidence, _) in zip(to_categorize, results)}
+
+        records = []
+        for index, row in enumerate(rows):
+            ml_category, ml_confidence = predictions.get(index, (None, None))
+            records.append((
+                offset + index, row.client_id, row.category_id, row.amount, row.description, row.date,
+                json.dumps(row.receipt_data) if row.receipt_data is not None else None,
+                ml_category, ml_confidence, row.device_id, row.version,
+            ))
+        await connection.copy_records_to_table("transactions_ingest", records=records, columns=STAGING_COLUMNS)
+        return len(to_categorize), model_version
+
+    @staticmethod
+    async def _check_categories(db: AsyncSession, user_id: UUID, category_ids: Set[int]):
+        """Категории должны быть предустановленными или принадлежать пользователю"""
+        if not category_ids:
+            return
+        known = set((await db.execute(
+            select(Category.id).where(
+                Category.id.in_(category_ids),
+                or_(Category.user_id == user_id, Category.user_id.is_(None)),
+            )
+        )).scalars().all())
+        unknown = sorted(category_ids - known)
+        if unknown:
+            raise IngestError(f"Unknown category_id: {unknown[:MAX_REPORTED_ERRORS]}", status_code=422)
+
+
+def _validation_errors(error: ValidationError, offset: int) -> List[dict]:
+    """Ошибки pydantic в формате FastAPI с номером строки во всём теле запроса"""
+    return [
+        {
+            "loc": ["body", offset + item["loc"][0], *item["loc"][1:]],
+            "msg": item["msg"],
+            "type": item["type"],
+        }
+        for item in error.errors(include_url=False)[:MAX_REPORTED_ERRORS]
+    ]
+
+
+# Singleton instance
+ingest_service = IngestService()
@@ -1,52 +1,247 @@
 """
 ML Service для категоризации транзакций
 """
+import asyncio
 import pickle
-import os
+import threading
+import time
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 import numpy as np
 from loguru import logger
 
+from app.config import settings
+from app.ml.keyword_matcher import DEFAULT_KEYWORDS_PATH, KeywordMatcher
+from app.ml.model_bundle import (
+    ENGINES,
+    bundle_path,
+    list_model_versions,
+    load_bundle,
+    model_version_dir,
+    models_root,
+    pickle_model_path,
+)
+from app.utils.lru_cache import LRUCache
+
+
+@dataclass(frozen=True)
+class _ModelState:
+    """
+    Неизменяемый набор загруженной модели. Подменяется целиком одним
+    присваиванием, поэтому запрос никогда не видит векторизатор от одной
+    версии и модель от другой
+    """
+    version: str
+    engine: str
+    vectorizer: Any
+    model: Any
+    class_names: np.ndarray
+    loaded_at: float
+
 
 class MLCategorizationService:
     """Сервис для ML категоризации транзакций"""
 
+    # Тексты для прогрева новой модели перед подменой
+    WARM_UP_TEXTS = ["пятерочка хлеб молоко", "яндекс такси поездка", "аптека лекарства"]
+
     def __init__(self):
-        self.model = None
-        self.vectorizer = None
-        self.label_encoder = None
-        self.is_loaded = False
-        self.model_path = Path(__file__).parent.parent / "ml" / "models"
-
-    def load_model(self):
-        """Загрузить обученную модель из файла"""
+        self._state: Optional[_ModelState] = None
+        self._load_lock = threading.Lock()
+        self._watch_task: Optional[asyncio.Task] = None
+
+        # Кэш предсказаний по нормализованному тексту. Ключ включает версию модели,
+        # чтобы результат старой модели не попал в кэш после перезагрузки
+        self._cache = LRUCache(maxsize=settings.ML_CATEGORIZATION_CACHE_SIZE)
+
+        # Fallback по ключевым словам: таблица из файла, компилируется один раз
+        self._fallback_matcher = self._load_fallback_matcher()
+
+    @property
+    def state(self) -> Optional[_ModelState]:
+        """Текущая модель (снимок; None — модель не загружена)"""
+        return self._state
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._state is not None
+
+    @property
+    def model_version(self) -> Optional[str]:
+        state = self._state
+        return state.version if state else None
+
+    @property
+    def model_path(self) -> Path:
+        return models_root()
+
+    def _load_fallback_matcher(self) -> KeywordMatcher:
+        """Загрузить таблицу ключевых слов для fallback категоризации"""
+        path = Path(settings.ML_FALLBACK_KEYWORDS_PATH or DEFAULT_KEYWORDS_PATH)
         try:
-            model_file = self.model_path / "categorization_model.pkl"
-            vectorizer_file = self.model_path / "vectorizer.pkl"
-            encoder_file = self.model_path / "label_encoder.pkl"
+            matcher = KeywordMatcher.from_file(path)
+            logger.info(f"Loaded {len(matcher)} fallback keywords from {path}")
+            return matcher
+        except Exception as e:
+            logger.error(f"Error loading fallback keywords from {path}: {e}")
+            return KeywordMatcher({})
+
+    def available_versions(self) -> List[str]:
+        """Версии моделей в ML_MODELS_PATH, от старой к новой"""
+        return list_model_versions(self.model_path)
+
+    def target_version(self) -> Optional[str]:
+        """Версия, которую нужно обслуживать: ML_MODEL_VERSION или последняя доступная"""
+        if settings.ML_MODEL_VERSION:
+            return settings.ML_MODEL_VERSION
+        versions = self.available_versions()
+        return versions[-1] if versions else None
 
-            if not model_file.exists():
-                logger.warning(f"Model file not found: {model_file}")
-                logger.warning("ML categorization will not be available. Please train the model first.")
+    def load_model(self, version: Optional[str] = None):
+        """
+        Загрузить обученную модель и атомарно подменить текущую.
+
+        Версия: аргумент, иначе ML_MODEL_VERSION, иначе последняя директория
+        в ML_MODELS_PATH. Движок выбирается через ML_ENGINE
+        (random_forest | logreg | sgd | complement_nb). По умолчанию
+        (ML_MODEL_FORMAT=auto) используется бандл из плоских массивов
+        (открывается через mmap, страницы общие для всех воркеров), а если его нет —
+        pickle файлы.
+
+        Новая модель прогревается до подмены. Если загрузка не удалась,
+        продолжает работать прежняя версия
+        """
+        with self._load_lock:
+            self._fallback_matcher = self._load_fallback_matcher()
+            try:
+                engine = settings.ML_ENGINE
+                if engine not in ENGINES:
+                    logger.error(f"Unknown ML engine '{engine}', expected one of {ENGINES}")
+                    return False
+
+                version = version or self.target_version()
+                if version is None:
+                    logger.warning(f"No trained models found in {self.model_path}")
+                    logger.warning("ML categorization will not be available. Please train the model first.")
+                    return False
+
+                state = self._load_state(version, engine)
+                if state is None:
+                    return False
+
+                # Прогрев: первый transform/predict_proba подтягивает страницы mmap
+                # и ленивые структуры sklearn, пока запросы обслуживает старая модель
+                started = time.perf_counter()
+                self._predict_uncached(state, self.WARM_UP_TEXTS)
+                warm_up_ms = (time.perf_counter() - started) * 1000
+
+                previous = self._state
+                self._state = state
+                self._cache.clear()
+                logger.info(
+                    f"✅ ML categorization model loaded successfully "
+                    f"(version: {version}, engine: {engine}, warm-up: {warm_up_ms:.1f} ms"
+                    + (f", replaced: {previous.version})" if previous else ")")
+                )
+                return True
+
+            except Exception as e:
+                logger.error(f"Error loading ML model: {e}")
                 return False
 
-            with open(model_file, "rb") as f:
-                self.model = pickle.load(f)
+    async def reload_model(self, version: Optional[str] = None) -> bool:
+        """Загрузить версию в фоновом потоке; запросы продолжает обслуживать текущая модель"""
+        return await asyncio.to_thread(self.load_model, version)
 
-            with open(vectorizer_file, "rb") as f:
-                self.vectorizer = pickle.load(f)
+    def _load_state(self, version: str, engine: str) -> Optional[_ModelState]:
+        """Прочитать модель версии с диска, не трогая текущее состояние"""
+        model_dir = model_version_dir(self.model_path, version)
+        if not model_dir.is_dir():
+            logger.warning(f"Model version not found: {model_dir}")
+            return None
 
-            with open(encoder_file, "rb") as f:
-                self.label_encoder = pickle.load(f)
+        model_format = settings.ML_MODEL_FORMAT
+        bundle_dir = bundle_path(model_dir, engine)
 
-            self.is_loaded = True
-            logger.info("✅ ML categorization model loaded successfully")
-            return True
+        if model_format in ("auto", "bundle") and (bundle_dir / "meta.json").exists():
+            vectorizer, model, class_names = load_bundle(bundle_dir)
+            logger.info(f"Loaded model bundle from {bundle_dir}")
+        elif model_format == "bundle":
+            logger.warning(f"Model bundle not found: {bundle_dir}")
+            logger.warning("ML categorization will not be available. Please train the model first.")
+            return None
+        else:
+            loaded = self._load_pickle(model_dir, engine)
+            if loaded is None:
+                return None
+            vectorizer, model, class_names = loaded
 
-        except Exception as e:
-            logger.error(f"Error loading ML model: {e}")
-            return False
+        return _ModelState(
+            version=version,
+            engine=engine,
+            vectorizer=vectorizer,
+            model=model,
+            class_names=class_names,
+            loaded_at=time.time(),
+        )
+
+    def _load_pickle(self, model_dir: Path, engine: str):
+        """Загрузить модель, векторизатор и энкодер из pickle файлов"""
+        model_file = pickle_model_path(model_dir, engine)
+        vectorizer_file = model_dir / "vectorizer.pkl"
+        encoder_file = model_dir / "label_encoder.pkl"
+
+        if not model_file.exists():
+            logger.warning(f"Model file not found: {model_file}")
+            logger.warning("ML categorization will not be available. Please train the model first.")
+            return None
+
+        with open(model_file, "rb") as f:
+            model = pickle.load(f)
+
+        with open(vectorizer_file, "rb") as f:
+            vectorizer = pickle.load(f)
+
+        with open(encoder_file, "rb") as f:
+            label_encoder = pickle.load(f)
+
+        # Столбцы predict_proba соответствуют model.classes_ (закодированным меткам)
+        return vectorizer, model, label_encoder.classes_[model.classes_]
+
+    def start_watcher(self):
+        """Запустить фоновую проверку новых версий (ML_MODEL_WATCH_INTERVAL > 0)"""
+        interval = settings.ML_MODEL_WATCH_INTERVAL
+        if interval <= 0 or self._watch_task is not None:
+            return
+        self._watch_task = asyncio.create_task(self._watch(interval))
+        logger.info(f"👀 Watching {self.model_path} for new model versions every {interval}s")
+
+    async def stop_watcher(self):
+        if self._watch_task is None:
+            return
+        self._watch_task.cancel()
+        try:
+            await self._watch_task
+        except asyncio.CancelledError:
+            pass
+        self._watch_task = None
+
+    async def _watch(self, interval: float):
+        """Подхватить новую версию, как только обучение переименует её директорию"""
+        failed_version = None
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                version = self.target_version()
+                if version is None or version == self.model_version or version == failed_version:
+                    continue
+                logger.info(f"🔄 New model version detected: {version}")
+                if not await self.reload_model(version):
+                    # Не пытаемся грузить битую версию каждые interval секунд
+                    failed_version = version
+            except Exception as e:
+                logger.error(f"Model watcher error: {e}")
 
     def categorize(
         self,
@@ -67,47 +262,151 @@ class MLCategorizationService:
         Returns:
             (category, confidence, alternatives)
         """
-        if not self.is_loaded:
+        results, _ = self.categorize_many_versioned([{
+            "description": description,
+            "amount": amount,
+            "merchant_name": merchant_name,
+            "items": items,
+        }])
+        category, confidence, _alternatives = results[0]
+        logger.info(f"Categorized '{description}' as '{category}' with confidence {confidence:.2f}")
+        return results[0]
+
+    def categorize_many(
+        self,
+        transactions: List[Dict]
+    ) -> List[Tuple[str, float, List[Dict[str, float]]]]:
+        """
+        Пакетная категоризация: одна матрица TF-IDF и один predict_proba на весь пакет
+
+        Args:
+            transactions: Список словарей с ключами description, amount,
+                merchant_name (опционально), items (опционально)
+
+        Returns:
+            Список (category, confidence, alternatives) в порядке входных данных
+        """
+        results, _ = self.categorize_many_versioned(transactions)
+        return results
+
+    def categorize_many_versioned(
+        self,
+        transactions: List[Dict]
+    ) -> Tuple[List[Tuple[str, float, List[Dict[str, float]]]], Optional[str]]:
+        """
+        То же, что categorize_many, плюс версия модели, которая обслужила пакет.
+        Весь пакет считается на одном снимке модели, даже если во время
+        обработки произошла перезагрузка
+
+        Returns:
+            (результаты, версия модели или None, если использовался только fallback)
+        """
+        if not transactions:
+            return [], self.model_version
+
+        state = self._state
+        if state is None:
             logger.warning("Model not loaded, using fallback categorization")
-            return self._fallback_categorization(description, amount)
+            return [
+                self._fallback_categorization(tx["description"], tx["amount"])
+                for tx in transactions
+            ], None
 
-        try:
-            # Объединяем все текстовые данные
-            full_text = description.lower()
-            if merchant_name:
-                full_text += " " + merchant_name.lower()
-            if items:
-                full_text += " " + " ".join(items).lower()
-
-            # Векторизация текста
-            text_vector = self.vectorizer.transform([full_text])
-
-            # Предсказание
-            probabilities = self.model.predict_proba(text_vector)[0]
-            predicted_idx = np.argmax(probabilities)
-            confidence = float(probabilities[predicted_idx])
-
-            # Основная категория
-            category = self.label_encoder.inverse_transform([predicted_idx])[0]
-
-            # Альтернативные категории (топ-3)
-            top_indices = np.argsort(probabilities)[-3:][::-1]
-            alternatives = []
-            for idx in top_indices[1:]:  # Пропускаем первую (основную)
-                alt_category = self.label_encoder.inverse_transform([idx])[0]
-                alt_confidence = float(probabilities[idx])
-                if alt_confidence > 0.05:  # Только если confidence > 5%
-                    alternatives.append({
-                        "category": alt_category,
-                        "confidence": alt_confidence
-                    })
-
-            logger.info(f"Categorized '{description}' as '{category}' with confidence {confidence:.2f}")
-            return category, confidence, alternatives
+        results: List[Tuple[str, float, List[Dict[str, float]]]] = [None] * len(transactions)
 
-        except Exception as e:
-            logger.error(f"Error during categorization: {e}")
-            return self._fallback_categorization(description, amount)
+        # Строки, для которых не удалось собрать текст, уходят в поэлементный fallback
+        texts = []
+        positions = []
+        for i, tx in enumerate(transactions):
+            try:
+                texts.append(self._build_text(tx["description"], tx.get("merchant_name"), tx.get("items")))
+                positions.append(i)
+            except Exception as e:
+                logger.error(f"Error preparing batch item {i}: {e}")
+                results[i] = self._fallback_categorization(str(tx.get("description") or ""), tx.get("amount", 0.0))
+
+        if texts:
+            try:
+                for i, result in zip(positions, self._predict(state, texts)):
+                    results[i] = result
+            except Exception as e:
+                # Пакет упал целиком — повторяем по одной строке, fallback только для тех, что падают и так
+                logger.error(f"Error during batch categorization, retrying items one by one: {e}")
+                for i, text in zip(positions, texts):
+                    try:
+                        results[i] = self._predict(state, [text])[0]
+                    except Exception as item_error:
+                        logger.error(f"Error categorizing batch item {i}, using fallback: {item_error}")
+                        tx = transactions[i]
+                        results[i] = self._fallback_categorization(tx["description"], tx["amount"])
+
+        if len(transactions) > 1:
+            logger.info(f"Categorized batch of {len(transactions)} transactions (model {state.version})")
+        return results, state.version
+
+    def _build_text(
+        self,
+        description: str,
+        merchant_name: str = None,
+        items: List[str] = None
+    ) -> str:
+        """Объединить все текстовые данные транзакции в одну строку для векторизации"""
+        full_text = description.lower()
+        if merchant_name:
+            full_text += " " + merchant_name.lower()
+        if items:
+            full_text += " " + " ".join(items).lower()
+        # Схлопываем пробелы: на токены TF-IDF это не влияет, а ключ кэша становится стабильнее
+        return " ".join(full_text.split())
+
+    def _predict(self, state: _ModelState, texts: List[str]) -> List[Tuple[str, float, List[Dict[str, float]]]]:
+        """
+        Вернуть категорию и топ-3 для каждого текста.
+        Тексты, которых нет в кэше, векторизуются одной матрицей
+        """
+        version = state.version
+        results = [self._cache.get((version, text)) for text in texts]
+
+        missing = list(dict.fromkeys(text for text, result in zip(texts, results) if result is None))
+        if missing:
+            predicted = dict(zip(missing, self._predict_uncached(state, missing)))
+            for text, result in predicted.items():
+                self._cache.set((version, text), result)
+            results = [result if result is not None else predicted[text] for text, result in zip(texts, results)]
+
+        return results
+
+    def cache_stats(self) -> Dict[str, float]:
+        """Статистика кэша предсказаний"""
+        return self._cache.stats()
+
+    @staticmethod
+    def _predict_uncached(state: _ModelState, texts: List[str]) -> List[Tuple[str, float, List[Dict[str, float]]]]:
+        """
+        Векторизовать тексты одной матрицей и вернуть категорию и топ-3 для каждого
+        """
+        text_matrix = state.vectorizer.transform(texts)
+        probabilities = state.model.predict_proba(text_matrix)
+        class_names = state.class_names
+
+        # Топ-3 по каждой строке: argpartition по всей матрице, затем сортировка только 3 столбцов
+        k = min(3, probabilities.shape[1])
+        top_indices = np.argpartition(-probabilities, k - 1, axis=1)[:, :k]
+        top_probs = np.take_along_axis(probabilities, top_indices, axis=1)
+        order = np.argsort(-top_probs, axis=1, kind="stable")
+        top_indices = np.take_along_axis(top_indices, order, axis=1)
+        top_probs = np.take_along_axis(top_probs, order, axis=1)
+
+        results = []
+        for row_indices, row_probs in zip(top_indices, top_probs):
+            # Альтернативные категории: пропускаем первую (основную), только если confidence > 5%
+            alternatives = [
+                {"category": str(class_names[idx]), "confidence": float(prob)}
+                for idx, prob in zip(row_indices[1:], row_probs[1:])
+                if prob > 0.05
+            ]
+            results.append((str(class_names[row_indices[0]]), float(row_probs[0]), alternatives))
+        return results
 
     def _fallback_categorization(
         self,
@@ -116,36 +415,12 @@ class MLCategorizationService:
     ) -> Tuple[str, float, List[Dict[str, float]]]:
         """
         Fallback категоризация на основе ключевых слов
-        Используется когда ML модель недоступна
+        Используется когда ML модель недоступна.
+        При нескольких совпадениях побеждает самое длинное ключевое слово
         """
-        desc_lower = description.lower()
-
-        # Словарь ключевых слов
-        keywords = {
-            "Продукты": ["пятерочка", "магнит", "лента", "дикси", "перекресток", "продукты", "молоко", "хлеб"],
-            "Топливо (АЗС)": ["азс", "лукойл", "роснефть", "газпром", "shell", "бензин", "топливо", "аи-"],
-            "Рестораны и кафе": ["макдональд", "бургер", "kfc", "кофе", "ресторан", "кафе", "пицца", "суши"],
-            "Такси": ["такси", "яндекс.такси", "uber", "gett", "ситимобил"],
-            "Транспорт": ["метро", "тройка", "электричка", "автобус", "проездной"],
-            "Подписки": ["netflix", "spotify", "youtube", "подписка", "яндекс.плюс", "okko"],
-            "Аптека": ["аптека", "лекарство", "ригла", "36.6", "медикамент"],
-            "Интернет и связь": ["мтс", "билайн", "мегафон", "ростелеком", "интернет", "связь", "телефон"],
-            "Одежда и обувь": ["ozon одежда", "wildberries", "zara", "h&m", "одежда", "обувь", "кроссовки"],
-            "Спорт и фитнес": ["спортмастер", "фитнес", "worldclass", "бассейн", "тренажер"],
-            "Развлечения": ["кино", "театр", "концерт", "музей", "парк", "аттракцион"],
-            "Дом и ремонт": ["леруа", "ikea", "obi", "ремонт", "мебель", "инструмент"],
-            "Электроника": ["dns", "м.видео", "связной", "эльдорадо", "ноутбук", "телефон", "наушники"],
-            "Образование": ["курс", "университет", "учебник", "книга", "образование"],
-            "Коммунальные услуги": ["жкх", "коммунальные", "электричество", "вода", "газ"],
-            "Путешествия": ["booking", "aviasales", "билет", "отель", "путешеств"],
-            "Красота и здоровье": ["летуаль", "косметика", "салон", "маникюр", "парфюм"],
-        }
-
-        # Поиск совпадений
-        for category, words in keywords.items():
-            for word in words:
-                if word in desc_lower:
-                    return category, 0.70, [{"category": "Прочее", "confidence": 0.20}]
+        category = self._fallback_matcher.match(description)
+        if category is not None:
+            return category, 0.70, [{"category": "Прочее", "confidence": 0.20}]
 
         # Default fallback
         return "Прочее", 0.30, []
@@ -0,0 +1,105 @@
+"""
+Кэш результатов OCR чеков, адресуемый по содержимому изображения.
+
+Ключ — SHA-256 декодированных байт изображения, поэтому повторная загрузка
+того же фото (ретрай, двойное нажатие, повторная синхронизация клиента)
+не запускает предобработку и Tesseract заново.
+
+Уровни:
+1. LRU в памяти процесса (ограничен по размеру, с TTL)
+2. Redis (опционально) — общий для всех uvicorn воркеров
+"""
+import hashlib
+import json
+from typing import Optional
+
+from loguru import logger
+
+from app.config import settings
+from app.utils.lru_cache import LRUCache
+
+
+_REDIS_KEY_PREFIX = "ocr:v1:"
+
+
+class OCRResultCache:
+    """Двухуровневый кэш результатов OCR"""
+
+    def __init__(self):
+        self.local = LRUCache(
+            maxsize=settings.OCR_CACHE_MAX_ITEMS,
+            ttl_seconds=settings.OCR_CACHE_TTL_SECONDS,
+        )
+        self._redis = None
+        self.shared_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(image_bytes: bytes) -> str:
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    async def connect(self):
+        """Подключить общий уровень (Redis), если он включён и доступен"""
+        if not settings.OCR_CACHE_SHARED:
+            return
+        try:
+            import redis.asyncio as redis
+
+            client = redis.from_url(settings.REDIS_URL)
+            await client.ping()
+            self._redis = client
+            logger.info("OCR cache: shared Redis tier enabled")
+        except Exception as e:
+            self._redis = None
+            logger.warning(f"OCR cache: Redis unavailable, using in-process tier only ({e})")
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def get(self, key: str) -> Optional[dict]:
+        result = self.local.get(key)
+        if result is not None:
+            return result
+
+        if self._redis is not None:
+            try:
+                payload = await self._redis.get(_REDIS_KEY_PREFIX + key)
+            except Exception as e:
+                logger.warning(f"OCR cache: Redis get failed: {e}")
+                payload = None
+            if payload is not None:
+                result = json.loads(payload)
+                self.local.set(key, result)
+                self.shared_hits += 1
+                return result
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, result: dict):
+        self.local.set(key, result)
+        if self._redis is not None:
+            try:
+                await self._redis.set(
+                    _REDIS_KEY_PREFIX + key,
+                    json.dumps(result, ensure_ascii=False),
+                    ex=settings.OCR_CACHE_TTL_SECONDS,
+                )
+            except Exception as e:
+                logger.warning(f"OCR cache: Redis set failed: {e}")
+
+    def stats(self) -> dict:
+        total = self.local.hits + self.shared_hits + self.misses
+        return {
+            "local": self.local.stats(),
+            "shared_enabled": self._redis is not None,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.local.hits + self.shared_hits) / total, 4) if total else 0.0,
+        }
+
+
+# Singleton instance
+ocr_cache = OCRResultCache()
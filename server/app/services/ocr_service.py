@@ -1,21 +1,36 @@
 """
 Сервис OCR распознавания текста с чеков.
 
-Использует pytesseract (Tesseract OCR) с предобработкой изображений.
-После извлечения текста парсит структурированные данные чека:
+Использует Tesseract OCR с предобработкой изображений. В воркерах OCR
+пула — tesserocr (зависимость из requirements.txt): языковые модели
+загружаются один раз при старте процесса, а не на каждый вызов. Без
+tesserocr (нет libtesseract) работает pytesseract: каждый вызов — новый
+процесс tesseract с загрузкой моделей, и пул только изолирует и
+перезапускает работу. Сравнение: scripts/bench_ocr_engines.py.
+Длинные чеки (выше OCR_STRIP_MIN_HEIGHT) режутся на горизонтальные полосы
+по пустым строкам; полосы распознаются параллельно в потоках воркера,
+а текст склеивается с удалением строк, повторённых в перекрытии.
+После извлечения текста парсит структурированные данные чека (receipt_parser):
 - Итоговая сумма
 - Дата
 - Название магазина
 - Список товаров
 """
-import re
-from datetime import datetime
-from typing import Optional
+import difflib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 
+import cv2
+import numpy as np
 import pytesseract
+from PIL import Image
 from loguru import logger
 
+from app.config import settings
 from app.services.image_preprocessing_service import image_preprocessing_service
+from app.services.receipt_parser import receipt_parser
 
 
 # Конфигурация Tesseract для чеков:
@@ -24,181 +39,236 @@ from app.services.image_preprocessing_service import image_preprocessing_service
 TESSERACT_CONFIG = "--psm 6 --oem 3"
 TESSERACT_LANG = "rus+eng"
 
+# Строка считается пустой, если тёмных пикселей в ней не больше этой доли ширины
+_BLANK_ROW_INK = 0.002
+
+
+def _normalize_line(line: str) -> str:
+    """Строка для сравнения перекрытия полос: без лишних пробелов и регистра"""
+    return " ".join(line.split()).lower()
+
 
 class OCRService:
     """Сервис распознавания текста с чеков"""
 
-    def recognize(self, image_base64: str) -> dict:
+    def __init__(self):
+        # tesserocr.PyTessBaseAPI с загруженными моделями (только после warm_up)
+        self._tess_api = None
+        # Для полос: свой экземпляр API в каждом потоке (API не потокобезопасен)
+        self._thread_local = threading.local()
+        self._strip_executor: Optional[ThreadPoolExecutor] = None
+
+    def warm_up(self) -> str:
+        """
+        Загрузить языковые модели Tesseract заранее (вызывается в воркере OCR пула).
+
+        Returns:
+            Название используемого движка: "tesserocr" или "pytesseract"
+        """
+        try:
+            import tesserocr
+        except ImportError:
+            # Без tesserocr каждый вызов запускает процесс tesseract — проверяем, что он доступен
+            pytesseract.get_tesseract_version()
+            logger.warning("tesserocr is not installed: Tesseract models will be loaded on every OCR call")
+            return "pytesseract"
+
+        self._tess_api = self._create_tess_api()
+        return "tesserocr"
+
+    @staticmethod
+    def _create_tess_api():
+        import tesserocr
+
+        return tesserocr.PyTessBaseAPI(
+            lang=TESSERACT_LANG,
+            psm=tesserocr.PSM.SINGLE_BLOCK,
+            oem=tesserocr.OEM.DEFAULT,
+        )
+
+    def recognize(self, image_base64: str, timeout: float = 0) -> dict:
         """
         Полный pipeline: предобработка → OCR → парсинг.
 
+        Args:
+            image_base64: Изображение чека в base64
+            timeout: Ограничение времени распознавания Tesseract в секундах (0 — без ограничения)
+
         Returns:
-            dict с полями: raw_text, total, date, retailer, items
+            dict с полями: raw_text, total, date, retailer, items,
+            preprocessing (выбранные стадии), timings_ms (время стадий)
+        """
+        image_bytes = image_preprocessing_service.decode_base64(image_base64)
+        return self.recognize_bytes(image_bytes, timeout=timeout)
+
+    def recognize_bytes(self, image_bytes: bytes, timeout: float = 0) -> dict:
+        """
+        То же, что recognize, но из байт файла изображения (JPEG/PNG).
         """
         # 1. Предобработка изображения
         logger.info("Starting image preprocessing...")
-        pil_image = image_preprocessing_service.preprocess_to_pil(image_base64)
+        processed, report = image_preprocessing_service.preprocess_with_report(image_bytes)
+        timings = report.pop("timings_ms")
+        report.pop("total_ms")
 
-        # 2. OCR
+        # 2. OCR (длинный чек — параллельно по полосам)
         logger.info("Running Tesseract OCR...")
-        raw_text = pytesseract.image_to_string(
-            pil_image,
-            lang=TESSERACT_LANG,
-            config=TESSERACT_CONFIG,
-        )
+        started = time.perf_counter()
+        strips = self._split_strips(processed)
+        if len(strips) > 1:
+            raw_text = self._strips_to_text(processed, strips, timeout)
+        else:
+            raw_text = self._image_to_text(Image.fromarray(processed), timeout)
+        timings["ocr"] = round((time.perf_counter() - started) * 1000, 2)
+        report["strips"] = len(strips)
         logger.debug(f"OCR raw text ({len(raw_text)} chars):\n{raw_text[:500]}")
 
         # 3. Парсинг структурированных данных
+        started = time.perf_counter()
         result = self._parse_receipt(raw_text)
+        timings["parse"] = round((time.perf_counter() - started) * 1000, 2)
+
+        logger.info(f"Receipt recognized: {report}, timings (ms): {timings}")
         result["raw_text"] = raw_text
+        result["preprocessing"] = report
+        result["timings_ms"] = timings
         return result
 
-    # ------------------------------------------------------------------
-    # Парсинг чека
-    # ------------------------------------------------------------------
+    def _image_to_text(self, pil_image, timeout: float = 0, tess_api=None) -> str:
+        """Распознать текст на изображении прогретым tesserocr или через pytesseract."""
+        tess_api = tess_api or self._tess_api
+        if tess_api is not None:
+            tess_api.SetImage(pil_image)
+            # timeout в tesserocr задаётся в миллисекундах
+            if not tess_api.Recognize(timeout=int(timeout * 1000)):
+                raise TimeoutError("Tesseract recognition timed out")
+            return tess_api.GetUTF8Text()
 
-    def _parse_receipt(self, text: str) -> dict:
-        """Извлечь структурированные данные из текста чека."""
-        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        try:
+            return pytesseract.image_to_string(
+                pil_image,
+                lang=TESSERACT_LANG,
+                config=TESSERACT_CONFIG,
+                timeout=timeout,
+            )
+        except RuntimeError as e:
+            # pytesseract сообщает о таймауте как RuntimeError("Tesseract process timeout")
+            if "timeout" in str(e).lower():
+                raise TimeoutError("Tesseract recognition timed out") from e
+            raise
 
-        return {
-            "total": self._extract_total(lines),
-            "date": self._extract_date(lines),
-            "retailer": self._extract_retailer(lines),
-            "items": self._extract_items(lines),
-        }
+    # ------------------------------------------------------------------
+    # OCR по полосам
+    # ------------------------------------------------------------------
 
-    def _extract_total(self, lines: list[str]) -> Optional[float]:
-        """
-        Найти итоговую сумму чека.
-        Паттерны: ИТОГО, ИТОГ, СУММА, TOTAL, К ОПЛАТЕ
-        """
-        total_patterns = [
-            r"(?:итого|итог|к\s*оплате|сумма|total)[:\s]+(\d+[\.,]\d{2})",
-            r"(?:итого|итог|к\s*оплате|сумма|total)[:\s]+(\d+)",
-        ]
-        for line in reversed(lines):  # Итог обычно в конце чека
-            line_lower = line.lower()
-            for pattern in total_patterns:
-                match = re.search(pattern, line_lower)
-                if match:
-                    amount_str = match.group(1).replace(",", ".")
-                    try:
-                        return float(amount_str)
-                    except ValueError:
-                        continue
-
-        # Fallback: ищем самую большую сумму в чеке
-        amounts = self._find_all_amounts(lines)
-        return max(amounts) if amounts else None
-
-    def _extract_date(self, lines: list[str]) -> Optional[str]:
+    def _split_strips(self, img: np.ndarray) -> List[Tuple[int, int, bool]]:
         """
-        Найти дату в чеке.
-        Форматы: DD.MM.YYYY, DD/MM/YYYY, YYYY-MM-DD
-        """
-        date_patterns = [
-            r"(\d{2}[./]\d{2}[./]\d{4})",   # DD.MM.YYYY
-            r"(\d{4}[-./]\d{2}[-./]\d{2})",  # YYYY-MM-DD
-            r"(\d{2}[./]\d{2}[./]\d{2})",    # DD.MM.YY
-        ]
-        for line in lines:
-            for pattern in date_patterns:
-                match = re.search(pattern, line)
-                if match:
-                    date_str = match.group(1)
-                    parsed = self._parse_date(date_str)
-                    if parsed:
-                        return parsed
-        return None
-
-    def _extract_retailer(self, lines: list[str]) -> Optional[str]:
-        """
-        Извлечь название магазина.
-        Обычно находится в первых 3-5 строках чека.
-        """
-        known_retailers = [
-            "пятёрочка", "пятерочка", "магнит", "лента", "перекрёсток",
-            "перекресток", "дикси", "ашан", "metro", "spar", "окей",
-            "вкусвилл", "Fix Price", "wildberries", "ozon", "яндекс",
-            "kfc", "макдональдс", "бургер кинг", "subway", "coffee",
-        ]
-        # Проверяем первые 5 строк
-        for line in lines[:5]:
-            line_lower = line.lower()
-            for retailer in known_retailers:
-                if retailer.lower() in line_lower:
-                    return line.strip()
-            # Берём первую непустую строку как название магазина
-            if len(line) > 3:
-                return line.strip()
-        return None
-
-    def _extract_items(self, lines: list[str]) -> list[dict]:
-        """
-        Извлечь позиции товаров из чека.
-        Формат строки товара: "Название ... цена"
+        Разбить бинарное изображение на горизонтальные полосы
+        (top, bottom, перекрывается ли текст с предыдущей полосой).
+
+        Разрез ищется в пустой полосе строк около каждых OCR_STRIP_HEIGHT px;
+        тогда полосы граничат по пустому месту и строка текста не режется.
+        Если пустых строк рядом нет, полосы перекрываются на OCR_STRIP_OVERLAP px,
+        а повторённые строки убираются при склейке
         """
-        items = []
-        # Паттерн: строка с суммой в конце (цена товара)
-        item_pattern = re.compile(
-            r"^(.+?)\s+(\d+[\.,]\d{2})\s*$"
-        )
-        # Ключевые слова, которые не являются товарами
-        skip_keywords = {
-            "итого", "итог", "сумма", "к оплате", "наличные",
-            "безналичные", "сдача", "скидка", "nds", "ндс",
-            "total", "cash", "change", "discount",
-        }
-
-        for line in lines:
-            line_lower = line.lower()
-            if any(kw in line_lower for kw in skip_keywords):
+        h, w = img.shape[:2]
+        if not settings.OCR_STRIP_MIN_HEIGHT or h < settings.OCR_STRIP_MIN_HEIGHT or settings.OCR_STRIP_THREADS < 2:
+            return [(0, h, False)]
+
+        # Сумма по строкам без копии изображения: у пустой строки она близка к 255 * w
+        row_sums = cv2.reduce(img, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+        ink = w - row_sums / 255.0
+        blank = ink <= max(1.0, w * _BLANK_ROW_INK)
+
+        strip_height = settings.OCR_STRIP_HEIGHT
+        overlap = settings.OCR_STRIP_OVERLAP
+        window = strip_height // 3
+
+        strips = []
+        top = 0
+        overlaps = False
+        while h - top > strip_height + window:
+            target = top + strip_height
+            gap = self._nearest_gap(blank, target - window, target + window, target)
+            if gap is not None:
+                gap_top, gap_bottom = gap
+                strips.append((top, gap_bottom, overlaps))
+                top, overlaps = gap_top, False
+            else:
+                strips.append((top, min(h, target + overlap), overlaps))
+                top, overlaps = max(0, target - overlap), True
+        strips.append((top, h, overlaps))
+        return strips
+
+    @staticmethod
+    def _nearest_gap(blank: np.ndarray, start: int, stop: int, target: int) -> Optional[Tuple[int, int]]:
+        """Пустая полоса строк в [start, stop), ближайшая к target (не короче 3 строк)"""
+        best = None
+        y = start
+        while y < stop:
+            if not blank[y]:
+                y += 1
                 continue
+            gap_top = y
+            while y < stop and blank[y]:
+                y += 1
+            if y - gap_top >= 3:
+                distance = abs((gap_top + y) // 2 - target)
+                if best is None or distance < best[0]:
+                    best = (distance, gap_top, y)
+        return (best[1], best[2]) if best else None
+
+    def _strips_to_text(self, img: np.ndarray, strips: List[Tuple[int, int, bool]], timeout: float) -> str:
+        """Распознать полосы параллельно и склеить текст по порядку"""
+        if self._strip_executor is None:
+            self._strip_executor = ThreadPoolExecutor(
+                max_workers=settings.OCR_STRIP_THREADS, thread_name_prefix="ocr-strip"
+            )
+
+        # Полос больше, чем потоков, — они идут волнами; таймаут делится, чтобы
+        # весь чек уложился в таймаут задачи пула
+        waves = -(-len(strips) // settings.OCR_STRIP_THREADS)
+        strip_timeout = timeout / waves if timeout else 0
 
-            match = item_pattern.match(line)
-            if match:
-                name = match.group(1).strip()
-                price_str = match.group(2).replace(",", ".")
-                try:
-                    price = float(price_str)
-                    if price > 0 and len(name) > 2:
-                        items.append({"name": name, "sum": price})
-                except ValueError:
-                    continue
+        def recognize(strip):
+            top, bottom, _overlaps = strip
+            # tesserocr: свой API на поток; pytesseract: отдельный процесс tesseract на вызов
+            tess_api = None
+            if self._tess_api is not None:
+                tess_api = getattr(self._thread_local, "tess_api", None)
+                if tess_api is None:
+                    tess_api = self._thread_local.tess_api = self._create_tess_api()
+            return self._image_to_text(Image.fromarray(img[top:bottom]), strip_timeout, tess_api)
 
-        return items
+        texts = list(self._strip_executor.map(recognize, strips))
+        logger.debug(f"OCR by strips: {strips}")
+
+        # Дубли возможны только там, где полосы перекрываются текстом; при разрезе
+        # по пустому месту одинаковые строки подряд — настоящие позиции чека
+        lines: List[str] = []
+        for (_top, _bottom, overlaps), text in zip(strips, texts):
+            strip_lines = [line for line in text.splitlines() if line.strip()]
+            lines.extend(self._drop_overlap(lines, strip_lines) if overlaps else strip_lines)
+        return "\n".join(lines)
+
+    @staticmethod
+    def _drop_overlap(previous: List[str], current: List[str], max_lines: int = 4) -> List[str]:
+        """Убрать из начала current строки, которые повторяют конец previous"""
+        for size in range(min(max_lines, len(previous), len(current)), 0, -1):
+            if all(
+                difflib.SequenceMatcher(None, _normalize_line(a), _normalize_line(b)).ratio() >= 0.8
+                for a, b in zip(previous[-size:], current[:size])
+            ):
+                return current[size:]
+        return current
 
     # ------------------------------------------------------------------
-    # Вспомогательные методы
+    # Парсинг чека
     # ------------------------------------------------------------------
 
-    def _find_all_amounts(self, lines: list[str]) -> list[float]:
-        """Найти все числовые суммы в тексте."""
-        pattern = re.compile(r"\b(\d{1,6}[.,]\d{2})\b")
-        amounts = []
-        for line in lines:
-            for match in pattern.finditer(line):
-                try:
-                    amounts.append(float(match.group(1).replace(",", ".")))
-                except ValueError:
-                    continue
-        return amounts
-
-    def _parse_date(self, date_str: str) -> Optional[str]:
-        """Попытаться распарсить дату в ISO формат."""
-        formats = [
-            "%d.%m.%Y", "%d/%m/%Y",
-            "%Y-%m-%d", "%Y.%m.%d",
-            "%d.%m.%y", "%d/%m/%y",
-        ]
-        for fmt in formats:
-            try:
-                dt = datetime.strptime(date_str, fmt)
-                return dt.strftime("%Y-%m-%d")
-            except ValueError:
-                continue
-        return None
+    def _parse_receipt(self, text: str) -> dict:
+        """Извлечь структурированные данные из текста чека (один проход, см. receipt_parser)."""
+        return receipt_parser.parse(text)
 
 
 # Singleton instance
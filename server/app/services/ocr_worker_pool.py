@@ -0,0 +1,283 @@
+"""
+Пул долгоживущих процессов для OCR чеков.
+
+- Каждый воркер при старте прогревает Tesseract (OCRService.warm_up):
+  языковые модели rus+eng загружаются один раз, а не на каждый чек
+- Один процесс на слот: задача занимает свободный слот, очередь — ожидание
+  слота в event loop
+- Таймаут на задачу: Tesseract прерывается внутри воркера (TimeoutError),
+  а если воркер завис целиком (например, в предобработке) — пересоздаётся
+  только процесс этого слота, задачи в остальных слотах не затрагиваются.
+  Клиенту в обоих случаях — TimeoutError (504)
+- Остановка и запуск процессов — в пуле потоков, не в event loop.
+  В очередь свободных возвращается только слот с живым процессом: если
+  клиент ушёл, слот вернётся, когда задача в воркере завершится (или
+  воркер будет пересоздан по таймауту); неудачный перезапуск повторяется
+  в фоне
+- Воркер пересоздаётся после OCR_POOL_MAX_JOBS_PER_WORKER задач,
+  чтобы ограничить рост памяти
+- Ограниченная очередь: при переполнении — ExecutorOverloadedError (503)
+- Статистика: глубина очереди, занятость воркеров, счётчики задач,
+  среднее время стадий предобработки и OCR
+"""
+import asyncio
+import multiprocessing
+import multiprocessing.pool
+import time
+from typing import Optional
+
+from loguru import logger
+
+from app.config import settings
+from app.services.executor_service import ExecutorOverloadedError
+
+
+# Запас поверх таймаута Tesseract на предобработку и парсинг
+_JOB_TIMEOUT_GRACE_SECONDS = 5.0
+# Пауза между попытками поднять воркер, если запуск процесса не удался
+_RESTART_RETRY_SECONDS = 5.0
+
+
+def _init_worker():
+    """Инициализация процесса-воркера: прогрев Tesseract."""
+    from app.services.ocr_service import ocr_service
+
+    name = multiprocessing.current_process().name
+    try:
+        engine = ocr_service.warm_up()
+        logger.info(f"OCR worker {name} ready (engine: {engine})")
+    except Exception as e:
+        # Исключение в initializer заставило бы Pool бесконечно пересоздавать воркер;
+        # ошибка всё равно проявится в задаче и вернётся клиенту
+        logger.error(f"OCR worker {name} warm-up failed: {e}")
+
+
+def _run_job(image_bytes: bytes, timeout: float) -> tuple[dict, float]:
+    """Выполнить OCR в воркере. Возвращает результат и время работы воркера."""
+    from app.services.ocr_service import ocr_service
+
+    started = time.perf_counter()
+    result = ocr_service.recognize_bytes(image_bytes, timeout=timeout)
+    return result, time.perf_counter() - started
+
+
+class _WorkerSlot:
+    """Слот пула: один процесс-воркер (Pool из одного процесса ради maxtasksperchild)"""
+
+    def __init__(self, index: int, max_jobs: int):
+        self.index = index
+        self.max_jobs = max_jobs
+        self.pool: Optional[multiprocessing.pool.Pool] = None
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        self.pool = context.Pool(
+            processes=1,
+            initializer=_init_worker,
+            maxtasksperchild=self.max_jobs or None,
+        )
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    @property
+    def alive(self) -> bool:
+        return self.pool is not None
+
+
+class OCRWorkerPool:
+    """Пул процессов с прогретым Tesseract"""
+
+    def __init__(self):
+        self.workers = settings.OCR_POOL_WORKERS
+        self.max_queue = settings.OCR_POOL_MAX_QUEUE
+        self.job_timeout = settings.OCR_POOL_JOB_TIMEOUT_SECONDS
+        self.max_jobs_per_worker = settings.OCR_POOL_MAX_JOBS_PER_WORKER
+
+        self._slots: list[_WorkerSlot] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._pending: set[asyncio.Future] = set()
+        # Фоновые задачи возврата слотов (ссылки, чтобы задачи не собрал GC)
+        self._background: set[asyncio.Task] = set()
+        self._started_at = time.monotonic()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.restarts = 0
+        self._busy_seconds = 0.0
+        # Суммарное время стадий (timings_ms из результатов воркеров)
+        self._stage_ms: dict[str, float] = {}
+
+    def start(self):
+        """Запустить воркеры (spawn: безопасно для процесса с потоками и event loop)"""
+        if self._slots:
+            return
+        self._slots = [_WorkerSlot(index, self.max_jobs_per_worker) for index in range(self.workers)]
+        self._idle = asyncio.Queue()
+        for slot in self._slots:
+            slot.start()
+            self._idle.put_nowait(slot)
+        self._started_at = time.monotonic()
+        self._busy_seconds = 0.0
+        logger.info(
+            f"OCR worker pool started: workers={self.workers}, "
+            f"max_queue={self.max_queue}, job_timeout={self.job_timeout}s"
+        )
+
+    async def shutdown(self):
+        if not self._slots:
+            return
+        slots, self._slots, self._idle = self._slots, [], None
+        for task in self._background:
+            task.cancel()
+        # Задачи, которые выполнялись в остановленных воркерах, уже не завершатся
+        for future in self._pending:
+            if not future.done():
+                future.set_exception(RuntimeError("OCR worker pool is shutting down"))
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(None, slot.stop) for slot in slots))
+
+    async def _recycle(self, slot: _WorkerSlot):
+        """Убить зависший воркер слота и поднять новый; остальные слоты продолжают работу"""
+        logger.warning(f"Restarting OCR worker slot {slot.index}")
+        self.restarts += 1
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, slot.restart)
+        except Exception as e:
+            logger.error(f"OCR worker slot {slot.index} failed to restart: {e}")
+
+    def _release(self, slot: _WorkerSlot, idle: asyncio.Queue):
+        """Вернуть слот в очередь свободных; слот без процесса — сначала поднять в фоне"""
+        if idle is not self._idle:
+            return  # пул остановлен
+        if slot.alive:
+            idle.put_nowait(slot)
+        else:
+            self._spawn(self._revive(slot, idle))
+
+    def _spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _revive(self, slot: _WorkerSlot, idle: asyncio.Queue):
+        """Повторять запуск воркера слота, пока он не поднимется"""
+        while not slot.alive and idle is self._idle:
+            await asyncio.sleep(_RESTART_RETRY_SECONDS)
+            await self._recycle(slot)
+        self._release(slot, idle)
+
+    async def _release_after(self, slot: _WorkerSlot, idle: asyncio.Queue, job_done: asyncio.Future):
+        """Клиент ушёл, а задача ещё в воркере: вернуть слот после неё, зависший воркер — пересоздать"""
+        try:
+            await asyncio.wait_for(job_done, timeout=self.job_timeout + _JOB_TIMEOUT_GRACE_SECONDS)
+        except asyncio.TimeoutError:
+            if idle is not self._idle:
+                return
+            self.timed_out += 1
+            await self._recycle(slot)
+        self._release(slot, idle)
+
+    async def recognize(self, image_bytes: bytes) -> dict:
+        """Распознать чек (байты файла изображения) в одном из воркеров пула"""
+        if self.in_flight >= self.workers + self.max_queue:
+            raise ExecutorOverloadedError("ocr", settings.EXECUTOR_RETRY_AFTER_SECONDS)
+        if not self._slots:
+            self.start()
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # Завершение задачи в воркере — независимо от того, ждёт ли её ещё клиент
+        job_done = loop.create_future()
+
+        def on_done(value):
+            loop.call_soon_threadsafe(_resolve, future, value, None)
+            loop.call_soon_threadsafe(_resolve, job_done, None, None)
+
+        def on_error(exc):
+            loop.call_soon_threadsafe(_resolve, future, None, exc)
+            loop.call_soon_threadsafe(_resolve, job_done, None, None)
+
+        self.in_flight += 1
+        self._pending.add(future)
+        idle = self._idle
+        slot = None
+        try:
+            # Очередь — ожидание свободного слота; таймаут отсчитывается с начала выполнения
+            slot = await idle.get()
+            slot.pool.apply_async(
+                _run_job,
+                (image_bytes, self.job_timeout),
+                callback=on_done,
+                error_callback=on_error,
+            )
+            result, busy_seconds = await asyncio.wait_for(
+                future, timeout=self.job_timeout + _JOB_TIMEOUT_GRACE_SECONDS
+            )
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            if not future.cancelled():
+                # Tesseract прерван внутри воркера, воркер исправен
+                raise
+            # wait_for отменил ожидание: воркер завис
+            await self._recycle(slot)
+            raise TimeoutError(f"OCR job exceeded {self.job_timeout}s")
+        except asyncio.CancelledError:
+            # Клиент ушёл: воркер ещё занят его задачей — слот вернётся после неё
+            if slot is not None and not job_done.done():
+                self._spawn(self._release_after(slot, idle, job_done))
+                slot = None
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._pending.discard(future)
+            if slot is not None:
+                self._release(slot, idle)
+
+        self.completed += 1
+        self._busy_seconds += busy_seconds
+        for stage, ms in result.get("timings_ms", {}).items():
+            self._stage_ms[stage] = self._stage_ms.get(stage, 0.0) + ms
+        return result
+
+    def stats(self) -> dict:
+        uptime = max(time.monotonic() - self._started_at, 1e-9)
+        busy = self.workers - self._idle.qsize() if self._idle is not None else 0
+        return {
+            "workers": self.workers,
+            "busy_workers": busy,
+            "queue_depth": max(0, self.in_flight - busy),
+            "max_queue": self.max_queue,
+            "utilization": round(min(self._busy_seconds / (uptime * self.workers), 1.0), 4),
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "restarts": self.restarts,
+            "stage_avg_ms": {
+                stage: round(total / self.completed, 2) for stage, total in self._stage_ms.items()
+            } if self.completed else {},
+        }
+
+
+def _resolve(future: asyncio.Future, value, exc: Optional[BaseException]):
+    if future.done():
+        return
+    if exc is not None:
+        future.set_exception(exc)
+    else:
+        future.set_result(value)
+
+
+# Singleton instance
+ocr_worker_pool = OCRWorkerPool()
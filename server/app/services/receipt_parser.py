@@ -0,0 +1,167 @@
+"""
+Парсер текста чека после OCR: итоговая сумма, дата, магазин, позиции.
+
+Строки чека классифицируются за один проход: каждая строка приводится к
+нижнему регистру один раз и проверяется заранее скомпилированными
+выражениями; дорогие выражения (итог, дата) запускаются только на строках,
+где сработала быстрая подсказка (_TOTAL_HINT_RE, _DATE_HINT_RE).
+Результат совпадает с прежним разбором четырьмя отдельными проходами:
+- итог — последняя строка с ключевым словом (ИТОГО, СУММА, К ОПЛАТЕ...),
+  иначе максимальная сумма в чеке
+- дата — первая строка с датой, которую удалось распарсить
+- магазин — первая строка среди первых пяти с известной сетью или длиннее 3 символов
+- позиции — строки "название ... цена" без служебных ключевых слов
+
+PARSER_VERSION увеличивается при любом изменении результата разбора:
+по нему scripts/reparse_receipts.py находит устаревшие записи.
+"""
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Optional
+
+
+PARSER_VERSION = 2
+
+_TOTAL_KEYWORDS = r"(?:итого|итог|к\s*оплате|сумма|total)[:\s]+"
+# Быстрая проверка, есть ли в строке ключевое слово итога
+_TOTAL_HINT_RE = re.compile(r"итог|к\s*оплате|сумма|total")
+# Сначала сумма с копейками, затем целая — порядок как в прежнем разборе
+_TOTAL_PATTERNS = (
+    re.compile(_TOTAL_KEYWORDS + r"(\d+[\.,]\d{2})"),
+    re.compile(_TOTAL_KEYWORDS + r"(\d+)"),
+)
+
+_DATE_PATTERNS = (
+    re.compile(r"(\d{2}[./]\d{2}[./]\d{4})"),   # DD.MM.YYYY
+    re.compile(r"(\d{4}[-./]\d{2}[-./]\d{2})"),  # YYYY-MM-DD
+    re.compile(r"(\d{2}[./]\d{2}[./]\d{2})"),    # DD.MM.YY
+)
+# Совпадает везде, где совпадает хотя бы один из _DATE_PATTERNS
+_DATE_HINT_RE = re.compile(r"\d{2}[./]\d{2}[./]\d{2}|\d{4}[-./]\d{2}[-./]\d{2}")
+_DATE_FORMATS = (
+    "%d.%m.%Y", "%d/%m/%Y",
+    "%Y-%m-%d", "%Y.%m.%d",
+    "%d.%m.%y", "%d/%m/%y",
+)
+
+_KNOWN_RETAILERS = (
+    "пятёрочка", "пятерочка", "магнит", "лента", "перекрёсток",
+    "перекресток", "дикси", "ашан", "metro", "spar", "окей",
+    "вкусвилл", "fix price", "wildberries", "ozon", "яндекс",
+    "kfc", "макдональдс", "бургер кинг", "subway", "coffee",
+)
+_RETAILER_RE = re.compile("|".join(map(re.escape, _KNOWN_RETAILERS)))
+# Магазин ищется только в шапке чека
+_RETAILER_MAX_LINE = 5
+
+# Строка с суммой в конце — позиция товара
+_ITEM_RE = re.compile(r"(.+?)\s+(\d+[\.,]\d{2})\s*$")
+# Ключевые слова, которые не являются товарами
+_SKIP_KEYWORDS = (
+    "итого", "итог", "сумма", "к оплате", "наличные",
+    "безналичные", "сдача", "скидка", "nds", "ндс",
+    "total", "cash", "change", "discount",
+)
+_SKIP_RE = re.compile("|".join(map(re.escape, _SKIP_KEYWORDS)))
+
+_AMOUNT_RE = re.compile(r"\b(\d{1,6}[.,]\d{2})\b")
+
+
+class ReceiptParser:
+    """Разбор текста чека: один проход по строкам со скомпилированными выражениями"""
+
+    def parse(self, text: str) -> dict:
+        """
+        Извлечь структурированные данные из текста чека.
+
+        Returns:
+            dict с полями: total, date, retailer, items
+        """
+        total, date, retailer, items = self.parse_lines(
+            [line.strip() for line in text.splitlines() if line.strip()]
+        )
+        return {
+            "total": total,
+            "date": date,
+            "retailer": retailer,
+            "items": items,
+        }
+
+    def parse_lines(self, lines: List[str]):
+        """
+        Разбор непустых строк чека за один проход.
+
+        Returns:
+            (total, date, retailer, items)
+        """
+        total, date, retailer, items = None, None, None, []
+
+        for index, line in enumerate(lines):
+            line_lower = line.lower()
+
+            if retailer is None and index < _RETAILER_MAX_LINE:
+                if len(line) > 3 or _RETAILER_RE.search(line_lower):
+                    retailer = line
+
+            if date is None and _DATE_HINT_RE.search(line):
+                date = self._match_date(line)
+
+            # Строка итога: побеждает последняя (итог обычно в конце чека)
+            if _TOTAL_HINT_RE.search(line_lower):
+                line_total = self._match_total(line_lower)
+                if line_total is not None:
+                    total = line_total
+
+            match = _ITEM_RE.match(line)
+            # Служебные строки (итог, оплата, скидка) — не товары
+            if match is not None and not _SKIP_RE.search(line_lower):
+                name = match.group(1).strip()
+                price = float(match.group(2).replace(",", "."))
+                if price > 0 and len(name) > 2:
+                    items.append({"name": name, "sum": price})
+
+        if total is None:
+            # Fallback: самая большая сумма в чеке (дополнительный проход только без строки итога)
+            amounts = [
+                float(amount.replace(",", "."))
+                for line in lines for amount in _AMOUNT_RE.findall(line)
+            ]
+            if amounts:
+                total = max(amounts)
+
+        return total, date, retailer, items
+
+    @staticmethod
+    def _match_total(line_lower: str) -> Optional[float]:
+        """Сумма итога в строке (сначала с копейками, затем целая)"""
+        for pattern in _TOTAL_PATTERNS:
+            match = pattern.search(line_lower)
+            if match:
+                return float(match.group(1).replace(",", "."))
+        return None
+
+    def _match_date(self, line: str) -> Optional[str]:
+        """Первая распознаваемая дата в строке (форматы по порядку приоритета)"""
+        for pattern in _DATE_PATTERNS:
+            match = pattern.search(line)
+            if match:
+                parsed = self.parse_date(match.group(1))
+                if parsed:
+                    return parsed
+        return None
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def parse_date(date_str: str) -> Optional[str]:
+        """Попытаться распарсить дату в ISO формат (strptime дорогой, даты в чеках повторяются)."""
+        for fmt in _DATE_FORMATS:
+            try:
+                return datetime.strptime(date_str, fmt).strftime("%Y-%m-%d")
+            except ValueError:
+                continue
+        return None
+
+
+# Singleton instance
+receipt_parser = ReceiptParser()
@@ -0,0 +1,117 @@
+"""
+Дельта-синхронизация транзакций с мобильным клиентом (офлайн режим)
+
+Клиент хранит водяной знак — непрозрачный cursor из прошлого ответа — и
+получает только строки, изменённые после него: keyset pagination по
+(updated_at, id) на индексе ix_transactions_user_updated_id, без OFFSET.
+Отправка изменений — POST /transactions/bulk: запись принимается, если её
+version новее серверной, иначе побеждает серверная копия, и она приходит
+клиенту при следующей синхронизации.
+
+Водяной знак не бывает новее now - SYNC_CURSOR_LAG_SECONDS: updated_at
+проставляется до коммита, и строка ещё идущей транзакции может появиться
+позже с updated_at раньше уже выданного cursor. Последние секунды
+изменений клиент получает повторно и применяет по version.
+"""
+import base64
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.transaction import Transaction
+from app.models.user import User
+
+SYNC_COLUMNS = (
+    Transaction.id, Transaction.client_id, Transaction.amount, Transaction.description, Transaction.date,
+    Transaction.category_id, Transaction.receipt_data, Transaction.ml_category, Transaction.ml_confidence,
+    Transaction.is_anomaly, Transaction.device_id, Transaction.created_at, Transaction.updated_at,
+    Transaction.version,
+)
+
+
+def encode_cursor(updated_at: datetime, transaction_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{updated_at.isoformat()}|{transaction_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Raises:
+        ValueError: cursor не из ответа синхронизации
+    """
+    try:
+        updated_at, transaction_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(updated_at), int(transaction_id)
+    except Exception:
+        raise ValueError("Invalid sync cursor")
+
+
+class SyncService:
+    """Изменения транзакций пользователя после водяного знака"""
+
+    async def changes(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        now: Optional[datetime] = None,
+    ) -> dict:
+        """
+        Страница изменённых транзакций после cursor (без cursor — с начала)
+
+        Returns:
+            {"transactions": [...], "cursor": следующий водяной знак, "has_more": bool}
+
+        Raises:
+            ValueError: некорректный cursor или limit
+            LookupError: пользователь не найден
+        """
+        if limit is None:
+            limit = settings.SYNC_PAGE_SIZE
+        if not 1 <= limit <= settings.SYNC_MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {settings.SYNC_MAX_PAGE_SIZE}")
+        now = now or datetime.utcnow()
+        horizon = now - timedelta(seconds=settings.SYNC_CURSOR_LAG_SECONDS)
+
+        query = select(*SYNC_COLUMNS).where(Transaction.user_id == user_id)
+        if cursor:
+            query = query.where(tuple_(Transaction.updated_at, Transaction.id) > decode_cursor(cursor))
+        # Строка сверх limit — признак следующей страницы
+        rows = (await db.execute(
+            query.order_by(Transaction.updated_at, Transaction.id).limit(limit + 1)
+        )).mappings().all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        next_cursor = cursor
+        if rows:
+            last = rows[-1]
+            if last["updated_at"] < horizon:
+                next_cursor = encode_cursor(last["updated_at"], last["id"])
+            else:
+                # Хвост моложе lag: водяной знак останавливается на горизонте, хвост придёт ещё раз
+                # при следующей синхронизации, а не следующей страницей (иначе страница повторялась бы)
+                has_more = False
+                if cursor is None or decode_cursor(cursor) < (horizon, 0):
+                    next_cursor = encode_cursor(horizon, 0)
+
+        if not has_more:
+            # Клиент догнал сервер. updated_at профиля не трогаем — это не изменение профиля
+            synced = await db.scalar(
+                update(User).where(User.id == user_id)
+                .values(last_sync_at=now, updated_at=User.updated_at)
+                .returning(User.id)
+            )
+            if synced is None:
+                raise LookupError(f"User {user_id} not found")
+
+        return {"transactions": [dict(row) for row in rows], "cursor": next_cursor, "has_more": has_more}
+
+
+# Singleton instance
+sync_service = SyncService()
@@ -0,0 +1,107 @@
+"""
+Потоковый разбор тела запроса: JSON массив или NDJSON по мере поступления
+"""
+import codecs
+import json
+from typing import AsyncIterator, List
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+
+async def iter_json_objects(chunks: AsyncIterator[bytes], ndjson: bool) -> AsyncIterator[List]:
+    """
+    Разобрать поток байтов на элементы: JSON массив ([{...}, {...}]) или
+    NDJSON (объект на строку). Отдаёт элементы списками — всё, что
+    разобрано из очередного куска тела; тело целиком в памяти не держится.
+
+    Raises:
+        ValueError: некорректный JSON (с номером элемента или строки)
+    """
+    parse = _NDJSONParser() if ndjson else _ArrayParser()
+    text = codecs.getincrementaldecoder("utf-8")()
+    async for chunk in chunks:
+        try:
+            items = parse.feed(text.decode(chunk))
+        except UnicodeDecodeError:
+            raise ValueError("Body is not valid UTF-8")
+        if items:
+            yield items
+    items = parse.feed(text.decode(b"", final=True), final=True)
+    if items:
+        yield items
+
+
+class _NDJSONParser:
+    def __init__(self):
+        self._tail = ""
+        self._line = 0
+
+    def feed(self, data: str, final: bool = False) -> List:
+        lines = (self._tail + data).split("\n")
+        self._tail = "" if final else lines.pop()
+        items = []
+        for line in lines:
+            self._line += 1
+            if line.strip():
+                try:
+                    items.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"Invalid JSON on line {self._line}: {e.msg}")
+        return items
+
+
+class _ArrayParser:
+    def __init__(self):
+        self._buffer = ""
+        self._started = False
+        self._done = False
+        self._expect_item = True
+        self._count = 0
+
+    def feed(self, data: str, final: bool = False) -> List:
+        buffer = self._buffer + data
+        pos = 0
+        items = []
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos == len(buffer):
+                break
+            if self._done:
+                raise ValueError("Unexpected data after the JSON array")
+
+            char = buffer[pos]
+            if not self._started:
+                if char != "[":
+                    raise ValueError("Body must be a JSON array")
+                self._started = True
+                pos += 1
+            elif char == "]" and (not self._expect_item or self._count == 0):
+                self._done = True
+                pos += 1
+            elif char == "," and not self._expect_item:
+                self._expect_item = True
+                pos += 1
+            elif self._expect_item:
+                try:
+                    item, end = _decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError as e:
+                    # Элемент обрезан границей куска — дождаться следующего
+                    if final:
+                        raise ValueError(f"Invalid JSON in item {self._count}: {e.msg}")
+                    break
+                # Число на границе куска могло прочитаться не целиком
+                if end == len(buffer) and not final and not isinstance(item, (dict, list)):
+                    break
+                items.append(item)
+                self._count += 1
+                self._expect_item = False
+                pos = end
+            else:
+                raise ValueError(f"Expected ',' or ']' after item {self._count - 1}")
+
+        self._buffer = buffer[pos:]
+        if final and not self._done:
+            raise ValueError("Unexpected end of JSON array")
+        return items
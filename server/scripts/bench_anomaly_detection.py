@@ -0,0 +1,147 @@
+"""
+Бенчмарк /ml/detect-anomaly: потоковая статистика против Isolation Forest на запрос.
+
+Замеряются:
+- isolation forest: обучение на истории пользователя на каждый запрос
+  (как было бы без потоковой статистики)
+- score + update: оценка и O(1) обновление RunningStats в памяти
+- detect: полный путь сервиса для сохранённой транзакции — блокировка
+  строк статистики, оценка, запись статистики и is_anomaly
+- точность P²: оценка 95-го процентиля против точного по той же истории
+
+Требуется PostgreSQL (DATABASE_URL) со схемой (init_db или alembic upgrade).
+
+Запуск:
+    python scripts/bench_anomaly_detection.py [--history 2000] [--requests 200]
+"""
+import argparse
+import asyncio
+import copy
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import numpy as np
+from loguru import logger
+from sklearn.ensemble import IsolationForest
+from sqlalchemy import delete, insert, select
+
+from app.db.session import AsyncSessionLocal, engine
+from app.models import Category, Transaction, User
+from app.models.user_category_stats import ALL_CATEGORIES
+from app.services.anomaly_service import RunningStats, anomaly_service, score
+
+
+async def create_user(session, history: int, requests: int) -> tuple:
+    """Пользователь с историей расходов и requests новыми транзакциями (каждая десятая — крупная)"""
+    user_id = uuid.uuid4()
+    now = datetime.utcnow()
+    await session.execute(insert(User).values(
+        id=user_id, username="bench", currency="RUB", timezone="Europe/Moscow", theme="light",
+        created_at=now, updated_at=now, is_active=True,
+    ))
+    category_ids = (await session.execute(
+        insert(Category).returning(Category.id),
+        [{"user_id": user_id, "name": f"bench {i}", "color": "#000000", "is_default": False, "type": "expense"}
+         for i in range(5)],
+    )).scalars().all()
+
+    rng = random.Random(42)
+    rows = [
+        {"user_id": user_id, "category_id": rng.choice(category_ids), "amount": -round(rng.lognormvariate(6, 0.5), 2),
+         "date": now - timedelta(days=365) + timedelta(hours=i), "is_anomaly": False,
+         "created_at": now, "updated_at": now, "version": 1}
+        for i in range(history + requests)
+    ]
+    for i in range(history, history + requests, 10):
+        rows[i]["amount"] *= 20
+    ids = (await session.execute(insert(Transaction).returning(Transaction.id), rows)).scalars().all()
+    return user_id, list(zip(ids, rows))
+
+
+async def run(args):
+    async with AsyncSessionLocal() as session:
+        user_id, transactions = await create_user(session, args.history, args.requests)
+        await session.commit()
+        history, incoming = transactions[:args.history], transactions[args.history:]
+
+        try:
+            amounts = np.array([-row["amount"] for _, row in history])
+            categories = np.array([row["category_id"] for _, row in history])
+
+            # Isolation Forest на каждый запрос
+            forest_times = []
+            for _, row in incoming[:max(1, args.requests // 20)]:
+                started = time.perf_counter()
+                features = np.column_stack([np.log1p(amounts), categories])
+                forest = IsolationForest(n_estimators=100, random_state=0).fit(features)
+                forest.predict([[np.log1p(-row["amount"]), row["category_id"]]])
+                forest_times.append((time.perf_counter() - started) * 1000)
+
+            # Статистика по истории, как после scripts/rescore_anomalies.py
+            by_category = {
+                int(category_id): RunningStats.from_values(amounts[categories == category_id])
+                for category_id in np.unique(categories)
+            }
+            overall = RunningStats.from_values(amounts)
+            exact_q95 = float(np.quantile(amounts, 0.95))
+
+            memory = copy.deepcopy(by_category)
+            memory_overall = copy.deepcopy(overall)
+            started = time.perf_counter()
+            for _, row in incoming:
+                stats = memory[row["category_id"]]
+                score(-row["amount"], stats, memory_overall)
+                stats.update(-row["amount"])
+                memory_overall.update(-row["amount"])
+            memory_us = (time.perf_counter() - started) / len(incoming) * 1e6
+
+            # Полный путь сервиса: статистика в user_category_stats
+            await anomaly_service._save(session, user_id, {**by_category, ALL_CATEGORIES: overall})
+            await session.commit()
+            detect_times, flagged = [], 0
+            for tx_id, _ in incoming:
+                started = time.perf_counter()
+                result = await anomaly_service.detect(session, user_id, {"id": tx_id})
+                await session.commit()
+                detect_times.append((time.perf_counter() - started) * 1000)
+                flagged += result["is_anomaly"]
+
+            stored = await session.scalar(
+                select(Transaction.id).where(Transaction.user_id == user_id, Transaction.is_anomaly.is_(True)).limit(1)
+            )
+            print(f"История {args.history} трат, {len(incoming)} новых (каждая десятая — в 20 раз больше), мс")
+            print(f"{'isolation forest на запрос':<30}{statistics.median(forest_times):>10.1f}")
+            print(f"{'score + update в памяти':<30}{memory_us / 1000:>10.4f}  ({memory_us:.1f} мкс)")
+            print(f"{'detect (БД, блокировка, запись)':<30}{statistics.median(detect_times):>10.2f}")
+            print(f"\nПомечено аномалий: {flagged} из {len(incoming)} (крупных: {len(range(0, len(incoming), 10))}), "
+                  f"is_anomaly записан: {'да' if stored else 'нет'}")
+            print(f"95-й процентиль: P² {overall.quantile:.2f}, точный {exact_q95:.2f}; "
+                  f"после потока P² {memory_overall.quantile:.2f}, "
+                  f"точный {float(np.quantile(np.append(amounts, [-row['amount'] for _, row in incoming]), 0.95)):.2f}")
+        finally:
+            await session.execute(delete(User).where(User.id == user_id))
+            await session.commit()
+
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--history", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    logger.remove()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
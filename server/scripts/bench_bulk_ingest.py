@@ -0,0 +1,155 @@
+"""
+Бенчмарк пакетной загрузки транзакций (POST /api/v1/transactions/bulk).
+
+Замеряются (строк/с, тело целиком, включая разбор JSON и коммит):
+- session.add на строку: ORM объект на каждую транзакцию (как было бы
+  без пакетной загрузки), на --orm-rows строк
+- с категориями: разбор, валидация, COPY во временную таблицу, INSERT ...
+  ON CONFLICT, статистика аномалий
+- без категорий: то же плюс категоризация одним вызовом модели на пачку
+- повторная отправка с version + 1: строки обновляются по client_id
+- NDJSON: тот же объём построчно
+
+Требуется PostgreSQL (DATABASE_URL) со схемой (init_db или alembic upgrade).
+
+Запуск:
+    python scripts/bench_bulk_ingest.py [--rows 50000] [--orm-rows 5000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from loguru import logger
+from sqlalchemy import delete, func, insert, select
+
+from app.db.session import AsyncSessionLocal, engine
+from app.models import Category, Transaction, User
+from app.services.ingest_service import ingest_service
+from app.services.ml_service import ml_service
+
+CHUNK_BYTES = 64 * 1024
+DESCRIPTIONS = (
+    "Пятёрочка продукты", "Яндекс Такси", "Аптека Ригла", "Кофе Шоколадница", "Магнит у дома",
+    "Ozon заказ", "Метро проезд", "Кинотеатр Каро", "Wildberries", "Ресторан Тануки",
+)
+
+
+def make_rows(count: int, category_ids: list, with_category: bool, now: datetime) -> list:
+    rng = random.Random(42)
+    return [
+        {
+            "client_id": str(uuid.uuid4()),
+            "amount": -round(rng.lognormvariate(6, 0.7), 2),
+            "description": f"{rng.choice(DESCRIPTIONS)} {i % 97}",
+            "date": (now - timedelta(minutes=count - i)).isoformat(),
+            "category_id": rng.choice(category_ids) if with_category else None,
+            "device_id": "bench-device",
+            "version": 1,
+        }
+        for i in range(count)
+    ]
+
+
+async def chunked(body: bytes):
+    for start in range(0, len(body), CHUNK_BYTES):
+        yield body[start:start + CHUNK_BYTES]
+
+
+async def ingest(user_id, body: bytes, ndjson: bool = False) -> tuple:
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as session:
+        result = await ingest_service.ingest(session, user_id, chunked(body), ndjson=ndjson)
+        await session.commit()
+    return time.perf_counter() - started, result
+
+
+async def run(args):
+    ml_service.load_model()
+    now = datetime.utcnow()
+    user_id = uuid.uuid4()
+    async with AsyncSessionLocal() as session:
+        await session.execute(insert(User).values(
+            id=user_id, username="bench", currency="RUB", timezone="Europe/Moscow", theme="light",
+            created_at=now, updated_at=now, is_active=True,
+        ))
+        category_ids = (await session.execute(
+            insert(Category).returning(Category.id),
+            [{"user_id": user_id, "name": f"bench {i}", "color": "#000000", "is_default": False, "type": "expense"}
+             for i in range(8)],
+        )).scalars().all()
+        await session.commit()
+
+    try:
+        # Прогрев: соединение, временная таблица, модель
+        await ingest(user_id, json.dumps(make_rows(100, category_ids, False, now)).encode())
+
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as session:
+            for row in make_rows(args.orm_rows, category_ids, True, now):
+                session.add(Transaction(
+                    user_id=user_id, amount=row["amount"], description=row["description"],
+                    date=datetime.fromisoformat(row["date"]), category_id=row["category_id"],
+                    device_id=row["device_id"], version=row["version"],
+                ))
+                await session.flush()
+            await session.commit()
+        orm_rate = args.orm_rows / (time.perf_counter() - started)
+
+        categorized_rows = make_rows(args.rows, category_ids, True, now)
+        with_category, result = await ingest(user_id, json.dumps(categorized_rows).encode())
+        assert result["inserted"] == args.rows, result
+
+        uncategorized, result = await ingest(user_id, json.dumps(make_rows(args.rows, category_ids, False, now)).encode())
+        categorized = result["categorized"]
+
+        for row in categorized_rows:
+            row["version"] = 2
+            row["amount"] -= 1
+        resend, result = await ingest(user_id, json.dumps(categorized_rows).encode())
+        updated, conflicts = result["updated"], result["skipped"]
+        stale, result = await ingest(user_id, json.dumps(categorized_rows).encode())
+        skipped = result["skipped"]
+
+        ndjson_body = "\n".join(json.dumps(row) for row in make_rows(args.rows, category_ids, True, now)).encode()
+        ndjson, _ = await ingest(user_id, ndjson_body, ndjson=True)
+
+        async with AsyncSessionLocal() as session:
+            total = await session.scalar(select(func.count()).where(Transaction.user_id == user_id))
+
+        print(f"{args.rows} строк на запрос, строк/с")
+        print(f"{'session.add на строку':<34}{orm_rate:>12,.0f}  ({args.orm_rows} строк)")
+        print(f"{'с категориями (COPY + INSERT)':<34}{args.rows / with_category:>12,.0f}")
+        print(f"{'без категорий (+ модель)':<34}{args.rows / uncategorized:>12,.0f}  (категоризовано {categorized})")
+        print(f"{'повторно, version + 1':<34}{args.rows / resend:>12,.0f}  (обновлено {updated}, "
+              f"пропущено {conflicts} — версию на сервере уже подняла пометка аномалии)")
+        print(f"{'повторно, та же version':<34}{args.rows / stale:>12,.0f}  (пропущено {skipped})")
+        print(f"{'NDJSON, с категориями':<34}{args.rows / ndjson:>12,.0f}")
+        print(f"\nСтрок пользователя в transactions: {total}")
+    finally:
+        async with AsyncSessionLocal() as session:
+            await session.execute(delete(User).where(User.id == user_id))
+            await session.commit()
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--orm-rows", type=int, default=5_000)
+    args = parser.parse_args()
+
+    logger.remove()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
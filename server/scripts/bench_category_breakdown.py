@@ -0,0 +1,205 @@
+"""
+Бенчмарк /analytics/category-breakdown на пользователе с большой историей.
+
+Создаёт временного пользователя с --transactions транзакциями за --years
+лет (COPY, триггеры агрегатов срабатывают как при обычной вставке) и
+сравнивает три способа посчитать детализацию по категориям:
+- naive: загрузить все транзакции пользователя в Python и сложить
+- group by: GROUP BY category_id по transactions в PostgreSQL
+- rollup: analytics_service поверх category_rollups
+Затем проверяет, что агрегаты совпадают с GROUP BY после UPDATE/DELETE,
+и замеряет цену триггеров на одиночной вставке. Пользователь удаляется.
+
+Требуется PostgreSQL (DATABASE_URL) со схемой (init_db или alembic upgrade).
+
+Запуск:
+    python scripts/bench_category_breakdown.py [--transactions 100000] [--years 5] [--repeat 5]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from loguru import logger
+from sqlalchemy import delete, insert, select, text, update
+
+from app.db.session import AsyncSessionLocal, engine
+from app.models import Category, Transaction, User
+from app.services.analytics_service import analytics_service
+
+
+CATEGORIES = ["Продукты", "Транспорт", "Кафе", "Развлечения", "Здоровье",
+              "Одежда", "Связь", "ЖКХ", "Подарки", "Зарплата"]
+
+
+async def create_user(session, transactions: int, years: int) -> uuid.UUID:
+    user_id = uuid.uuid4()
+    now = datetime.utcnow()
+    await session.execute(insert(User).values(
+        id=user_id, username="bench", currency="RUB", timezone="Europe/Moscow", theme="light",
+        created_at=now, updated_at=now, is_active=True,
+    ))
+    category_ids = (await session.execute(
+        insert(Category).returning(Category.id),
+        [{"user_id": user_id, "name": name, "color": "#000000", "is_default": False,
+          "type": "income" if name == "Зарплата" else "expense"} for name in CATEGORIES],
+    )).scalars().all()
+
+    rng = random.Random(42)
+    span = timedelta(days=365 * years).total_seconds()
+    records = []
+    for i in range(transactions):
+        category_id = rng.choice(category_ids + [None])
+        income = category_id == category_ids[-1]
+        amount = round(rng.uniform(20000, 150000) if income else -rng.lognormvariate(6, 1), 2)
+        records.append((
+            user_id, category_id, amount, f"bench {i}", now - timedelta(seconds=rng.random() * span),
+            False, now, now, 1,
+        ))
+
+    connection = await session.connection()
+    raw = (await connection.get_raw_connection()).driver_connection
+    started = time.perf_counter()
+    await raw.copy_records_to_table(
+        "transactions", records=records,
+        columns=["user_id", "category_id", "amount", "description", "date",
+                 "is_anomaly", "created_at", "updated_at", "version"],
+    )
+    print(f"COPY {transactions} транзакций (с триггерами агрегатов): {time.perf_counter() - started:.2f} с")
+    return user_id
+
+
+async def naive_breakdown(session, user_id, start):
+    """Все транзакции пользователя в Python"""
+    query = select(Transaction).where(Transaction.user_id == user_id)
+    if start is not None:
+        query = query.where(Transaction.date >= start)
+    sums = defaultdict(float)
+    for tx in (await session.execute(query)).scalars():
+        if tx.amount < 0:
+            sums[tx.category_id] += -tx.amount
+    return sums
+
+
+async def group_by_breakdown(session, user_id, start):
+    """GROUP BY по transactions без агрегатов"""
+    rows = await session.execute(text("""
+        SELECT category_id, SUM(-amount) FILTER (WHERE amount < 0), COUNT(*) FILTER (WHERE amount < 0)
+        FROM transactions WHERE user_id = :user_id AND (CAST(:start AS timestamp) IS NULL OR date >= :start)
+        GROUP BY category_id
+    """), {"user_id": user_id, "start": start})
+    return rows.all()
+
+
+async def timed(func, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await func()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+async def check_consistency(session, user_id) -> bool:
+    """Агрегаты = GROUP BY по транзакциям (по месяцам и категориям)"""
+    mismatches = (await session.execute(text("""
+        SELECT count(*) FROM (
+            SELECT date_trunc('month', date)::date AS period_start, COALESCE(category_id, 0) AS category_id,
+                   SUM(CASE WHEN amount < 0 THEN -amount::numeric(14, 2) ELSE 0 END) AS expense_sum,
+                   COUNT(*) FILTER (WHERE amount < 0) AS expense_count,
+                   SUM(CASE WHEN amount >= 0 THEN amount::numeric(14, 2) ELSE 0 END) AS income_sum,
+                   COUNT(*) FILTER (WHERE amount >= 0) AS income_count
+            FROM transactions WHERE user_id = :user_id GROUP BY 1, 2
+        ) expected
+        FULL JOIN (
+            SELECT * FROM category_rollups
+            WHERE user_id = :user_id AND expense_count + income_count > 0
+        ) actual USING (period_start, category_id)
+        WHERE (expected.expense_sum, expected.expense_count, expected.income_sum, expected.income_count)
+            IS DISTINCT FROM (actual.expense_sum, actual.expense_count, actual.income_sum, actual.income_count)
+    """), {"user_id": user_id})).scalar()
+    return mismatches == 0
+
+
+async def run(args):
+    async with AsyncSessionLocal() as session:
+        user_id = await create_user(session, args.transactions, args.years)
+        await session.commit()
+
+        try:
+            now = datetime.utcnow()
+            print(f"\n{'период':<8}{'naive, мс':>12}{'group by, мс':>15}{'rollup, мс':>13}{'ускорение':>12}")
+            for period in ("month", "year", "all", "week"):
+                start, _ = analytics_service.period_bounds(period, now)
+                naive_ms = await timed(lambda: naive_breakdown(session, user_id, start), max(1, args.repeat // 2))
+                session.expunge_all()
+                group_ms = await timed(lambda: group_by_breakdown(session, user_id, start), args.repeat)
+                rollup_ms = await timed(
+                    lambda: analytics_service.category_breakdown(session, user_id, period, now), args.repeat
+                )
+                print(f"{period:<8}{naive_ms:>12.1f}{group_ms:>15.1f}{rollup_ms:>13.1f}{naive_ms / rollup_ms:>11.0f}x")
+            print("(week считается GROUP BY по транзакциям за 7 дней, без агрегатов)")
+
+            # Изменения после вставки: UPDATE суммы/категории/даты, UPDATE без полей агрегата, DELETE
+            ids = (await session.execute(
+                select(Transaction.id).where(Transaction.user_id == user_id).order_by(Transaction.id).limit(3000)
+            )).scalars().all()
+            await session.execute(update(Transaction).where(Transaction.id.in_(ids[:1000])).values(
+                amount=Transaction.amount * 2, date=Transaction.date - timedelta(days=40),
+            ))
+            await session.execute(update(Transaction).where(Transaction.id.in_(ids[1000:2000])).values(
+                category_id=None,
+            ))
+            await session.execute(update(Transaction).where(Transaction.id.in_(ids[2000:2500])).values(
+                is_anomaly=True,
+            ))
+            await session.execute(delete(Transaction).where(Transaction.id.in_(ids[2500:])))
+            await session.commit()
+            consistent = await check_consistency(session, user_id)
+            print(f"\nАгрегаты совпадают с GROUP BY после UPDATE/DELETE: {'да' if consistent else 'НЕТ'}")
+
+            # Цена триггера на одиночной вставке (типичная запись из приложения)
+            started = time.perf_counter()
+            for i in range(args.single_inserts):
+                await session.execute(insert(Transaction).values(
+                    user_id=user_id, amount=-100.0, description="single", date=datetime.utcnow(),
+                    is_anomaly=False, created_at=now, updated_at=now, version=1,
+                ))
+                await session.commit()
+            per_insert = (time.perf_counter() - started) * 1000 / args.single_inserts
+            print(f"Одиночный INSERT + COMMIT с триггером: {per_insert:.2f} мс")
+
+            rollup_rows = (await session.execute(
+                text("SELECT count(*) FROM category_rollups WHERE user_id = :user_id"), {"user_id": user_id}
+            )).scalar()
+            print(f"Строк агрегатов у пользователя: {rollup_rows} (транзакций: {args.transactions})")
+        finally:
+            await session.execute(delete(User).where(User.id == user_id))
+            await session.commit()
+
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--transactions", type=int, default=100_000)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--single-inserts", type=int, default=200)
+    args = parser.parse_args()
+
+    logger.remove()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
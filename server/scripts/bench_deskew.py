@@ -0,0 +1,94 @@
+"""
+Бенчмарк deskew: прежняя оценка угла по координатам всех пикселей
+полного разрешения против оценки на уменьшенной копии.
+
+Замеряются пик выделенной памяти (tracemalloc: массивы numpy и OpenCV),
+время и найденный угол на синтетическом бинаризованном чеке с известным
+наклоном.
+
+Запуск:
+    python scripts/bench_deskew.py [--width 2000 --height 3000] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import cv2
+import numpy as np
+from loguru import logger
+
+from app.services.image_preprocessing_service import image_preprocessing_service
+
+
+def legacy_skew_angle(img: np.ndarray) -> float:
+    """Прежняя оценка угла (до поворота), включая прежнюю нормализацию"""
+    inverted = cv2.bitwise_not(img)
+    coords = np.column_stack(np.where(inverted > 0))
+    angle = cv2.minAreaRect(coords)[-1]
+    if angle < -45:
+        angle = 90 + angle
+    else:
+        angle = -angle
+    return angle
+
+
+def make_receipt(width: int, height: int, angle: float) -> np.ndarray:
+    """Бинарный чек: строки символов, повернутые на angle градусов"""
+    img = np.full((height, width), 255, dtype=np.uint8)
+    step_y, step_x = max(height // 50, 30), max(width // 40, 25)
+    for y in range(step_y * 2, height - step_y * 2, step_y):
+        for x in range(step_x * 2, width - step_x * 4, step_x):
+            cv2.putText(img, "8", (x, y), cv2.FONT_HERSHEY_SIMPLEX, step_y / 50, 0, 2)
+    matrix = cv2.getRotationMatrix2D((width // 2, height // 2), angle, 1.0)
+    return cv2.warpAffine(img, matrix, (width, height), borderValue=255)
+
+
+def measure(func, img, repeat: int):
+    """(результат, пик памяти в МБ, медианное время в мс)"""
+    tracemalloc.start()
+    result = func(img)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(img)
+        times.append((time.perf_counter() - started) * 1000)
+    return result, peak / 1024 / 1024, sorted(times)[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=2000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    logger.remove()
+
+    print(f"Изображение {args.width}x{args.height}, оценка угла (без поворота)")
+    print(f"{'наклон':>7}{'угол old':>10}{'угол new':>10}{'память old, МБ':>16}{'память new, МБ':>16}"
+          f"{'old, мс':>9}{'new, мс':>9}")
+    for skew in (0.0, 2.0, -4.0, 8.0):
+        img = make_receipt(args.width, args.height, skew)
+        old_angle, old_mb, old_ms = measure(legacy_skew_angle, img, args.repeat)
+        new_angle, new_mb, new_ms = measure(image_preprocessing_service._skew_angle, img, args.repeat)
+        print(f"{skew:>7.1f}{old_angle:>10.2f}{new_angle:>10.2f}{old_mb:>16.2f}{new_mb:>16.2f}"
+              f"{old_ms:>9.1f}{new_ms:>9.1f}")
+
+    # Весь _deskew с поворотом в полном разрешении
+    img = make_receipt(args.width, args.height, 4.0)
+    _, deskew_mb, deskew_ms = measure(image_preprocessing_service._deskew, img, args.repeat)
+    print()
+    print(f"_deskew целиком (наклон 4°): пик {deskew_mb:.2f} МБ, {deskew_ms:.1f} мс")
+    print("Ожидаемый угол коррекции — минус наклон. Прежняя нормализация рассчитана на OpenCV < 4.5")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Бенчмарк fallback категоризации: старый вложенный цикл по ключевым словам
+против скомпилированного KeywordMatcher.
+
+Запуск:
+    python scripts/bench_fallback.py [--repeat 20]
+"""
+import argparse
+import json
+import sys
+import os
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import pandas as pd
+
+from app.ml.keyword_matcher import DEFAULT_KEYWORDS_PATH, KeywordMatcher
+
+
+DATASET_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "training", "transactions_dataset.csv")
+
+
+def legacy_match(table: dict, description: str):
+    """
+    Прежняя реализация: словарь собирался заново на каждый вызов
+    и перебирался целиком, первое совпадение в порядке словаря
+    """
+    keywords = {category: list(words) for category, words in table.items()}
+    desc_lower = description.lower()
+    for category, words in keywords.items():
+        for word in words:
+            if word in desc_lower:
+                return category
+    return None
+
+
+def bench(func, descriptions, repeat: int) -> float:
+    """Среднее время на одну строку в микросекундах"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for description in descriptions:
+            func(description)
+    return (time.perf_counter() - started) / (repeat * len(descriptions)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with open(DEFAULT_KEYWORDS_PATH, encoding="utf-8") as f:
+        table = json.load(f)
+
+    started = time.perf_counter()
+    matcher = KeywordMatcher(table)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    descriptions = pd.read_csv(DATASET_PATH)["description"].astype(str).tolist()
+    # Промахи — худший случай для старого цикла: проверяются все ключевые слова
+    misses = [f"оплата услуг {i} без ключевых слов" for i in range(len(descriptions))]
+
+    print(f"Ключевых слов: {len(matcher)}, сборка matcher: {build_ms:.2f} мс")
+    print(f"Строк: {len(descriptions)} (датасет) + {len(misses)} (без совпадений), повторов: {args.repeat}")
+    print()
+    print(f"{'набор':<14}{'старый цикл, мкс':>18}{'matcher, мкс':>16}{'ускорение':>12}")
+    for name, data in [("датасет", descriptions), ("промахи", misses)]:
+        legacy_us = bench(lambda d: legacy_match(table, d), data, args.repeat)
+        matcher_us = bench(matcher.match, data, args.repeat)
+        print(f"{name:<14}{legacy_us:>18.2f}{matcher_us:>16.2f}{legacy_us / matcher_us:>11.1f}x")
+
+    changed = sum(1 for d in descriptions if legacy_match(table, d) != matcher.match(d))
+    print()
+    print(f"Строк с другой категорией (приоритет самого длинного слова): {changed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Бенчмарк и проверка клиента API ФНС (fns_service) на локальной заглушке.
+
+Заглушка — HTTP сервер в потоке, отвечает как proverkacheka.com
+(POST /check/get) с задержкой --latency-ms и считает запросы.
+Сценарии:
+- новый httpx.AsyncClient на каждый чек (прежний подход) против общего
+  пула соединений — время --requests разных чеков при --concurrency
+- --concurrency одновременных запросов одного чека — сколько ушло к API
+- повторный запрос того же чека — из кэша
+- временная ошибка (503 на первую попытку) — повтор
+- /parse-qr целиком через TestClient: позиции с категориями
+
+Запуск:
+    python scripts/bench_fns_client.py [--requests 200] [--concurrency 20] [--latency-ms 50]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import httpx
+from loguru import logger
+
+from app.config import settings
+
+
+class StubFNS(BaseHTTPRequestHandler):
+    """Заглушка API: чек с тремя позициями, суммы в копейках"""
+    latency = 0.05
+    requests = 0
+    fail_first = set()  # fn, для которых первая попытка отвечает 503
+    lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+        with StubFNS.lock:
+            StubFNS.requests += 1
+            fail = form.get("fn") in StubFNS.fail_first
+            StubFNS.fail_first.discard(form.get("fn"))
+        time.sleep(StubFNS.latency)
+
+        if fail:
+            self._reply(503, {"code": 5, "data": "temporary error"})
+            return
+        self._reply(200, {"code": 1, "data": {"json": {
+            "user": "ООО \"АГРОТОРГ\" ", "userInn": "7825706086  ",
+            "dateTime": "2024-01-15T14:30:00", "totalSum": 40630,
+            "items": [
+                {"name": "Хлеб белый", "price": 4550, "quantity": 1, "sum": 4550},
+                {"name": "Молоко 3.2% 1л", "price": 8990, "quantity": 2, "sum": 17980},
+                {"name": "Яблоки", "price": 12950, "quantity": 1.4, "sum": 18130},
+            ],
+        }}})
+
+    def _reply(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def qr(fn: int) -> str:
+    return f"t=20240115T1430&s=406.30&fn={fn}&i={fn % 997}&fp=2876543210&n=1"
+
+
+async def run_concurrently(func, items: list, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(item):
+        async with semaphore:
+            await func(item)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(item) for item in items))
+    return time.perf_counter() - started
+
+
+async def scenarios(args, base_url: str):
+    from app.services.fns_service import FNSService, fns_service
+
+    def reset_counter() -> None:
+        StubFNS.requests = 0
+
+    async def per_request_client(qr_raw: str):
+        params = FNSService.parse_qr(qr_raw)
+        async with httpx.AsyncClient(base_url=base_url, timeout=settings.FNS_TIMEOUT_SECONDS) as client:
+            response = await client.post("/check/get", data={"fn": params.fn, "fd": params.i, "fp": params.fp})
+            FNSService._normalize(response.json())
+
+    print(f"{'сценарий':<34}{'время, с':>10}{'запросов к API':>16}")
+
+    reset_counter()
+    elapsed = await run_concurrently(per_request_client, [qr(n) for n in range(args.requests)], args.concurrency)
+    print(f"{'клиент на каждый чек':<34}{elapsed:>10.2f}{StubFNS.requests:>16}")
+
+    reset_counter()
+    service = FNSService()
+    elapsed = await run_concurrently(
+        lambda qr_raw: service.get_receipt(service.parse_qr(qr_raw)),
+        [qr(10_000 + n) for n in range(args.requests)], args.concurrency,
+    )
+    print(f"{'общий пул соединений':<34}{elapsed:>10.2f}{StubFNS.requests:>16}")
+
+    reset_counter()
+    params = service.parse_qr(qr(1))
+    started = time.perf_counter()
+    results = await asyncio.gather(*(service.get_receipt(params) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    assert all(result == results[0] for result in results)
+    print(f"{f'{args.concurrency} одновременных одного чека':<34}{elapsed:>10.2f}{StubFNS.requests:>16}")
+
+    reset_counter()
+    started = time.perf_counter()
+    await service.get_receipt(params)
+    print(f"{'повтор того же чека (кэш)':<34}{time.perf_counter() - started:>10.4f}{StubFNS.requests:>16}")
+
+    reset_counter()
+    StubFNS.fail_first.add("777")
+    started = time.perf_counter()
+    await service.get_receipt(service.parse_qr(qr(777)))
+    print(f"{'503 на первую попытку':<34}{time.perf_counter() - started:>10.2f}{StubFNS.requests:>16}")
+
+    print(f"\nСтатистика сервиса: {service.stats()}")
+    await service.close()
+    await fns_service.close()
+
+
+def check_endpoint():
+    """/parse-qr целиком: заглушка API + категоризация позиций"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as client:
+        response = client.post("/api/v1/receipts/parse-qr", json={"qr_raw": qr(42)})
+        print(f"\n/parse-qr: HTTP {response.status_code}")
+        print(json.dumps(response.json(), ensure_ascii=False, indent=2))
+        bad = client.post("/api/v1/receipts/parse-qr", json={"qr_raw": "t=20240115T1430&s=1.00"})
+        print(f"QR без fn/i/fp: HTTP {bad.status_code} {bad.json()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--no-endpoint", action="store_true", help="Не проверять /parse-qr через TestClient")
+    args = parser.parse_args()
+
+    logger.remove()
+    StubFNS.latency = args.latency_ms / 1000
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubFNS)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # Сервис читает настройки при создании клиента — направляем его на заглушку
+    settings.FNS_API_URL = base_url
+    settings.FNS_API_KEY = settings.FNS_API_KEY or "stub-token"
+    settings.FNS_RETRY_BACKOFF_SECONDS = 0.05
+
+    asyncio.run(scenarios(args, base_url))
+    if not args.no_endpoint:
+        check_endpoint()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
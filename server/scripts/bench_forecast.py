@@ -0,0 +1,166 @@
+"""
+Бенчмарк /ml/forecast (history_months=24) на пользователе с большой историей.
+
+Замеряются:
+- полное обучение: недельные суммы одним GROUP BY и рекурсия Холта в
+  NumPy по всем категориям и сетке alpha (кэш сброшен)
+- кэш: водяной знак не изменился — готовый ответ
+- текущая неделя: новая транзакция в незавершённой неделе — проверка
+  контрольной суммы окна, модель не переобучается
+- новая неделя: время сдвинуто на неделю вперёд — дообучение только
+  по новой неделе; результат сверяется с полным обучением
+- prophet: офлайн режим, если пакет prophet установлен
+
+Требуется PostgreSQL (DATABASE_URL) со схемой (init_db или alembic upgrade).
+
+Запуск:
+    python scripts/bench_forecast.py [--transactions 50000] [--categories 12] [--repeat 5]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from loguru import logger
+from sqlalchemy import delete, insert, text
+
+from app.db.session import AsyncSessionLocal, engine
+from app.models import Category, Transaction, User
+from app.services import forecast_service as forecast_module
+from app.services.forecast_service import forecast_service
+
+
+HISTORY_MONTHS = 24
+
+
+async def create_user(session, transactions: int, categories: int, now: datetime) -> uuid.UUID:
+    user_id = uuid.uuid4()
+    await session.execute(insert(User).values(
+        id=user_id, username="bench", currency="RUB", timezone="Europe/Moscow", theme="light",
+        created_at=now, updated_at=now, is_active=True,
+    ))
+    category_ids = (await session.execute(
+        insert(Category).returning(Category.id),
+        [{"user_id": user_id, "name": f"bench {i}", "color": "#000000", "is_default": False, "type": "expense"}
+         for i in range(categories)],
+    )).scalars().all()
+
+    rng = random.Random(42)
+    span = timedelta(days=365 * 2 + 30).total_seconds()
+    records = []
+    for i in range(transactions):
+        date = now - timedelta(seconds=rng.random() * span)
+        # Рост трат со временем и сезонность по месяцу — чтобы у модели был тренд
+        growth = 1 + 0.3 * (1 - (now - date).total_seconds() / span)
+        amount = -round(rng.lognormvariate(6, 1) * growth * (1.2 if date.month == 12 else 1.0), 2)
+        records.append((user_id, rng.choice(category_ids + [None]), amount, f"bench {i}", date, False, now, now, 1))
+
+    connection = await session.connection()
+    raw = (await connection.get_raw_connection()).driver_connection
+    await raw.copy_records_to_table(
+        "transactions", records=records,
+        columns=["user_id", "category_id", "amount", "description", "date",
+                 "is_anomaly", "created_at", "updated_at", "version"],
+    )
+    return user_id
+
+
+async def timed(func, repeat: int) -> tuple:
+    times, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await func()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times), result
+
+
+async def run(args):
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as session:
+        user_id = await create_user(session, args.transactions, args.categories, now)
+        await session.commit()
+        # Как после autovacuum: карта видимости для index-only scan, статистика для планировщика
+        async with engine.connect() as connection:
+            connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+            await connection.execute(text("VACUUM ANALYZE transactions"))
+
+        def forecast(moment):
+            return forecast_service.forecast(session, user_id, "month", HISTORY_MONTHS, engine="smoothing", now=moment)
+
+        try:
+            async def cold():
+                forecast_service.invalidate(user_id)
+                return await forecast(now)
+
+            await cold()  # Прогрев соединения и NumPy
+            cold_ms, result = await timed(cold, args.repeat)
+            cached_ms, _ = await timed(lambda: forecast(now), args.repeat)
+
+            await session.execute(insert(Transaction).values(
+                user_id=user_id, amount=-500.0, date=now, is_anomaly=False,
+                created_at=now, updated_at=now, version=1,
+            ))
+            await session.commit()
+            started = time.perf_counter()
+            await forecast(now)
+            current_week_ms = (time.perf_counter() - started) * 1000
+
+            next_week = now + timedelta(weeks=1)
+            started = time.perf_counter()
+            incremental = await forecast(next_week)
+            incremental_ms = (time.perf_counter() - started) * 1000
+
+            forecast_service.invalidate(user_id)
+            # Полное обучение по тому же окну, что у дообученного состояния
+            start, cutoff = forecast_module.training_window(now, HISTORY_MONTHS)
+            next_cutoff = cutoff + timedelta(weeks=1)
+            weekly, category_ids = await forecast_service._fetch_weekly(session, user_id, start, next_cutoff)
+            state = forecast_module._fit_state(weekly, category_ids, start, next_cutoff, "")
+            refit = forecast_module._smoothing_forecast(state, forecast_module.HORIZON_DAYS["month"])
+            refit_matches = abs(refit["total"] - incremental["forecast"]["total"]) < 0.05
+
+            print(f"history_months={HISTORY_MONTHS}, {args.transactions} транзакций, "
+                  f"{len(result['forecast']['by_category'])} категорий, медиана, мс")
+            print(f"{'полное обучение':<30}{cold_ms:>10.1f}")
+            print(f"{'кэш (водяной знак)':<30}{cached_ms:>10.2f}")
+            print(f"{'новая транзакция, та же неделя':<30}{current_week_ms:>10.1f}")
+            print(f"{'новая неделя (дообучение)':<30}{incremental_ms:>10.1f}  "
+                  f"(совпадает с полным обучением: {'да' if refit_matches else 'нет'})")
+            print(f"\nСтатистика: {forecast_service.stats()}")
+            print(f"Прогноз на месяц: {result['forecast']['total']} {result['trend']} {result['confidence_interval']}")
+
+            if forecast_module.prophet_available():
+                started = time.perf_counter()
+                prophet = await forecast_service.forecast(session, user_id, "month", HISTORY_MONTHS, engine="prophet", now=now)
+                prophet_ms = (time.perf_counter() - started) * 1000
+                print(f"\nprophet: {prophet_ms:.0f} мс, прогноз {prophet['forecast']['total']} {prophet['trend']}")
+            else:
+                print("\nprophet не установлен — офлайн режим не замерялся")
+        finally:
+            await session.execute(delete(User).where(User.id == user_id))
+            await session.commit()
+
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--transactions", type=int, default=50_000)
+    parser.add_argument("--categories", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    logger.remove()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
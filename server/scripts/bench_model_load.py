@@ -0,0 +1,102 @@
+"""
+Бенчмарк холодного старта модели категоризации: pickle против mmap бандла.
+
+Каждый формат загружается в отдельном свежем процессе. Замеряются:
+- время load_model() (включая прогрев перед подменой модели)
+- прирост RSS после загрузки и после первого предсказания
+- задержка первого и последующих предсказаний
+
+Запуск (после python -m app.ml.training.train_categorization):
+    python scripts/bench_model_load.py [--runs 3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+
+def rss_mb() -> float:
+    """Текущий RSS процесса в МБ (Linux)"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def child(model_format: str):
+    """Замер в дочернем процессе; результат — JSON в stdout"""
+    os.environ["ML_MODEL_FORMAT"] = model_format
+
+    from loguru import logger
+    logger.remove()
+
+    # Импорты (sklearn, numpy) не входят в замер — они одинаковы для обоих форматов
+    import sklearn.ensemble  # noqa: F401
+    from app.services.ml_service import ml_service
+
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    if not ml_service.load_model():
+        raise SystemExit(f"Model in format '{model_format}' not found, train it first")
+    load_ms = (time.perf_counter() - started) * 1000
+    rss_loaded = rss_mb()
+
+    started = time.perf_counter()
+    state = ml_service.state
+    ml_service._predict_uncached(state, ["пятерочка хлеб молоко"])
+    first_ms = (time.perf_counter() - started) * 1000
+
+    texts = [f"яндекс такси поездка {i}" for i in range(200)]
+    started = time.perf_counter()
+    for text in texts:
+        ml_service._predict_uncached(state, [text])
+    predict_ms = (time.perf_counter() - started) * 1000 / len(texts)
+
+    print(json.dumps({
+        "load_ms": load_ms,
+        "rss_load_mb": rss_loaded - rss_before,
+        "rss_total_mb": rss_mb() - rss_before,
+        "first_predict_ms": first_ms,
+        "predict_ms": predict_ms,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", choices=["pickle", "bundle"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    print(f"{'формат':<8}{'load, мс':>10}{'RSS load, МБ':>14}{'RSS итого, МБ':>15}{'1-й predict, мс':>17}{'predict, мс':>13}")
+    for model_format in ("pickle", "bundle"):
+        runs = []
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", model_format],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+
+        # Медиана по запускам
+        result = {key: sorted(run[key] for run in runs)[len(runs) // 2] for key in runs[0]}
+        print(
+            f"{model_format:<8}{result['load_ms']:>10.1f}{result['rss_load_mb']:>14.1f}"
+            f"{result['rss_total_mb']:>15.1f}{result['first_predict_ms']:>17.2f}{result['predict_ms']:>13.3f}"
+        )
+
+    print()
+    print("RSS бандла — страницы page cache, общие для всех воркеров; RSS pickle — приватная куча каждого воркера")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Бенчмарк движков OCR воркера: pytesseract против прогретого tesserocr.
+
+pytesseract на каждый вызов запускает процесс tesseract, который заново
+загружает модели rus+eng. tesserocr (OCRService.warm_up в воркере OCR
+пула) загружает их один раз, дальше вызов — только распознавание.
+Синтетический чек на --items позиций проходит обычную предобработку и
+распознаётся --repeat раз каждым движком. Выводятся время прогрева,
+медиана и p95 на чек и совпадение текстов движков (difflib).
+
+Требуются tesseract (rus+eng) и tesserocr.
+
+Запуск:
+    python scripts/bench_ocr_engines.py [--items 30] [--repeat 20]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from PIL import Image
+from loguru import logger
+
+from app.services.image_preprocessing_service import image_preprocessing_service
+from app.services.ocr_service import OCRService
+from scripts.bench_strip_ocr import FONT_PATH, render_long_receipt, similarity
+
+
+def measure(service: OCRService, image: Image.Image, repeat: int) -> tuple:
+    times, text = [], ""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        text = service._image_to_text(image)
+        times.append((time.perf_counter() - started) * 1000)
+    times.sort()
+    return statistics.median(times), times[int(0.95 * (len(times) - 1))], text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    logger.remove()
+    if not os.path.exists(FONT_PATH):
+        raise SystemExit(f"Шрифт не найден: {FONT_PATH}")
+
+    image_bytes, _truth = render_long_receipt(args.items)
+    image = Image.fromarray(image_preprocessing_service.preprocess_from_bytes(image_bytes))
+
+    # Без прогрева: _tess_api не создан, каждый вызов — процесс tesseract
+    per_call = OCRService()
+    try:
+        per_call_ms, per_call_p95, per_call_text = measure(per_call, image, args.repeat)
+    except Exception as e:
+        raise SystemExit(f"tesseract недоступен: {e}")
+
+    warm = OCRService()
+    started = time.perf_counter()
+    try:
+        engine = warm.warm_up()
+    except Exception as e:
+        raise SystemExit(f"tesseract недоступен: {e}")
+    warm_up_ms = (time.perf_counter() - started) * 1000
+    if engine != "tesserocr":
+        raise SystemExit("tesserocr не установлен: сравнивать не с чем")
+    warm_ms, warm_p95, warm_text = measure(warm, image, args.repeat)
+
+    print(f"Чек на {args.items} позиций, {image.width}x{image.height}px, {args.repeat} повторов")
+    print(f"{'движок':<24}{'прогрев, мс':>12}{'медиана, мс':>13}{'p95, мс':>10}")
+    print(f"{'pytesseract (процесс)':<24}{'-':>12}{per_call_ms:>13.1f}{per_call_p95:>10.1f}")
+    print(f"{'tesserocr (прогретый)':<24}{warm_up_ms:>12.1f}{warm_ms:>13.1f}{warm_p95:>10.1f}")
+    print(f"Ускорение на чек: {per_call_ms / warm_ms:.1f}x, совпадение текстов: {similarity(per_call_text, warm_text):.3f}")
+
+
+if __name__ == "__main__":
+    main()
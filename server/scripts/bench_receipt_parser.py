@@ -0,0 +1,263 @@
+"""
+Бенчмарк парсера текста чека: прежний разбор четырьмя проходами
+(копия ниже) против однопроходного receipt_parser.
+
+Корпус — синтетические сырые тексты OCR (шапка, позиции, служебные строки,
+мусор распознавания, разные форматы дат и сумм) или собственный корпус:
+--corpus файл .jsonl с полем raw_text либо директория с .txt файлами.
+Перед замером проверяется, что оба парсера дают одинаковый результат
+на каждом тексте.
+
+Запуск:
+    python scripts/bench_receipt_parser.py [--texts 5000] [--corpus raw_texts.jsonl]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from app.services.receipt_parser import receipt_parser
+
+
+class LegacyReceiptParser:
+    """Прежний разбор из OCRService (до однопроходного парсера)"""
+
+    def _parse_receipt(self, text: str) -> dict:
+        """Извлечь структурированные данные из текста чека."""
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+
+        return {
+            "total": self._extract_total(lines),
+            "date": self._extract_date(lines),
+            "retailer": self._extract_retailer(lines),
+            "items": self._extract_items(lines),
+        }
+
+    def _extract_total(self, lines: list[str]) -> Optional[float]:
+        """
+        Найти итоговую сумму чека.
+        Паттерны: ИТОГО, ИТОГ, СУММА, TOTAL, К ОПЛАТЕ
+        """
+        total_patterns = [
+            r"(?:итого|итог|к\s*оплате|сумма|total)[:\s]+(\d+[\.,]\d{2})",
+            r"(?:итого|итог|к\s*оплате|сумма|total)[:\s]+(\d+)",
+        ]
+        for line in reversed(lines):  # Итог обычно в конце чека
+            line_lower = line.lower()
+            for pattern in total_patterns:
+                match = re.search(pattern, line_lower)
+                if match:
+                    amount_str = match.group(1).replace(",", ".")
+                    try:
+                        return float(amount_str)
+                    except ValueError:
+                        continue
+
+        # Fallback: ищем самую большую сумму в чеке
+        amounts = self._find_all_amounts(lines)
+        return max(amounts) if amounts else None
+
+    def _extract_date(self, lines: list[str]) -> Optional[str]:
+        """
+        Найти дату в чеке.
+        Форматы: DD.MM.YYYY, DD/MM/YYYY, YYYY-MM-DD
+        """
+        date_patterns = [
+            r"(\d{2}[./]\d{2}[./]\d{4})",   # DD.MM.YYYY
+            r"(\d{4}[-./]\d{2}[-./]\d{2})",  # YYYY-MM-DD
+            r"(\d{2}[./]\d{2}[./]\d{2})",    # DD.MM.YY
+        ]
+        for line in lines:
+            for pattern in date_patterns:
+                match = re.search(pattern, line)
+                if match:
+                    date_str = match.group(1)
+                    parsed = self._parse_date(date_str)
+                    if parsed:
+                        return parsed
+        return None
+
+    def _extract_retailer(self, lines: list[str]) -> Optional[str]:
+        """
+        Извлечь название магазина.
+        Обычно находится в первых 3-5 строках чека.
+        """
+        known_retailers = [
+            "пятёрочка", "пятерочка", "магнит", "лента", "перекрёсток",
+            "перекресток", "дикси", "ашан", "metro", "spar", "окей",
+            "вкусвилл", "Fix Price", "wildberries", "ozon", "яндекс",
+            "kfc", "макдональдс", "бургер кинг", "subway", "coffee",
+        ]
+        # Проверяем первые 5 строк
+        for line in lines[:5]:
+            line_lower = line.lower()
+            for retailer in known_retailers:
+                if retailer.lower() in line_lower:
+                    return line.strip()
+            # Берём первую непустую строку как название магазина
+            if len(line) > 3:
+                return line.strip()
+        return None
+
+    def _extract_items(self, lines: list[str]) -> list[dict]:
+        """
+        Извлечь позиции товаров из чека.
+        Формат строки товара: "Название ... цена"
+        """
+        items = []
+        # Паттерн: строка с суммой в конце (цена товара)
+        item_pattern = re.compile(
+            r"^(.+?)\s+(\d+[\.,]\d{2})\s*$"
+        )
+        # Ключевые слова, которые не являются товарами
+        skip_keywords = {
+            "итого", "итог", "сумма", "к оплате", "наличные",
+            "безналичные", "сдача", "скидка", "nds", "ндс",
+            "total", "cash", "change", "discount",
+        }
+
+        for line in lines:
+            line_lower = line.lower()
+            if any(kw in line_lower for kw in skip_keywords):
+                continue
+
+            match = item_pattern.match(line)
+            if match:
+                name = match.group(1).strip()
+                price_str = match.group(2).replace(",", ".")
+                try:
+                    price = float(price_str)
+                    if price > 0 and len(name) > 2:
+                        items.append({"name": name, "sum": price})
+                except ValueError:
+                    continue
+
+        return items
+
+    # ------------------------------------------------------------------
+    # Вспомогательные методы
+    # ------------------------------------------------------------------
+
+    def _find_all_amounts(self, lines: list[str]) -> list[float]:
+        """Найти все числовые суммы в тексте."""
+        pattern = re.compile(r"\b(\d{1,6}[.,]\d{2})\b")
+        amounts = []
+        for line in lines:
+            for match in pattern.finditer(line):
+                try:
+                    amounts.append(float(match.group(1).replace(",", ".")))
+                except ValueError:
+                    continue
+        return amounts
+
+    def _parse_date(self, date_str: str) -> Optional[str]:
+        """Попытаться распарсить дату в ISO формат."""
+        formats = [
+            "%d.%m.%Y", "%d/%m/%Y",
+            "%Y-%m-%d", "%Y.%m.%d",
+            "%d.%m.%y", "%d/%m/%y",
+        ]
+        for fmt in formats:
+            try:
+                dt = datetime.strptime(date_str, fmt)
+                return dt.strftime("%Y-%m-%d")
+            except ValueError:
+                continue
+        return None
+
+
+RETAILERS = ["ООО \"АГРОТОРГ\" ПЯТЕРОЧКА", "АО ТАНДЕР МАГНИТ", "ЛЕНТА", "ВкусВилл", "KFC", "Fix Price", "ИП Иванов"]
+PRODUCTS = ["Хлеб белый", "Молоко 3,2% 1л", "Сыр Российский", "Яблоки Гала", "Вода минер.", "Гречка",
+            "Масло слив. 82%", "Кефир", "Бананы", "Чай Greenfield", "Пакет", "Сок яблочный 1л"]
+SERVICE_LINES = ["КАССОВЫЙ ЧЕК", "ПРИХОД", "Кассир: Петрова", "ИНН 7825706086", "Смена 123",
+                 "ФН 9289000100408074", "ФД 12345 ФП 4212345678", "Спасибо за покупку!"]
+NOISE = ["~~ ..", "| |", "ii1l", "—", "ОО0О", "* * *"]
+
+
+def synthetic_raw_text(rng: random.Random) -> str:
+    """Сырой текст OCR: порядок и набор строк как у реального чека, с мусором распознавания"""
+    lines = [rng.choice(RETAILERS)]
+    lines += rng.sample(SERVICE_LINES, 3)
+    day, month, year = rng.randint(1, 28), rng.randint(1, 12), rng.randint(2021, 2025)
+    lines.append(rng.choice([
+        f"{day:02d}.{month:02d}.{year} {rng.randint(8, 22)}:{rng.randint(0, 59):02d}",
+        f"{year}-{month:02d}-{day:02d}",
+        f"Дата {day:02d}/{month:02d}/{year % 100:02d}",
+        f"{day:02d}.{month:02d}.{year % 100:02d}",
+    ]))
+    total = 0.0
+    for _ in range(rng.randint(3, 40)):
+        price = round(rng.uniform(20, 900), 2)
+        total += price
+        separator = rng.choice([".", ","])
+        lines.append(f"{rng.choice(PRODUCTS)} {'.' * rng.randint(0, 6)} {price:.2f}".replace(".", separator, 1)
+                     if rng.random() < 0.1 else f"{rng.choice(PRODUCTS)} {price:.2f}".replace(".", separator))
+        if rng.random() < 0.15:
+            lines.append(rng.choice(NOISE))
+        if rng.random() < 0.05:
+            lines.append(f"Скидка {rng.uniform(1, 50):.2f}")
+    if rng.random() < 0.9:
+        lines.append(rng.choice(["ИТОГО", "ИТОГ:", "К ОПЛАТЕ", "СУММА", "Итого ="]) + f" {total:.2f}")
+    lines.append(f"НАЛИЧНЫЕ {total + rng.uniform(0, 500):.2f}")
+    lines.append(f"В т.ч. НДС 20% {total / 6:.2f}")
+    lines += rng.sample(SERVICE_LINES, 2)
+    return "\n".join(line if rng.random() < 0.9 else "  " + line + "  " for line in lines)
+
+
+def load_corpus(path: Path) -> list:
+    if path.is_dir():
+        return [p.read_text(encoding="utf-8") for p in sorted(path.glob("*.txt"))]
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["raw_text"] for line in f if line.strip()]
+
+
+def bench(parse, texts, repeat: int) -> float:
+    """Текстов в секунду (лучший из repeat прогонов)"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for text in texts:
+            parse(text)
+        best = min(best, time.perf_counter() - started)
+    return len(texts) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--texts", type=int, default=5000, help="Размер синтетического корпуса")
+    parser.add_argument("--corpus", type=Path, help="Свой корпус: .jsonl с raw_text или директория .txt")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.corpus:
+        texts = load_corpus(args.corpus)
+    else:
+        rng = random.Random(42)
+        texts = [synthetic_raw_text(rng) for _ in range(args.texts)]
+
+    legacy = LegacyReceiptParser()
+    mismatches = sum(1 for text in texts if legacy._parse_receipt(text) != receipt_parser.parse(text))
+    lines = sum(len(text.splitlines()) for text in texts)
+    print(f"Текстов: {len(texts)}, строк: {lines}, расхождений с прежним парсером: {mismatches}")
+    if mismatches:
+        raise SystemExit("Результаты разбора отличаются")
+
+    legacy_rate = bench(legacy._parse_receipt, texts, args.repeat)
+    new_rate = bench(receipt_parser.parse, texts, args.repeat)
+    print(f"{'парсер':<14}{'текстов/с':>12}{'мкс/текст':>12}")
+    print(f"{'прежний':<14}{legacy_rate:>12.0f}{1e6 / legacy_rate:>12.1f}")
+    print(f"{'один проход':<14}{new_rate:>12.0f}{1e6 / new_rate:>12.1f}")
+    print(f"Ускорение: {new_rate / legacy_rate:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Бенчмарк /analytics/spending-patterns на пользователе с большой историей.
+
+Сравниваются:
+- orm: все Transaction пользователя ORM объектами и подсчёт циклом Python
+  (эталон для проверки результата)
+- numpy: analytics_service — три колонки массивами одной строкой,
+  bincount в NumPy (кэш сброшен)
+- кэш: повторный вызов — только запрос водяного знака к category_rollups
+- после вставки: новая транзакция меняет водяной знак, кэш пересчитывается
+
+Требуется PostgreSQL (DATABASE_URL) со схемой (init_db или alembic upgrade).
+
+Запуск:
+    python scripts/bench_spending_patterns.py [--transactions 100000] [--repeat 5]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from loguru import logger
+from sqlalchemy import delete, insert, select
+
+from app.db.session import AsyncSessionLocal, engine
+from app.models import Category, Transaction, User
+from app.services.analytics_service import WEEKDAYS, analytics_service
+
+
+TIMEZONE = "Asia/Yekaterinburg"
+
+
+async def create_user(session, transactions: int, years: int) -> uuid.UUID:
+    user_id = uuid.uuid4()
+    now = datetime.utcnow()
+    await session.execute(insert(User).values(
+        id=user_id, username="bench", currency="RUB", timezone=TIMEZONE, theme="light",
+        created_at=now, updated_at=now, is_active=True,
+    ))
+    category_ids = (await session.execute(
+        insert(Category).returning(Category.id),
+        [{"user_id": user_id, "name": f"bench {i}", "color": "#000000", "is_default": False, "type": "expense"}
+         for i in range(12)],
+    )).scalars().all()
+
+    rng = random.Random(42)
+    span = timedelta(days=365 * years).total_seconds()
+    records = []
+    for i in range(transactions):
+        income = rng.random() < 0.05
+        amount = round(rng.uniform(20000, 150000) if income else -rng.lognormvariate(6, 1), 2)
+        records.append((
+            user_id, rng.choice(category_ids + [None]), amount, f"bench {i}",
+            now - timedelta(seconds=rng.random() * span), False, now, now, 1,
+        ))
+
+    connection = await session.connection()
+    raw = (await connection.get_raw_connection()).driver_connection
+    await raw.copy_records_to_table(
+        "transactions", records=records,
+        columns=["user_id", "category_id", "amount", "description", "date",
+                 "is_anomaly", "created_at", "updated_at", "version"],
+    )
+    return user_id
+
+
+async def orm_patterns(session, user_id) -> dict:
+    """Прежний подход: ORM объекты и циклы Python"""
+    tz = ZoneInfo(TIMEZONE)
+    transactions = (await session.execute(
+        select(Transaction).where(Transaction.user_id == user_id, Transaction.amount < 0)
+    )).scalars().all()
+
+    counts, sums = Counter(), defaultdict(float)
+    hours, weekdays, days = Counter(), Counter(), set()
+    total = 0.0
+    for tx in transactions:
+        local = tx.date.replace(tzinfo=ZoneInfo("UTC")).astimezone(tz)
+        category_id = tx.category_id or 0
+        counts[category_id] += 1
+        sums[category_id] += -tx.amount
+        hours[local.hour] += 1
+        weekdays[local.weekday()] += 1
+        days.add(local.date())
+        total += -tx.amount
+
+    span = (max(days) - min(days)).days + 1
+    peaks = lambda counter: sorted(key for key, _ in sorted(counter.items(), key=lambda item: (-item[1], item[0]))[:3])
+    return {
+        "average_daily": round(total / span, 2),
+        "most_frequent_id": max(counts, key=lambda key: (counts[key], -key)),
+        "most_expensive_id": max(sums, key=lambda key: (sums[key], -key)),
+        "peak_spending_hours": peaks(hours),
+        "peak_spending_days": [WEEKDAYS[day] for day in peaks(weekdays)],
+    }
+
+
+async def timed(func, repeat: int) -> tuple:
+    times, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await func()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times), result
+
+
+async def run(args):
+    async with AsyncSessionLocal() as session:
+        user_id = await create_user(session, args.transactions, args.years)
+        await session.commit()
+
+        try:
+            async def numpy_cold():
+                analytics_service.invalidate(user_id)
+                return await analytics_service.spending_patterns(session, user_id)
+
+            async def orm():
+                result = await orm_patterns(session, user_id)
+                session.expunge_all()
+                return result
+
+            orm_ms, reference = await timed(orm, max(1, args.repeat // 2))
+            numpy_ms, patterns = await timed(numpy_cold, args.repeat)
+            cached_ms, _ = await timed(lambda: analytics_service.spending_patterns(session, user_id), args.repeat)
+
+            await session.execute(insert(Transaction).values(
+                user_id=user_id, amount=-500.0, date=datetime.utcnow(), is_anomaly=False,
+                created_at=datetime.utcnow(), updated_at=datetime.utcnow(), version=1,
+            ))
+            await session.commit()
+            started = time.perf_counter()
+            after_insert = await analytics_service.spending_patterns(session, user_id)
+            after_insert_ms = (time.perf_counter() - started) * 1000
+
+            print(f"{args.transactions} транзакций за {args.years} лет, медиана, мс")
+            print(f"{'orm + python':<26}{orm_ms:>10.1f}")
+            print(f"{'колонки + numpy':<26}{numpy_ms:>10.1f}{orm_ms / numpy_ms:>10.1f}x")
+            print(f"{'кэш (водяной знак)':<26}{cached_ms:>10.2f}{orm_ms / cached_ms:>10.0f}x")
+            print(f"{'после новой транзакции':<26}{after_insert_ms:>10.1f}  (пересчёт: {after_insert != patterns})")
+
+            names = await analytics_service.category_names(
+                session, [reference["most_frequent_id"], reference["most_expensive_id"]]
+            )
+            expected = {
+                "average_daily": reference["average_daily"],
+                "most_frequent_category": names[0],
+                "most_expensive_category": names[1],
+                "peak_spending_hours": reference["peak_spending_hours"],
+                "peak_spending_days": reference["peak_spending_days"],
+            }
+            mismatches = {key: (patterns[key], value) for key, value in expected.items() if patterns[key] != value}
+            print(f"\nРезультат совпадает с ORM эталоном: {'да' if not mismatches else mismatches}")
+            print(f"Паттерны: {patterns}")
+        finally:
+            await session.execute(delete(User).where(User.id == user_id))
+            await session.commit()
+
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--transactions", type=int, default=100_000)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    logger.remove()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Бенчмарк OCR длинного чека: один вызов Tesseract на всё изображение
+против параллельного распознавания полос (OCR_STRIP_*).
+
+Синтетический чек супермаркета на --items позиций отрисовывается
+моноширинным шрифтом и проходит обычную предобработку. Затем OCR
+выполняется целиком и по полосам с разным числом потоков. Выводятся
+время, число полос и совпадение склеенного текста с текстом целого
+изображения и с эталоном (difflib).
+
+Требуется установленный tesseract (rus+eng).
+
+Запуск:
+    python scripts/bench_strip_ocr.py [--items 120] [--threads 1 2 4]
+"""
+import argparse
+import difflib
+import os
+import sys
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from loguru import logger
+
+from app.config import settings
+from app.services.image_preprocessing_service import image_preprocessing_service
+from app.services.ocr_service import ocr_service
+
+
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf"
+PRODUCTS = ["Хлеб белый", "Молоко 3.2% 1л", "Сыр Российский", "Яблоки 1кг", "Вода 1.5л",
+            "Гречка 900г", "Масло сливочное", "Кефир 1%", "Бананы 1кг", "Чай чёрный"]
+
+
+def render_long_receipt(items: int, width: int = 1000) -> tuple:
+    """Длинный чек: шапка, items позиций, итог. Возвращает (PNG байты, эталонный текст)"""
+    lines = ["ООО \"ПЯТЁРОЧКА\"", "КАССОВЫЙ ЧЕК 15.01.2024 14:30"]
+    total = 0.0
+    for i in range(items):
+        price = 30 + (i * 37) % 400 + 0.9
+        total += price
+        lines.append(f"{PRODUCTS[i % len(PRODUCTS)]} {price:.2f}")
+    lines.append(f"ИТОГО: {total:.2f}")
+
+    font = ImageFont.truetype(FONT_PATH, width // 28)
+    line_height = int(width / 28 * 1.7)
+    image = Image.new("L", (width, line_height * (len(lines) + 2)), 255)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((width // 15, line_height * (i + 1)), line, font=font, fill=0)
+    return cv2.imencode(".png", np.array(image))[1].tobytes(), "\n".join(lines)
+
+
+def similarity(a: str, b: str) -> float:
+    normalize = lambda text: "\n".join(" ".join(line.split()).lower() for line in text.splitlines() if line.strip())
+    return difflib.SequenceMatcher(None, normalize(a), normalize(b)).ratio()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=120)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    logger.remove()
+
+    try:
+        engine = ocr_service.warm_up()
+    except Exception as e:
+        raise SystemExit(f"tesseract недоступен: {e}")
+    if not os.path.exists(FONT_PATH):
+        raise SystemExit(f"Шрифт не найден: {FONT_PATH}")
+
+    image_bytes, truth = render_long_receipt(args.items)
+    processed = image_preprocessing_service.preprocess_from_bytes(image_bytes)
+    print(f"Движок: {engine}, изображение после предобработки: {processed.shape[1]}x{processed.shape[0]}px")
+
+    started = time.perf_counter()
+    whole_text = ocr_service._image_to_text(Image.fromarray(processed))
+    whole_s = time.perf_counter() - started
+
+    print(f"{'вариант':<14}{'полос':>7}{'время, с':>10}{'ускорение':>11}{'= целому':>10}{'= эталону':>11}")
+    print(f"{'целиком':<14}{1:>7}{whole_s:>10.2f}{1.0:>10.1f}x{1.0:>10.3f}{similarity(whole_text, truth):>11.3f}")
+
+    for threads in args.threads:
+        settings.OCR_STRIP_THREADS = max(threads, 2)
+        settings.OCR_STRIP_MIN_HEIGHT = 1
+        ocr_service._strip_executor = None  # пересоздать пул с новым числом потоков
+
+        strips = ocr_service._split_strips(processed)
+        if threads == 1:
+            # Те же полосы, но последовательно — цена разрезания без параллелизма
+            started = time.perf_counter()
+            texts = [ocr_service._image_to_text(Image.fromarray(processed[top:bottom])) for top, bottom, _ in strips]
+            text = "\n".join(texts)
+        else:
+            started = time.perf_counter()
+            text = ocr_service._strips_to_text(processed, strips, 0)
+        elapsed = time.perf_counter() - started
+
+        print(f"{f'полосы x{threads}':<14}{len(strips):>7}{elapsed:>10.2f}{whole_s / elapsed:>10.1f}x"
+              f"{similarity(text, whole_text):>10.3f}{similarity(text, truth):>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Бенчмарк дельта-синхронизации (GET /api/v1/transactions/sync).
+
+Пользователь с --transactions транзакциями (updated_at за прошлый год)
+синхронизируется целиком, затем на сервере меняются --delta строк.
+Замеряются:
+- первая синхронизация: все страницы по --page-size, время и объём
+  ответа без сжатия и с gzip
+- дельта: запрос с сохранённым cursor — только изменённые строки
+- дельта без индекса ix_transactions_user_updated_id (индекс удаляется в
+  транзакции, которая затем откатывается)
+- последняя страница через OFFSET против keyset с тем же содержимым
+
+Запросы идут через приложение (httpx ASGITransport) вместе с
+GZipMiddleware. Требуется PostgreSQL (DATABASE_URL) со схемой (init_db или
+alembic upgrade).
+
+Запуск:
+    python scripts/bench_sync.py [--transactions 200000] [--delta 10] [--page-size 5000] [--repeat 20]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import httpx
+from loguru import logger
+from sqlalchemy import delete, insert, select, text, update
+
+from app.db.session import AsyncSessionLocal, engine
+from app.main import app
+from app.models import Transaction, User
+from app.services.sync_service import SYNC_COLUMNS, encode_cursor, sync_service
+
+
+async def create_user(session, transactions: int, now: datetime) -> uuid.UUID:
+    user_id = uuid.uuid4()
+    await session.execute(insert(User).values(
+        id=user_id, username="bench", currency="RUB", timezone="Europe/Moscow", theme="light",
+        created_at=now, updated_at=now, is_active=True,
+    ))
+    rng = random.Random(42)
+    records = []
+    for i in range(transactions):
+        date = now - timedelta(seconds=rng.random() * 365 * 86400)
+        records.append((
+            user_id, uuid.uuid4(), -round(rng.lognormvariate(6, 1), 2), f"bench {i}", date,
+            False, "bench-device", date, date + timedelta(seconds=rng.random() * 60), 1,
+        ))
+    connection = await session.connection()
+    raw = (await connection.get_raw_connection()).driver_connection
+    await raw.copy_records_to_table(
+        "transactions", records=records,
+        columns=["user_id", "client_id", "amount", "description", "date",
+                 "is_anomaly", "device_id", "created_at", "updated_at", "version"],
+    )
+    return user_id
+
+
+async def timed(func, repeat: int) -> tuple:
+    times, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await func()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times), result
+
+
+async def run(args):
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as session:
+        user_id = await create_user(session, args.transactions, now)
+        await session.commit()
+    # Как после autovacuum: карта видимости для index-only scan, статистика для планировщика
+    async with engine.connect() as connection:
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        await connection.execute(text("VACUUM ANALYZE transactions"))
+
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def sync(cursor=None):
+                params = {"user_id": str(user_id), "limit": args.page_size}
+                if cursor:
+                    params["cursor"] = cursor
+                response = await client.get(
+                    "/api/v1/transactions/sync", params=params, headers={"Accept-Encoding": "gzip"},
+                )
+                response.raise_for_status()
+                return response
+
+            # Первая синхронизация: все страницы
+            started = time.perf_counter()
+            cursor, pages, rows, raw_bytes, gzip_bytes = None, 0, 0, 0, 0
+            while True:
+                response = await sync(cursor)
+                body = response.json()
+                pages += 1
+                rows += len(body["transactions"])
+                raw_bytes += len(response.content)
+                gzip_bytes += response.num_bytes_downloaded
+                cursor = body["cursor"]
+                if not body["has_more"]:
+                    break
+            full_ms = (time.perf_counter() - started) * 1000
+
+            # Изменения на сервере (как пометка аномалии или правка с другого устройства)
+            async with AsyncSessionLocal() as session:
+                changed_ids = (await session.execute(
+                    select(Transaction.id).where(Transaction.user_id == user_id).order_by(Transaction.id).limit(args.delta)
+                )).scalars().all()
+                await session.execute(
+                    update(Transaction).where(Transaction.id.in_(changed_ids))
+                    .values(amount=Transaction.amount - 1, updated_at=datetime.utcnow(), version=Transaction.version + 1)
+                )
+                await session.commit()
+
+            delta_ms, response = await timed(lambda: sync(cursor), args.repeat)
+            delta = response.json()
+            delta_raw = len(response.content)
+            delta_gzip = response.num_bytes_downloaded
+            delta_ok = sorted(row["id"] for row in delta["transactions"]) == sorted(changed_ids)
+
+            # Тот же запрос без индекса (план: все строки пользователя и сортировка)
+            async with AsyncSessionLocal() as session:
+                await session.execute(text("DROP INDEX ix_transactions_user_updated_id"))
+
+                async def without_index():
+                    return await sync_service.changes(session, user_id, cursor, args.page_size)
+
+                no_index_ms, _ = await timed(without_index, max(1, args.repeat // 4))
+                await session.rollback()
+
+            # Последняя страница первой синхронизации: OFFSET против keyset
+            offset = max(1, args.transactions - args.page_size)
+            async with AsyncSessionLocal() as session:
+                ordered = select(*SYNC_COLUMNS).where(Transaction.user_id == user_id).order_by(
+                    Transaction.updated_at, Transaction.id,
+                )
+                boundary = (await session.execute(
+                    select(Transaction.updated_at, Transaction.id).where(Transaction.user_id == user_id)
+                    .order_by(Transaction.updated_at, Transaction.id).offset(offset - 1).limit(1)
+                )).one()
+
+                async def offset_page():
+                    return (await session.execute(ordered.offset(offset).limit(args.page_size))).all()
+
+                async def keyset_page():
+                    return await sync_service.changes(
+                        session, user_id, encode_cursor(boundary.updated_at, boundary.id), args.page_size,
+                    )
+
+                offset_ms, _ = await timed(offset_page, max(1, args.repeat // 4))
+                keyset_ms, _ = await timed(keyset_page, max(1, args.repeat // 4))
+                await session.rollback()
+
+        print(f"{args.transactions} транзакций у пользователя, страница {args.page_size}")
+        print(f"{'первая синхронизация':<34}{full_ms:>10.0f} мс  ({pages} страниц, {rows} строк, "
+              f"{raw_bytes / 1e6:.1f} МБ JSON, {gzip_bytes / 1e6:.1f} МБ gzip)")
+        print(f"{'дельта ' + str(args.delta) + ' строк (индекс)':<34}{delta_ms:>10.2f} мс  "
+              f"({len(delta['transactions'])} строк, {delta_raw} Б JSON, {delta_gzip} Б gzip, "
+              f"те же строки: {'да' if delta_ok else 'нет'})")
+        print(f"{'дельта без индекса':<34}{no_index_ms:>10.2f} мс  (только запрос сервиса)")
+        print(f"{'последняя страница OFFSET':<34}{offset_ms:>10.2f} мс")
+        print(f"{'последняя страница keyset':<34}{keyset_ms:>10.2f} мс")
+    finally:
+        async with AsyncSessionLocal() as session:
+            await session.execute(delete(User).where(User.id == user_id))
+            await session.commit()
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--transactions", type=int, default=200_000)
+    parser.add_argument("--delta", type=int, default=10)
+    parser.add_argument("--page-size", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    logger.remove()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Бенчмарк пиковой памяти на один запрос OCR: base64 в JSON против multipart.
+
+Каждый вариант выполняется в отдельном свежем процессе на одном и том же
+синтетическом фото чека. Замеряется серверная часть запроса до начала
+предобработки:
+- json:      тело запроса целиком → json.loads → OCRReceiptRequest →
+             base64 → байты → PIL → RGB массив → BGR → серый (как было)
+- multipart: тело приходит чанками в multipart парсер Starlette →
+             временный буфер UploadFile → байты → cv2.imdecode в серый
+
+Выводится пик tracemalloc: Python объекты и массивы numpy/OpenCV.
+Внутренний буфер PIL (ширина x высота x 3 байт) tracemalloc не видит,
+поэтому для json это нижняя оценка.
+
+Запуск:
+    python scripts/bench_upload_memory.py [--width 3024 --height 4032]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import cv2
+import numpy as np
+
+CHUNK_SIZE = 64 * 1024
+BOUNDARY = "----finwisebench"
+
+
+def make_receipt_jpeg(width: int, height: int) -> bytes:
+    """Синтетическое фото чека: светлый фон с шумом и строками текста"""
+    rng = np.random.default_rng(42)
+    img = np.full((height, width, 3), 235, dtype=np.uint8)
+    img = cv2.add(img, rng.integers(0, 20, img.shape, dtype=np.uint8))
+    for i, y in enumerate(range(200, height - 200, max(height // 60, 40))):
+        cv2.putText(img, f"TOVAR {i:03d}   {i * 17 % 999}.{i % 100:02d}", (150, y),
+                    cv2.FONT_HERSHEY_SIMPLEX, width / 1500, (30, 30, 30), 3)
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return encoded.tobytes()
+
+
+def multipart_body(image_bytes: bytes) -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="receipt.jpg"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + image_bytes + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def run_json(body: bytes):
+    from io import BytesIO
+    from PIL import Image
+    from app.api.v1.receipts import OCRReceiptRequest
+    from app.services.image_preprocessing_service import image_preprocessing_service
+
+    # Starlette собирает JSON тело целиком перед разбором
+    received = b"".join(body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE))
+    request = OCRReceiptRequest(**json.loads(received))
+    image_bytes = image_preprocessing_service.decode_base64(request.image_base64)
+
+    # Прежнее декодирование: PIL → RGB массив → BGR → серый
+    pil_image = Image.open(BytesIO(image_bytes)).convert("RGB")
+    img = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+def run_multipart(body: bytes):
+    from starlette.datastructures import Headers
+    from starlette.formparsers import MultiPartParser
+    from app.services.image_preprocessing_service import image_preprocessing_service
+
+    async def stream():
+        for i in range(0, len(body), CHUNK_SIZE):
+            yield body[i:i + CHUNK_SIZE]
+
+    async def receive():
+        headers = Headers({"content-type": f"multipart/form-data; boundary={BOUNDARY}"})
+        form = await MultiPartParser(headers, stream()).parse()
+        upload = form["file"]
+        try:
+            return await upload.read()
+        finally:
+            await upload.close()
+
+    image_bytes = asyncio.run(receive())
+    return image_preprocessing_service._decode_image(image_bytes)
+
+
+def child(mode: str, image_path: str):
+    """Замер в дочернем процессе; результат — JSON в stdout"""
+    from loguru import logger
+    logger.remove()
+
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+    if mode == "json":
+        body = json.dumps({"image_base64": base64.b64encode(image_bytes).decode()}).encode()
+        func = run_json
+    else:
+        body = multipart_body(image_bytes)
+        func = run_multipart
+    del image_bytes
+
+    # Прогрев импортов, чтобы в замер не попали модули и их кэши
+    small = make_receipt_jpeg(64, 64)
+    func(json.dumps({"image_base64": base64.b64encode(small).decode()}).encode() if mode == "json"
+         else multipart_body(small))
+
+    tracemalloc.start()
+    result = func(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(json.dumps({
+        "body_mb": len(body) / 1024 / 1024,
+        "traced_peak_mb": peak / 1024 / 1024,
+        "shape": list(result.shape),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=3024)
+    parser.add_argument("--height", type=int, default=4032)
+    parser.add_argument("--child", choices=["json", "multipart"], help=argparse.SUPPRESS)
+    parser.add_argument("--image", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.image)
+        return
+
+    # Фото генерируется здесь, чтобы его сборка не попала в пиковый RSS замеров
+    with tempfile.NamedTemporaryFile(suffix=".jpg") as image_file:
+        image_file.write(make_receipt_jpeg(args.width, args.height))
+        image_file.flush()
+        run_children(args, image_file.name)
+
+
+def run_children(args, image_path: str):
+    print(f"Фото {args.width}x{args.height}")
+    print(f"{'вариант':<11}{'тело, МБ':>10}{'пик на запрос, МБ':>19}")
+    for mode in ("json", "multipart"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", mode, "--image", image_path],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<11}{result['body_mb']:>10.2f}{result['traced_peak_mb']:>19.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Регрессионная проверка планов запросов аналитики по transactions.
+
+Создаёт временных пользователей с историей транзакций (по возрастанию
+даты, как растёт реальная таблица), делает VACUUM ANALYZE и проверяет
+EXPLAIN (ANALYZE) основных запросов "пользователь + период (+ категория)":
+каждый должен идти index-only scan по составному индексу без чтения
+таблицы (Heap Fetches = 0), а выборка по дате для всех пользователей —
+через BRIN. Seq Scan по transactions — ошибка. Код выхода 1, если хоть
+одна проверка не прошла (можно запускать в CI после миграций).
+
+Требуется PostgreSQL (DATABASE_URL) со схемой (init_db или alembic upgrade).
+
+Запуск:
+    python scripts/check_query_plans.py [--users 50] [--per-user 4000] [--verbose]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from loguru import logger
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.dialects import postgresql
+
+from app.db.session import AsyncSessionLocal, engine
+from app.models import Category, Transaction, User
+from app.services.analytics_service import analytics_service
+
+
+REQUIRED_INDEXES = ("ix_transactions_user_date", "ix_transactions_user_category_date", "ix_transactions_date_brin")
+
+
+async def create_data(users: int, per_user: int, years: int) -> tuple:
+    """Пользователи с категориями и транзакциями. Возвращает (user_ids, category_id первого пользователя)"""
+    now = datetime.utcnow()
+    rng = random.Random(7)
+    user_ids = [uuid.uuid4() for _ in range(users)]
+
+    async with AsyncSessionLocal() as session:
+        await session.execute(insert(User), [
+            {"id": user_id, "username": "plan-check", "currency": "RUB", "timezone": "Europe/Moscow",
+             "theme": "light", "created_at": now, "updated_at": now, "is_active": True}
+            for user_id in user_ids
+        ])
+        category_ids = (await session.execute(
+            insert(Category).returning(Category.id),
+            [{"user_id": user_ids[0], "name": f"plan-check {i}", "color": "#000000",
+              "is_default": False, "type": "expense"} for i in range(8)],
+        )).scalars().all()
+
+        span = timedelta(days=365 * years).total_seconds()
+        records = [
+            (user_id, rng.choice(category_ids), -round(rng.lognormvariate(6, 1), 2),
+             now - timedelta(seconds=rng.random() * span), False, now, now, 1)
+            for user_id in user_ids for _ in range(per_user)
+        ]
+        # Таблица растёт по времени: строки физически упорядочены по date
+        records.sort(key=lambda record: record[3])
+
+        connection = await session.connection()
+        raw = (await connection.get_raw_connection()).driver_connection
+        await raw.copy_records_to_table(
+            "transactions", records=records,
+            columns=["user_id", "category_id", "amount", "date",
+                     "is_anomaly", "created_at", "updated_at", "version"],
+        )
+        await session.commit()
+
+    # Карта видимости нужна index-only scan, статистика — планировщику
+    async with engine.connect() as connection:
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        await connection.execute(text("VACUUM ANALYZE transactions"))
+
+    return user_ids, category_ids[0]
+
+
+def plan_queries(user_id, category_id) -> list:
+    """(название, запрос, ожидаемый тип узла, ожидаемый индекс)"""
+    now = datetime.utcnow()
+    month_ago = now - timedelta(days=30)
+    year_ago = now - timedelta(days=365)
+    day = func.date_trunc("day", Transaction.date)
+    return [
+        (
+            "детализация за неделю",
+            analytics_service._transactions_breakdown_query(user_id, now - timedelta(days=7), now),
+            "Index Only Scan", "ix_transactions_user_date",
+        ),
+        (
+            "суммы по дням за год",
+            select(day, func.sum(Transaction.amount))
+            .where(Transaction.user_id == user_id, Transaction.date >= year_ago, Transaction.date < now)
+            .group_by(day),
+            "Index Only Scan", "ix_transactions_user_date",
+        ),
+        (
+            "история категории",
+            select(Transaction.date, Transaction.amount)
+            .where(Transaction.user_id == user_id, Transaction.category_id == category_id,
+                   Transaction.date >= year_ago)
+            .order_by(Transaction.date),
+            "Index Only Scan", "ix_transactions_user_category_date",
+        ),
+        (
+            "категории за месяц",
+            select(Transaction.category_id, func.sum(Transaction.amount), func.count())
+            .where(Transaction.user_id == user_id, Transaction.date >= month_ago)
+            .group_by(Transaction.category_id),
+            "Index Only Scan", "ix_transactions_user_date",
+        ),
+        (
+            "все пользователи за сутки",
+            select(func.count(), func.sum(Transaction.amount))
+            .where(Transaction.date >= now - timedelta(days=1)),
+            "Bitmap Index Scan", "ix_transactions_date_brin",
+        ),
+    ]
+
+
+def walk(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk(child)
+
+
+async def explain(session, query) -> dict:
+    sql = query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    result = await session.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"))
+    payload = result.scalar()
+    return (json.loads(payload) if isinstance(payload, str) else payload)[0]
+
+
+async def run(args) -> bool:
+    async with AsyncSessionLocal() as session:
+        existing = set((await session.execute(
+            text("SELECT indexname FROM pg_indexes WHERE tablename = 'transactions'")
+        )).scalars())
+    missing = [name for name in REQUIRED_INDEXES if name not in existing]
+    if missing:
+        print(f"Нет индексов: {', '.join(missing)} — примените миграции (alembic upgrade head)")
+        return False
+
+    user_ids, category_id = await create_data(args.users, args.per_user, args.years)
+    print(f"Данные: {args.users} пользователей x {args.per_user} транзакций\n")
+    print(f"{'запрос':<28}{'узел':<20}{'индекс':<38}{'heap fetches':>13}{'мс':>8}  результат")
+
+    ok = True
+    try:
+        async with AsyncSessionLocal() as session:
+            for name, query, expected_type, expected_index in plan_queries(user_ids[0], category_id):
+                plan = await explain(session, query)
+                nodes = list(walk(plan["Plan"]))
+                transaction_nodes = [
+                    node for node in nodes
+                    if node.get("Relation Name") == "transactions" or node.get("Index Name", "").startswith("ix_transactions")
+                ]
+                matched = [
+                    node for node in transaction_nodes
+                    if node["Node Type"] == expected_type and node.get("Index Name") == expected_index
+                ]
+                seq_scan = any(node["Node Type"] == "Seq Scan" for node in transaction_nodes)
+                heap_fetches = sum(node.get("Heap Fetches", 0) for node in matched)
+
+                passed = bool(matched) and not seq_scan
+                if expected_type == "Index Only Scan" and heap_fetches:
+                    passed = False
+                ok &= passed
+
+                used = (matched or transaction_nodes or [{}])[0]
+                print(
+                    f"{name:<28}{used.get('Node Type', '-'):<20}{used.get('Index Name', '-'):<38}"
+                    f"{heap_fetches:>13}{plan['Execution Time']:>8.2f}  {'OK' if passed else 'FAIL'}"
+                )
+                if args.verbose or not passed:
+                    print(f"    ожидался {expected_type} по {expected_index}")
+                    for node in nodes:
+                        print(f"    {node['Node Type']:<22}{node.get('Index Name', node.get('Relation Name', ''))}")
+    finally:
+        async with AsyncSessionLocal() as session:
+            await session.execute(delete(User).where(User.id.in_(user_ids)))
+            await session.commit()
+        await engine.dispose()
+
+    print(f"\n{'Все планы в порядке' if ok else 'Есть регрессии планов'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--per-user", type=int, default=4000)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--verbose", action="store_true", help="Печатать план каждого запроса")
+    args = parser.parse_args()
+
+    logger.remove()
+    sys.exit(0 if asyncio.run(run(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
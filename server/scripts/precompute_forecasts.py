@@ -0,0 +1,244 @@
+"""
+Ночной предрасчёт прогнозов расходов для всех активных пользователей.
+
+После push-уведомления приложение открывают тысячи пользователей разом;
+чтобы /ml/forecast не обучал модели для каждого на месте, прогнозы
+считаются заранее и пишутся в таблицу forecasts:
+- пользователи читаются потоком через серверный курсор (session.stream +
+  yield_per) по возрастанию id, пачками по --chunk-size
+- на пачку — один запрос недельных сумм по (пользователь, неделя,
+  категория) за самое длинное окно из --history-months и один запрос
+  подписей истории (forecast_service.checksums)
+- обучение пачек в пуле процессов (fit_forecasts, CPU-bound), пока
+  главный процесс читает и пишет следующие
+- запись пачкой: INSERT ... ON CONFLICT DO UPDATE по (пользователь,
+  длина истории, период)
+- после каждой записанной пачки — checkpoint (последний id) в файл;
+  повторный запуск продолжает с него. Checkpoint другой недели (окно
+  обучения сдвинулось) или с другими параметрами не используется
+- отчёт о скорости: пользователей/с
+
+/ml/forecast отдаёт сохранённый прогноз, пока у пользователя не
+завершилась новая неделя и не изменилась уже учтённая история; для
+остальных прогноз считается на месте.
+
+Запуск:
+    python scripts/precompute_forecasts.py [--chunk-size 500] [--workers 8]
+        [--history-months 6 12] [--engine smoothing|prophet]
+        [--checkpoint forecasts_checkpoint.json] [--reset] [--limit N]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from uuid import UUID
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import numpy as np
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import settings
+from app.db.session import AsyncSessionLocal, engine
+from app.models.forecast import Forecast
+from app.models.user import User
+from app.services.analytics_service import analytics_service
+from app.services.forecast_service import (
+    ENGINES, forecast_service, prophet_available, training_window, with_names,
+)
+
+
+def precompute_chunk(windows: dict, cutoff: datetime, engine_name: str) -> list:
+    """
+    Обучить пачку в процессе пула. windows: {history_months: (start, [(user_id, weekly, category_ids)])}.
+    Возвращает [(user_id, history_months, {период: прогноз})]
+    """
+    from app.services.forecast_service import PERIODS, fit_forecasts
+
+    results = []
+    for history_months, (start, items) in windows.items():
+        series = []
+        for _, weekly, category_ids in items:
+            # Как при обучении на месте: только категории с расходами в окне
+            active = weekly.sum(axis=1) > 0
+            series.append((weekly[active], category_ids[active]))
+        forecasts = fit_forecasts(series, start, cutoff, PERIODS, engine_name)
+        results.extend((user_id, history_months, forecast) for (user_id, _, _), forecast in zip(items, forecasts))
+    return results
+
+
+def load_checkpoint(path: Path, reset: bool, run: dict) -> dict:
+    state = {**run, "last_user_id": None, "processed": 0}
+    if reset or not path.exists():
+        return state
+    saved = json.loads(path.read_text())
+    if any(saved.get(key) != value for key, value in run.items()):
+        logger.info(f"Checkpoint is for another run ({saved.get('cutoff')}, {saved.get('engine')}), starting over")
+        return state
+    logger.info(f"▶️  Resuming after user {saved['last_user_id']} ({saved['processed']} users already processed)")
+    return {**state, **saved}
+
+
+def save_checkpoint(path: Path, state: dict):
+    # Через временный файл: прерванная запись не портит checkpoint
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(json.dumps(state))
+    tmp_path.replace(path)
+
+
+async def load_chunk(session, user_ids: list, windows: dict, cutoff: datetime) -> tuple:
+    """Ряды пользователей пачки (один запрос за самое длинное окно) по окнам и их подписи"""
+    series = await forecast_service.fetch_weekly_many(session, user_ids, min(windows.values()), cutoff)
+    checksums = await forecast_service.checksums(session, user_ids, cutoff)
+
+    chunk = {}
+    for history_months, start in windows.items():
+        weeks = (cutoff - start).days // 7
+        empty = (np.zeros((0, weeks)), np.zeros(0, dtype=np.int64))
+        items = []
+        for user_id in user_ids:
+            weekly, category_ids = series.get(user_id, empty)
+            items.append((user_id, weekly[:, -weeks:], category_ids))
+        chunk[history_months] = (start, items)
+    return chunk, checksums
+
+
+async def write_chunk(results: list, checksums: dict, cutoff: datetime, engine_name: str) -> int:
+    """Записать прогнозы пачки. Возвращает число строк"""
+    async with AsyncSessionLocal() as session:
+        category_ids = sorted({
+            int(category_id)
+            for _, _, forecasts in results for result in forecasts.values()
+            for category_id, _, _ in result["per_category"]
+        })
+        names = dict(zip(category_ids, await analytics_service.category_names(session, category_ids)))
+
+        now = datetime.utcnow()
+        rows = [
+            {
+                "user_id": user_id,
+                "history_months": history_months,
+                "period": period,
+                "engine": engine_name,
+                "result": with_names(
+                    result, [names[int(category_id)] for category_id, _, _ in result["per_category"]], engine_name,
+                ),
+                "fitted_until": cutoff,
+                "checksum": checksums[user_id],
+                "computed_at": now,
+            }
+            for user_id, history_months, forecasts in results
+            for period, result in forecasts.items()
+        ]
+        statement = insert(Forecast)
+        await session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[Forecast.user_id, Forecast.history_months, Forecast.period],
+                set_={
+                    column: statement.excluded[column]
+                    for column in ("engine", "result", "fitted_until", "checksum", "computed_at")
+                },
+            ),
+            rows,
+        )
+        await session.commit()
+    return len(rows)
+
+
+async def precompute(args):
+    cutoff = training_window(datetime.utcnow(), min(args.history_months))[1]
+    windows = {months: training_window(cutoff, months)[0] for months in sorted(set(args.history_months))}
+
+    checkpoint_path = Path(args.checkpoint)
+    run = {"cutoff": cutoff.isoformat(), "engine": args.engine, "history_months": sorted(windows)}
+    state = load_checkpoint(checkpoint_path, args.reset, run)
+
+    query = select(User.id).where(User.is_active.is_(True)).order_by(User.id)
+    if state["last_user_id"]:
+        query = query.where(User.id > UUID(state["last_user_id"]))
+    if args.limit:
+        query = query.limit(args.limit)
+    query = query.execution_options(yield_per=args.chunk_size)
+
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    processed = 0
+    written = 0
+    # Пачек в работе: пока пишется одна, пул обучает следующие
+    max_pending = args.workers * 2
+
+    async def flush(pending_chunk):
+        nonlocal processed, written
+        user_ids, checksums, future = pending_chunk
+        results = await future
+        written += await write_chunk(results, checksums, cutoff, args.engine)
+
+        processed += len(user_ids)
+        state["last_user_id"] = str(user_ids[-1])
+        state["processed"] += len(user_ids)
+        save_checkpoint(checkpoint_path, state)
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"📊 {state['processed']} users (last {state['last_user_id']}), "
+            f"{processed / elapsed:.0f} users/s"
+        )
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+        pending = deque()
+        async with AsyncSessionLocal() as read_session, AsyncSessionLocal() as data_session:
+            # Серверный курсор: id приходят пачками по yield_per, а не всей таблицей
+            result = await read_session.stream(query)
+            async for partition in result.partitions():
+                user_ids = [row.id for row in partition]
+                chunk, checksums = await load_chunk(data_session, user_ids, windows, cutoff)
+                # Не держать снимок открытым между пачками
+                await data_session.commit()
+                future = loop.run_in_executor(pool, precompute_chunk, chunk, cutoff, args.engine)
+                pending.append((user_ids, checksums, future))
+                if len(pending) >= max_pending:
+                    await flush(pending.popleft())
+
+            while pending:
+                await flush(pending.popleft())
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"✅ Done: {processed} users in {elapsed:.1f}s ({processed / max(elapsed, 1e-9):.0f} users/s), "
+        f"{written} forecasts written, window until {cutoff:%Y-%m-%d}, engine {args.engine}"
+    )
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunk-size", type=int, default=500, help="Пользователей в пачке (yield_per, запросы, INSERT)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Процессов для обучения")
+    parser.add_argument("--history-months", type=int, nargs="+", default=[6], choices=range(3, 25), metavar="N",
+                        help="Длины истории в месяцах (как ForecastRequest.history_months)")
+    parser.add_argument("--engine", choices=ENGINES, default=settings.FORECAST_ENGINE)
+    parser.add_argument("--checkpoint", default="forecasts_checkpoint.json", help="Файл checkpoint")
+    parser.add_argument("--reset", action="store_true", help="Игнорировать checkpoint и начать сначала")
+    parser.add_argument("--limit", type=int, help="Обработать не больше N пользователей")
+    args = parser.parse_args()
+
+    if args.engine == "prophet" and not prophet_available():
+        parser.error("engine 'prophet' requires the prophet package")
+
+    logger.info(f"🚀 Precomputing forecasts: engine {args.engine}, history {args.history_months} months")
+    asyncio.run(precompute(args))
+
+
+if __name__ == "__main__":
+    main()
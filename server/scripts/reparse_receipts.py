@@ -0,0 +1,244 @@
+"""
+Массовый повторный разбор сохранённого текста чеков текущим парсером.
+
+Обрабатываются транзакции, у которых в receipt_data есть raw_text (чеки
+из OCR), а receipt_data.parser_version меньше PARSER_VERSION:
+- чтение потоком через серверный курсор (session.stream + yield_per),
+  по возрастанию id
+- разбор пачек в пуле процессов (receipt_parser, CPU-bound)
+- запись пачками: изменившиеся строки — один UPDATE ... FROM unnest(...)
+  по id (с проверкой updated_at: строку, изменённую клиентом во время
+  работы, не перезаписываем — это конфликт; updated_at и version
+  поднимаются, чтобы новый разбор приехал клиентам при синхронизации и не
+  был затёрт их старой копией), неизменившиеся — один
+  UPDATE ... WHERE id = ANY, который только ставит parser_version
+- после каждой записанной пачки — checkpoint (последний id) в файл;
+  повторный запуск продолжает с него
+- конфликты не теряются: их id хранятся в checkpoint (retry_ids) и после
+  основного прохода перечитываются и разбираются снова (до RETRY_ROUNDS
+  раз); оставшиеся повторный запуск пробует первыми
+- отчёт о скорости: строк/с, сколько изменилось, сколько конфликтов
+
+Запуск:
+    python scripts/reparse_receipts.py [--batch-size 2000] [--workers 8]
+        [--checkpoint reparse_checkpoint.json] [--reset] [--dry-run] [--limit N]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from loguru import logger
+from sqlalchemy import Integer, or_, select, text
+
+from app.db.session import AsyncSessionLocal, engine
+from app.models.transaction import Transaction
+from app.services.receipt_parser import PARSER_VERSION
+
+
+# Поля receipt_data, которые пересчитывает парсер
+PARSED_FIELDS = ("total", "date", "retailer", "items")
+# Повторных проходов по конфликтам за запуск (строку могут менять снова и снова)
+RETRY_ROUNDS = 3
+
+transactions = Transaction.__table__
+
+UPDATE_CHANGED = text("""
+    UPDATE transactions AS t
+    SET receipt_data = v.data::jsonb, updated_at = :now, version = t.version + 1
+    FROM unnest(CAST(:ids AS integer[]), CAST(:seen AS timestamp[]), CAST(:data AS text[]))
+        AS v(id, seen, data)
+    WHERE t.id = v.id AND t.updated_at = v.seen
+    RETURNING t.id
+""")
+
+STAMP_UNCHANGED = text("""
+    UPDATE transactions
+    SET receipt_data = jsonb_set(receipt_data, '{parser_version}', to_jsonb(CAST(:version AS integer)))
+    WHERE id = ANY(CAST(:ids AS integer[]))
+""")
+
+
+def reparse_chunk(rows: list) -> list:
+    """Разобрать пачку (id, raw_text) в процессе пула"""
+    from app.services.receipt_parser import receipt_parser
+
+    return [(row_id, receipt_parser.parse(raw_text)) for row_id, raw_text in rows]
+
+
+def load_checkpoint(path: Path, reset: bool) -> dict:
+    state = {
+        "parser_version": PARSER_VERSION, "last_id": 0, "processed": 0, "changed": 0, "conflicts": 0,
+        "retry_ids": [],
+    }
+    if reset or not path.exists():
+        return state
+    saved = json.loads(path.read_text())
+    if saved.get("parser_version") != PARSER_VERSION:
+        logger.info(f"Checkpoint is for parser v{saved.get('parser_version')}, starting over")
+        return state
+    logger.info(
+        f"▶️  Resuming after id {saved['last_id']} ({saved['processed']} rows already processed, "
+        f"{len(saved.get('retry_ids', []))} conflicts to retry)"
+    )
+    return {**state, **saved}
+
+
+def save_checkpoint(path: Path, state: dict):
+    # Через временный файл: прерванная запись не портит checkpoint
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(json.dumps(state))
+    tmp_path.replace(path)
+
+
+async def write_batch(rows: list, parsed: list, dry_run: bool) -> tuple:
+    """Записать результаты пачки. Возвращает (изменено, id конфликтов)"""
+    changed_ids, changed_seen, changed_data, unchanged = [], [], [], []
+    for (row_id, receipt_data, updated_at), (_, result) in zip(rows, parsed):
+        if all(receipt_data.get(field) == result[field] for field in PARSED_FIELDS):
+            unchanged.append(row_id)
+        else:
+            changed_ids.append(row_id)
+            changed_seen.append(updated_at)
+            changed_data.append(json.dumps(
+                {**receipt_data, **result, "parser_version": PARSER_VERSION}, ensure_ascii=False
+            ))
+
+    if dry_run:
+        return len(changed_ids), []
+
+    updated = set()
+    async with AsyncSessionLocal() as session:
+        if changed_ids:
+            # Одна команда на пачку; строку, которую клиент изменил после чтения, не трогаем
+            result = await session.execute(UPDATE_CHANGED, {
+                "ids": changed_ids,
+                "seen": changed_seen,
+                "data": changed_data,
+                "now": datetime.utcnow(),
+            })
+            updated = set(result.scalars().all())
+        if unchanged:
+            # Результат разбора тот же — только отмечаем версию, клиентам синхронизировать нечего
+            await session.execute(STAMP_UNCHANGED, {"ids": unchanged, "version": PARSER_VERSION})
+        await session.commit()
+    return len(updated), [row_id for row_id in changed_ids if row_id not in updated]
+
+
+async def reparse(args):
+    checkpoint_path = Path(args.checkpoint)
+    state = load_checkpoint(checkpoint_path, args.reset)
+
+    receipt_data = transactions.c.receipt_data
+    stored_version = receipt_data["parser_version"].astext.cast(Integer)
+    columns = select(transactions.c.id, receipt_data, transactions.c.updated_at).where(
+        receipt_data.has_key("raw_text"),
+        or_(stored_version.is_(None), stored_version < PARSER_VERSION),
+    )
+    query = columns.where(transactions.c.id > state["last_id"]).order_by(transactions.c.id)
+    if args.limit:
+        query = query.limit(args.limit)
+
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    processed = 0
+    # Пачек в работе: пока пишется одна, пул разбирает следующие
+    max_pending = args.workers * 2
+
+    async def flush(pending_batch, advance: bool):
+        nonlocal processed
+        rows, future = pending_batch
+        parsed = await future
+        changed, conflicted = await write_batch(rows, parsed, args.dry_run)
+
+        processed += len(rows)
+        if advance:
+            state["last_id"] = rows[-1][0]
+        state["processed"] += len(rows)
+        state["changed"] += changed
+        state["conflicts"] += len(conflicted)
+        # Разобранные строки уходят из очереди повторов, новые конфликты — в неё
+        done = {row[0] for row in rows}
+        state["retry_ids"] = [row_id for row_id in state["retry_ids"] if row_id not in done] + conflicted
+        if not args.dry_run:
+            save_checkpoint(checkpoint_path, state)
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"📊 {state['processed']} rows (last id {state['last_id']}), changed {state['changed']}, "
+            f"conflicts {state['conflicts']} ({len(state['retry_ids'])} to retry), {processed / elapsed:.0f} rows/s"
+        )
+
+    async def run(pool, statement, advance: bool) -> set:
+        """Прочитать, разобрать и записать строки запроса; возвращает прочитанные id"""
+        seen = set()
+        pending = deque()
+        async with AsyncSessionLocal() as read_session:
+            # Серверный курсор: строки приходят пачками по yield_per, а не всей таблицей
+            result = await read_session.stream(statement.execution_options(yield_per=args.batch_size))
+            async for partition in result.partitions():
+                rows = [(row.id, row.receipt_data, row.updated_at) for row in partition]
+                seen.update(row[0] for row in rows)
+                future = loop.run_in_executor(
+                    pool, reparse_chunk, [(row_id, data["raw_text"] or "") for row_id, data, _ in rows]
+                )
+                pending.append((rows, future))
+                if len(pending) >= max_pending:
+                    await flush(pending.popleft(), advance)
+
+            while pending:
+                await flush(pending.popleft(), advance)
+        return seen
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+        await run(pool, query, advance=True)
+
+        # Конфликты: строки перечитываются с новым updated_at и разбираются ещё раз
+        for _ in range(RETRY_ROUNDS):
+            retry_ids = set(state["retry_ids"])
+            if not retry_ids:
+                break
+            logger.info(f"🔁 Retrying {len(retry_ids)} conflicted rows")
+            seen = await run(pool, columns.where(transactions.c.id.in_(retry_ids)).order_by(transactions.c.id), advance=False)
+            # Не прочитанные больше не требуют разбора (клиент убрал текст или версия уже новая)
+            state["retry_ids"] = [row_id for row_id in state["retry_ids"] if row_id in seen or row_id not in retry_ids]
+            if not args.dry_run:
+                save_checkpoint(checkpoint_path, state)
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"✅ Done: {processed} rows in {elapsed:.1f}s ({processed / max(elapsed, 1e-9):.0f} rows/s), "
+        f"changed {state['changed']}, conflicts {state['conflicts']} ({len(state['retry_ids'])} left to retry), "
+        f"parser v{PARSER_VERSION}"
+        + (" (dry run, nothing written)" if args.dry_run else "")
+    )
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=2000, help="Строк в пачке (yield_per и UPDATE)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Процессов для разбора")
+    parser.add_argument("--checkpoint", default="reparse_checkpoint.json", help="Файл checkpoint")
+    parser.add_argument("--reset", action="store_true", help="Игнорировать checkpoint и начать сначала")
+    parser.add_argument("--dry-run", action="store_true", help="Только разобрать и посчитать изменения")
+    parser.add_argument("--limit", type=int, help="Обработать не больше N строк")
+    args = parser.parse_args()
+
+    logger.info(f"🚀 Re-parsing stored receipts with parser v{PARSER_VERSION}")
+    asyncio.run(reparse(args))
+
+
+if __name__ == "__main__":
+    main()
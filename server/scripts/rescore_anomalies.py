@@ -0,0 +1,284 @@
+"""
+Периодический пакетный пересчёт аномалий: статистика по истории и Isolation Forest.
+
+Онлайн /ml/detect-anomaly обновляет user_category_stats по одной
+транзакции. Этот скрипт раз в сутки/неделю:
+- перестраивает user_category_stats по всей истории расходов (Welford,
+  EWMA, маркеры P² — RunningStats.from_values): заполняет статистику для
+  транзакций, пришедших в обход API, и после миграции
+- переоценивает is_anomaly Isolation Forest по каждому пользователю
+  (признаки: log суммы, отклонение от обычной суммы категории, час,
+  день недели). Аномалией считаются только траты выше обычных; строки
+  обновляются, только если флаг изменился (с updated_at и version —
+  чтобы изменение приехало клиентам)
+
+Как и предрасчёт прогнозов: пользователи читаются потоком пачками, на
+пачку — один запрос (массивы расходов по пользователю), обучение в пуле
+процессов, запись пачкой, checkpoint после каждой пачки и отчёт
+пользователей/с. Checkpoint нужен только для продолжения прерванного
+запуска: после прохода по всем пользователям он удаляется. Строки,
+вошедшие в перестроенную статистику, помечаются anomaly_observed. Статистику, которую онлайн обновил во время пересчёта,
+скрипт не перезаписывает.
+
+Запуск:
+    python scripts/rescore_anomalies.py [--chunk-size 200] [--workers 8]
+        [--contamination 0.01] [--stats-only]
+        [--checkpoint anomalies_checkpoint.json] [--reset] [--limit N]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from uuid import UUID
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import numpy as np
+from loguru import logger
+from sqlalchemy import Float, cast, func, select, text
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
+
+from app.db.session import AsyncSessionLocal, engine
+from app.models.transaction import Transaction
+from app.models.user import User
+from app.models.user_category_stats import ALL_CATEGORIES, UserCategoryStats
+
+
+# Меньше трат — Isolation Forest не обучается, флаги пользователя не трогаем
+MIN_FOREST_SAMPLES = 50
+
+# Строки, вошедшие в перестроенную статистику, — учтены: онлайн их больше не учитывает
+MARK_OBSERVED = text("""
+    UPDATE transactions SET anomaly_observed = true
+    WHERE id = ANY(CAST(:ids AS integer[])) AND NOT anomaly_observed
+""")
+
+UPDATE_FLAGS = text("""
+    UPDATE transactions AS t
+    SET is_anomaly = v.flag, updated_at = :now, version = t.version + 1
+    FROM unnest(CAST(:ids AS integer[]), CAST(:flags AS boolean[])) AS v(id, flag)
+    WHERE t.id = v.id AND t.is_anomaly IS DISTINCT FROM v.flag
+    RETURNING t.id
+""")
+
+
+def rescore_chunk(items: list, contamination: float, use_forest: bool) -> list:
+    """
+    Пересчитать пачку в процессе пула: (user_id, ids, amounts, categories, epochs) по возрастанию даты →
+    (user_id, {category_id: строка статистики}, ids, category_ids, flags или None)
+    """
+    from sklearn.ensemble import IsolationForest
+
+    from app.models.user_category_stats import ALL_CATEGORIES
+    from app.services.anomaly_service import RunningStats
+
+    results = []
+    for user_id, ids, amounts, categories, epochs in items:
+        stats = {ALL_CATEGORIES: RunningStats.from_values(amounts).as_row()}
+        codes, inverse = np.unique(categories, return_inverse=True)
+        for index, category_id in enumerate(codes):
+            stats[int(category_id)] = RunningStats.from_values(amounts[inverse == index]).as_row()
+
+        flags = None
+        if use_forest and len(amounts) >= MIN_FOREST_SAMPLES:
+            log_amounts = np.log1p(amounts)
+            usual = np.bincount(inverse, weights=log_amounts) / np.bincount(inverse)
+            relative = log_amounts - usual[inverse]
+            days = np.floor_divide(epochs, 86400)
+            features = np.column_stack([
+                log_amounts, relative,
+                np.floor_divide(epochs, 3600) % 24, (days + 3) % 7,
+            ])
+            forest = IsolationForest(n_estimators=100, contamination=contamination, random_state=0)
+            outliers = forest.fit_predict(features) == -1
+            # Необычно маленькие траты аномалией не считаем
+            flags = (outliers & (relative > 0)).tolist()
+        results.append((user_id, stats, ids.tolist(), categories.tolist(), flags))
+    return results
+
+
+def load_checkpoint(path: Path, reset: bool) -> dict:
+    state = {"last_user_id": None, "processed": 0, "flags_changed": 0}
+    if reset or not path.exists():
+        return state
+    saved = json.loads(path.read_text())
+    logger.info(f"▶️  Resuming after user {saved['last_user_id']} ({saved['processed']} users already processed)")
+    return {**state, **saved}
+
+
+def save_checkpoint(path: Path, state: dict):
+    # Через временный файл: прерванная запись не портит checkpoint
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(json.dumps(state))
+    tmp_path.replace(path)
+
+
+async def load_chunk(session, user_ids: list) -> list:
+    """Расходы пользователей пачки одним запросом: строка на пользователя с массивами по возрастанию даты"""
+    # date хранится в UTC; timezone(tz, timezone('UTC', date)) — локальное время пользователя
+    local_time = func.timezone(User.timezone, func.timezone("UTC", Transaction.date))
+
+    def ordered(column):
+        return func.array_agg(aggregate_order_by(column, Transaction.date, Transaction.id))
+
+    rows = (await session.execute(
+        select(
+            Transaction.user_id,
+            ordered(Transaction.id),
+            ordered(-Transaction.amount),
+            ordered(func.coalesce(Transaction.category_id, 0)),
+            ordered(cast(func.extract("epoch", local_time), Float)),
+        )
+        .join(User, User.id == Transaction.user_id)
+        .where(Transaction.user_id.in_(user_ids), Transaction.amount < 0)
+        .group_by(Transaction.user_id)
+    )).all()
+    return [
+        (
+            user_id,
+            np.asarray(ids, dtype=np.int64),
+            np.asarray(amounts, dtype=np.float64),
+            np.asarray(categories, dtype=np.int64),
+            np.asarray(epochs, dtype=np.float64),
+        )
+        for user_id, ids, amounts, categories, epochs in rows
+    ]
+
+
+async def write_chunk(results: list, started_at: datetime) -> int:
+    """Записать статистику и изменившиеся флаги пачки. Возвращает число изменённых флагов"""
+    now = datetime.utcnow()
+    stats_rows = [
+        {"user_id": user_id, "category_id": category_id, **row, "updated_at": now}
+        for user_id, stats, _, _, _ in results for category_id, row in stats.items()
+    ]
+    ids, flags = [], []
+    for _, _, tx_ids, _, user_flags in results:
+        if user_flags is not None:
+            ids.extend(tx_ids)
+            flags.extend(user_flags)
+
+    async with AsyncSessionLocal() as session:
+        written = set()
+        if stats_rows:
+            statement = insert(UserCategoryStats)
+            written = set((await session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[UserCategoryStats.user_id, UserCategoryStats.category_id],
+                    set_={
+                        column: statement.excluded[column]
+                        for column in ("count", "mean", "m2", "ewma", "ewm_var", "p2_heights", "p2_positions", "updated_at")
+                    },
+                    # Онлайн обновил строку после чтения истории — его состояние новее
+                    where=UserCategoryStats.updated_at < started_at,
+                ).returning(UserCategoryStats.user_id, UserCategoryStats.category_id),
+                stats_rows,
+            )).tuples().all())
+        # Отметка — только строки, чья категория и ALL_CATEGORIES записаны нашей статистикой:
+        # пропущенную строку онлайн обновил позже, его состояние может их не содержать
+        observed = [
+            tx_id
+            for user_id, _, tx_ids, categories, _ in results if (user_id, ALL_CATEGORIES) in written
+            for tx_id, category_id in zip(tx_ids, categories) if (user_id, category_id) in written
+        ]
+        if observed:
+            await session.execute(MARK_OBSERVED, {"ids": observed})
+        changed = 0
+        if ids:
+            result = await session.execute(UPDATE_FLAGS, {"ids": ids, "flags": flags, "now": now})
+            changed = len(result.fetchall())
+        await session.commit()
+    return changed
+
+
+async def rescore(args):
+    checkpoint_path = Path(args.checkpoint)
+    state = load_checkpoint(checkpoint_path, args.reset)
+
+    query = select(User.id).order_by(User.id)
+    if state["last_user_id"]:
+        query = query.where(User.id > UUID(state["last_user_id"]))
+    if args.limit:
+        query = query.limit(args.limit)
+    query = query.execution_options(yield_per=args.chunk_size)
+
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    processed = 0
+    # Пачек в работе: пока пишется одна, пул считает следующие
+    max_pending = args.workers * 2
+
+    async def flush(pending_chunk):
+        nonlocal processed
+        user_ids, read_at, future = pending_chunk
+        results = await future
+        state["flags_changed"] += await write_chunk(results, read_at)
+
+        processed += len(user_ids)
+        state["last_user_id"] = str(user_ids[-1])
+        state["processed"] += len(user_ids)
+        save_checkpoint(checkpoint_path, state)
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"📊 {state['processed']} users (last {state['last_user_id']}), "
+            f"flags changed {state['flags_changed']}, {processed / elapsed:.0f} users/s"
+        )
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+        pending = deque()
+        async with AsyncSessionLocal() as read_session, AsyncSessionLocal() as data_session:
+            # Серверный курсор: id приходят пачками по yield_per, а не всей таблицей
+            result = await read_session.stream(query)
+            async for partition in result.partitions():
+                user_ids = [row.id for row in partition]
+                read_at = datetime.utcnow()
+                items = await load_chunk(data_session, user_ids)
+                # Не держать снимок открытым между пачками
+                await data_session.commit()
+                future = loop.run_in_executor(pool, rescore_chunk, items, args.contamination, not args.stats_only)
+                pending.append((user_ids, read_at, future))
+                if len(pending) >= max_pending:
+                    await flush(pending.popleft())
+
+            while pending:
+                await flush(pending.popleft())
+
+    if not args.limit or processed < args.limit:
+        # Все пользователи пройдены: следующий запуск — новый полный пересчёт, а не продолжение этого
+        checkpoint_path.unlink(missing_ok=True)
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"✅ Done: {processed} users in {elapsed:.1f}s ({processed / max(elapsed, 1e-9):.0f} users/s), "
+        f"flags changed {state['flags_changed']}" + (" (statistics only)" if args.stats_only else "")
+    )
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunk-size", type=int, default=200, help="Пользователей в пачке")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Процессов для пересчёта")
+    parser.add_argument("--contamination", type=float, default=0.01, help="Доля аномалий для Isolation Forest")
+    parser.add_argument("--stats-only", action="store_true", help="Только перестроить статистику, без Isolation Forest")
+    parser.add_argument("--checkpoint", default="anomalies_checkpoint.json", help="Файл checkpoint")
+    parser.add_argument("--reset", action="store_true", help="Игнорировать checkpoint и начать сначала")
+    parser.add_argument("--limit", type=int, help="Обработать не больше N пользователей")
+    args = parser.parse_args()
+
+    logger.info("🚀 Rescoring anomalies" + (" (statistics only)" if args.stats_only else ""))
+    asyncio.run(rescore(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Проверка адаптивной предобработки: время стадий и точность OCR против
+полного pipeline (OCR_PREPROCESS_MODE=full).
+
+Набор фикстур — синтетический чек, отрисованный моноширинным шрифтом,
+в нескольких вариантах качества: чистый скан, гауссов шум разной силы,
+низкий контраст, размытие, неравномерное освещение, маленькое фото,
+фото чека на столе под углом (проверка поиска и вырезания чека).
+Можно добавить реальные фото: директория --fixtures с парами
+<имя>.jpg|.png и <имя>.txt (эталонный текст).
+
+Для каждой фикстуры и режима выводятся: оценка шума, выбранные стадии,
+время предобработки и точность OCR (доля совпавших символов с эталоном
+по difflib). Без установленного tesseract выводится только время.
+
+Запуск:
+    python scripts/validate_preprocessing.py [--fixtures data/ocr_fixtures] [--repeat 3]
+"""
+import argparse
+import difflib
+import os
+import statistics
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from loguru import logger
+
+from app.services.image_preprocessing_service import image_preprocessing_service
+from app.services.ocr_service import ocr_service
+
+
+FONT_PATHS = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSansMono.ttf",
+]
+
+RECEIPT_LINES = [
+    "ООО \"ПЯТЁРОЧКА\"",
+    "ИНН 7825706086",
+    "КАССОВЫЙ ЧЕК 15.01.2024 14:30",
+    "Хлеб белый 45.50",
+    "Молоко 3.2% 1л 2 x 89.90 179.80",
+    "Сыр Российский 312.00",
+    "Яблоки 1.2кг 155.40",
+    "Вода минеральная 49.90",
+    "ИТОГО: 742.60",
+    "НАЛИЧНЫМИ 1000.00",
+    "СДАЧА 257.40",
+]
+
+
+def load_font(size: int):
+    for path in FONT_PATHS:
+        if os.path.exists(path):
+            return ImageFont.truetype(path, size), True
+    # Шрифт Pillow по умолчанию без кириллицы — эталон будет транслитерирован
+    return ImageFont.load_default(size=size), False
+
+
+def transliterate(text: str) -> str:
+    table = str.maketrans(
+        "АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯабвгдеёжзийклмнопрстуфхцчшщъыьэюя",
+        "ABVGDEEJZIIKLMNOPRSTUFHCCSS_Y_EUAabvgdeejziiklmnoprstufhccss_y_eua",
+    )
+    return text.translate(table)
+
+
+def render_receipt(width: int = 1200) -> tuple:
+    """Чистый скан чека: чёрный текст на белом. Возвращает (серое изображение, эталон)"""
+    font, cyrillic = load_font(width // 30)
+    lines = RECEIPT_LINES if cyrillic else [transliterate(line) for line in RECEIPT_LINES]
+    line_height = int(width / 30 * 1.6)
+    height = line_height * (len(lines) + 4)
+
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((width // 12, line_height * (i + 2)), line, font=font, fill=0)
+    return np.array(image), "\n".join(lines)
+
+
+def photo_on_table(receipt: np.ndarray) -> np.ndarray:
+    """Чек на тёмном столе, снятый под углом: перспектива и фон вокруг"""
+    h, w = receipt.shape
+    frame_w, frame_h = int(w * 2.2), int(h * 1.6)
+    table = np.full((frame_h, frame_w), 70, dtype=np.uint8)
+    cv2.randu(table, 50, 90)
+    table = cv2.GaussianBlur(table, (9, 9), 0)
+
+    x0, y0 = frame_w * 0.28, frame_h * 0.18
+    corners = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+    target = np.float32([
+        [x0 + w * 0.05, y0], [x0 + w * 1.02, y0 + h * 0.03],
+        [x0 + w * 0.97, y0 + h * 1.05], [x0 - w * 0.02, y0 + h * 0.98],
+    ])
+    matrix = cv2.getPerspectiveTransform(corners, target)
+    warped = cv2.warpPerspective(receipt, matrix, (frame_w, frame_h), borderValue=0)
+    mask = cv2.warpPerspective(np.full_like(receipt, 255), matrix, (frame_w, frame_h))
+    return np.where(mask > 0, warped, table).astype(np.uint8)
+
+
+def make_fixtures() -> list:
+    """Варианты одного чека разного качества: (имя, серое изображение, эталон)"""
+    rng = np.random.default_rng(42)
+    clean, truth = render_receipt()
+
+    def noisy(img, sigma):
+        return np.clip(img + rng.normal(0, sigma, img.shape), 0, 255).astype(np.uint8)
+
+    h, w = clean.shape
+    gradient = np.tile(np.linspace(0.55, 1.0, w), (h, 1))
+
+    fixtures = [
+        ("clean", clean),
+        ("noise_3", noisy(clean, 3)),
+        ("noise_8", noisy(clean, 8)),
+        ("noise_20", noisy(clean, 20)),
+        ("low_contrast", (100 + clean.astype(np.float32) * 70 / 255).astype(np.uint8)),
+        ("blur_noise", noisy(cv2.GaussianBlur(clean, (5, 5), 1.2), 5)),
+        ("uneven_light", noisy((clean * gradient).astype(np.uint8), 4)),
+        ("small_photo", noisy(cv2.resize(clean, (w // 2, h // 2), interpolation=cv2.INTER_AREA), 6)),
+        ("on_table", noisy(photo_on_table(clean), 4)),
+    ]
+    return [(name, img, truth) for name, img in fixtures]
+
+
+def load_fixture_dir(path: Path) -> list:
+    fixtures = []
+    for image_path in sorted(path.iterdir()):
+        if image_path.suffix.lower() not in (".jpg", ".jpeg", ".png"):
+            continue
+        truth_path = image_path.with_suffix(".txt")
+        if not truth_path.exists():
+            continue
+        img = cv2.imdecode(np.fromfile(str(image_path), dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        fixtures.append((image_path.stem, img, truth_path.read_text(encoding="utf-8").strip()))
+    return fixtures
+
+
+def text_accuracy(recognized: str, truth: str) -> float:
+    """Доля совпавших символов (без учёта регистра и пробелов по краям строк)"""
+    normalize = lambda text: "\n".join(line.strip() for line in text.lower().splitlines() if line.strip())
+    return difflib.SequenceMatcher(None, normalize(recognized), normalize(truth)).ratio()
+
+
+def tesseract_available() -> bool:
+    try:
+        ocr_service.warm_up()
+        return True
+    except Exception:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fixtures", type=Path, help="Директория с реальными фото и эталонным текстом")
+    parser.add_argument("--repeat", type=int, default=3, help="Повторов для замера времени (берётся медиана)")
+    args = parser.parse_args()
+
+    logger.remove()
+
+    fixtures = make_fixtures()
+    if args.fixtures:
+        fixtures += load_fixture_dir(args.fixtures)
+    with_ocr = tesseract_available()
+    if not with_ocr:
+        print("tesseract не найден: точность OCR не проверяется, только время предобработки\n")
+
+    header = f"{'фикстура':<14}{'σ шума':>8}{'стадии adaptive':>24}{'full, мс':>10}{'adapt, мс':>11}{'ускорение':>11}"
+    if with_ocr:
+        header += f"{'точн. full':>12}{'точн. adapt':>13}"
+    print(header)
+
+    speedups, accuracy = [], {"full": [], "adaptive": []}
+    for name, img, truth in fixtures:
+        image_bytes = cv2.imencode(".png", img)[1].tobytes()
+        row = {}
+        for mode in ("full", "adaptive"):
+            runs = [image_preprocessing_service.preprocess_with_report(image_bytes, mode) for _ in range(args.repeat)]
+            processed, report = runs[-1]
+            row[mode] = {"ms": statistics.median(r["total_ms"] for _, r in runs), "report": report}
+            if with_ocr:
+                text = ocr_service._image_to_text(Image.fromarray(processed))
+                row[mode]["accuracy"] = text_accuracy(text, truth)
+                accuracy[mode].append(row[mode]["accuracy"])
+
+        report = row["adaptive"]["report"]
+        stages = f"{'crop ' if report['document'] else ''}{report['denoise']}{' +clahe' if report['clahe'] else ''}"
+        speedup = row["full"]["ms"] / row["adaptive"]["ms"]
+        speedups.append(speedup)
+        line = (
+            f"{name:<14}{report['noise_sigma']:>8.2f}{stages:>24}"
+            f"{row['full']['ms']:>10.1f}{row['adaptive']['ms']:>11.1f}{speedup:>10.1f}x"
+        )
+        if with_ocr:
+            line += f"{row['full']['accuracy']:>12.3f}{row['adaptive']['accuracy']:>13.3f}"
+        print(line)
+
+    print()
+    print(f"Медианное ускорение предобработки: {statistics.median(speedups):.1f}x")
+    if with_ocr:
+        print(
+            f"Средняя точность OCR: full {statistics.mean(accuracy['full']):.3f}, "
+            f"adaptive {statistics.mean(accuracy['adaptive']):.3f}"
+        )
+
+    # Время по стадиям для последней фикстуры — где именно уходит время
+    for mode in ("full", "adaptive"):
+        print(f"Стадии ({mode}, {fixtures[-1][0]}): {row[mode]['report']['timings_ms']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Тесты детализации по категориям: агрегаты category_rollups против
+GROUP BY по transactions на одних и тех же данных
+
+Требуется PostgreSQL (DATABASE_URL) со схемой; без него тесты пропускаются.
+"""
+import asyncio
+import sys
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add app to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import pytest
+from sqlalchemy import delete, insert, text
+
+from app.db.session import AsyncSessionLocal, engine
+from app.models import Category, Transaction, User
+from app.services.analytics_service import analytics_service
+
+
+async def _database_available() -> bool:
+    try:
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1 FROM category_rollups LIMIT 1"))
+        return True
+    except Exception:
+        return False
+    finally:
+        await engine.dispose()
+
+
+pytestmark = pytest.mark.skipif(
+    not asyncio.run(_database_available()), reason="PostgreSQL with the FinWise schema is not available"
+)
+
+
+async def _create_user(session, now: datetime) -> uuid.UUID:
+    """Траты и доходы за три года, в текущем месяце и с датой в будущем"""
+    user_id = uuid.uuid4()
+    await session.execute(insert(User).values(
+        id=user_id, username="test", currency="RUB", timezone="Europe/Moscow", theme="light",
+        created_at=now, updated_at=now, is_active=True,
+    ))
+    food, salary = (await session.execute(
+        insert(Category).returning(Category.id),
+        [
+            {"user_id": user_id, "name": "Продукты", "color": "#000000", "is_default": False, "type": "expense"},
+            {"user_id": user_id, "name": "Зарплата", "color": "#000000", "is_default": False, "type": "income"},
+        ],
+    )).scalars().all()
+
+    rows = []
+    for day in range(0, 3 * 365, 3):
+        date = now - timedelta(days=day, hours=day % 24)
+        rows.append({"user_id": user_id, "category_id": food if day % 2 else None, "amount": -(100 + day), "date": date})
+    for month in range(36):
+        rows.append({"user_id": user_id, "category_id": salary, "amount": 50000, "date": now - timedelta(days=30 * month)})
+    # Запланированные траты: не входят ни в один период до now (GROUP BY по transactions их не видит)
+    for day in (1, 40, 400):
+        rows.append({"user_id": user_id, "category_id": food, "amount": -7777, "date": now + timedelta(days=day)})
+    await session.execute(insert(Transaction), rows)
+    return user_id
+
+
+async def _compare(period: str):
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as session:
+        user_id = await _create_user(session, now)
+        await session.commit()
+        try:
+            from_rollups = await analytics_service.category_breakdown(session, user_id, period, now)
+
+            # Тот же период целиком по transactions (путь периода "week")
+            start, end = analytics_service.period_bounds(period, now)
+            rows = await analytics_service._breakdown_from_transactions(
+                session, user_id, start or datetime(1970, 1, 1), end,
+            )
+            totals = [sum(float(row[index]) for row in rows) for index in (1, 3)]
+            return from_rollups, totals
+        finally:
+            await session.execute(delete(User).where(User.id == user_id))
+            await session.commit()
+            await engine.dispose()
+
+
+@pytest.mark.parametrize("period", ["month", "year", "all"])
+def test_rollup_path_matches_transactions_path(period):
+    breakdown, (expenses, income) = asyncio.run(_compare(period))
+
+    assert breakdown["total_expenses"] == pytest.approx(expenses, abs=0.01)
+    assert breakdown["total_income"] == pytest.approx(income, abs=0.01)
+    assert sum(entry["amount"] for entry in breakdown["categories"].values()) == pytest.approx(expenses, abs=0.05)
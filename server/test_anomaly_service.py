@@ -0,0 +1,171 @@
+"""
+Тесты потоковой статистики аномалий (anomaly_service.observe_many)
+на PostgreSQL: конкурентные наблюдения, повторная оценка и отметка
+учтённых строк пакетным пересчётом (scripts/rescore_anomalies.py)
+
+Требуется PostgreSQL (DATABASE_URL) со схемой; без него тесты пропускаются.
+"""
+import asyncio
+import sys
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add app to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import pytest
+from sqlalchemy import delete, insert, select, text, update
+
+from app.db.session import AsyncSessionLocal, engine
+from app.models import Category, Transaction, User
+from app.models.user_category_stats import ALL_CATEGORIES, UserCategoryStats
+from app.services.anomaly_service import anomaly_service
+
+
+async def _database_available() -> bool:
+    try:
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT anomaly_observed FROM transactions LIMIT 1"))
+        return True
+    except Exception:
+        return False
+    finally:
+        await engine.dispose()
+
+
+pytestmark = pytest.mark.skipif(
+    not asyncio.run(_database_available()), reason="PostgreSQL with the FinWise schema is not available"
+)
+
+
+async def _create_user(count: int) -> tuple:
+    """Пользователь без статистики и count расходов без категории"""
+    now = datetime.utcnow()
+    user_id = uuid.uuid4()
+    async with AsyncSessionLocal() as session:
+        await session.execute(insert(User).values(
+            id=user_id, username="test", currency="RUB", timezone="UTC", theme="light",
+            created_at=now, updated_at=now, is_active=True,
+        ))
+        ids = (await session.execute(insert(Transaction).returning(Transaction.id), [
+            {"user_id": user_id, "amount": -(100.0 + i), "date": now - timedelta(hours=i)} for i in range(count)
+        ])).scalars().all()
+        await session.commit()
+    return user_id, [(tx_id, None, -(100.0 + i)) for i, tx_id in enumerate(ids)]
+
+
+async def _pop_counts(user_id: uuid.UUID) -> dict:
+    """Счётчики статистики пользователя по категориям; сам пользователь удаляется"""
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(
+            select(UserCategoryStats.category_id, UserCategoryStats.count)
+            .where(UserCategoryStats.user_id == user_id)
+        )).all()
+        await session.execute(delete(User).where(User.id == user_id))
+        await session.commit()
+    return dict(rows)
+
+
+async def _overlapping_first_observations() -> dict:
+    user_id, transactions = await _create_user(10)
+    try:
+        async with AsyncSessionLocal() as first, AsyncSessionLocal() as second:
+            # Первая транзакция БД создала строки статистики, но ещё не закоммитила их
+            await anomaly_service.observe_many(first, user_id, transactions[:6])
+
+            async def observe_second():
+                await anomaly_service.observe_many(second, user_id, transactions[6:])
+                await second.commit()
+
+            task = asyncio.create_task(observe_second())
+            await asyncio.sleep(0.3)
+            await first.commit()
+            await task
+        return await _pop_counts(user_id)
+    finally:
+        await engine.dispose()
+
+
+async def _repeated_observations() -> dict:
+    user_id, transactions = await _create_user(5)
+    try:
+        async with AsyncSessionLocal() as session:
+            for _ in range(3):
+                await anomaly_service.observe_many(session, user_id, transactions + transactions[:2])
+                await session.commit()
+        return await _pop_counts(user_id)
+    finally:
+        await engine.dispose()
+
+
+async def _rescore_with_newer_online_row() -> dict:
+    """Пересчёт истории, когда онлайн обновил строку одной категории после чтения истории"""
+    sys.path.insert(0, str(Path(__file__).parent / "scripts"))
+    import rescore_anomalies
+
+    now = datetime.utcnow()
+    user_id = uuid.uuid4()
+    try:
+        async with AsyncSessionLocal() as session:
+            await session.execute(insert(User).values(
+                id=user_id, username="test", currency="RUB", timezone="UTC", theme="light",
+                created_at=now, updated_at=now, is_active=True,
+            ))
+            fresh, stale = (await session.execute(insert(Category).returning(Category.id), [
+                {"user_id": user_id, "name": name, "color": "#000000", "is_default": False, "type": "expense"}
+                for name in ("Продукты", "Кафе")
+            ])).scalars().all()
+            await session.execute(insert(Transaction), [
+                {"user_id": user_id, "category_id": category_id, "amount": -(100.0 + i), "date": now - timedelta(days=i)}
+                for i in range(20) for category_id in (fresh, stale)
+            ])
+            await session.execute(update(Transaction).where(Transaction.user_id == user_id).values(
+                anomaly_observed=False, updated_at=Transaction.updated_at,
+            ))
+            items = await rescore_anomalies.load_chunk(session, [user_id])
+            await session.commit()
+
+        started_at = datetime.utcnow()
+        results = rescore_anomalies.rescore_chunk(items, 0.01, use_forest=False)
+        async with AsyncSessionLocal() as session:
+            await session.execute(insert(UserCategoryStats).values(
+                user_id=user_id, category_id=stale, count=0, mean=0, m2=0, ewma=0, ewm_var=0,
+                p2_heights=[], p2_positions=[], updated_at=started_at + timedelta(hours=1),
+            ))
+            await session.commit()
+        await rescore_anomalies.write_chunk(results, started_at)
+
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(
+                select(Transaction.category_id, Transaction.anomaly_observed)
+                .where(Transaction.user_id == user_id)
+            )).all()
+        marked = {category_id: set() for category_id in (fresh, stale)}
+        for category_id, observed in rows:
+            marked[category_id].add(observed)
+        return {"fresh": marked[fresh], "stale": marked[stale]}
+    finally:
+        await _pop_counts(user_id)
+        await engine.dispose()
+
+
+def test_overlapping_first_observations_are_not_lost():
+    counts = asyncio.run(_overlapping_first_observations())
+
+    # Обе транзакции учли свои строки: 6 + 4, а не только последняя записавшая
+    assert counts == {0: 10, ALL_CATEGORIES: 10}
+
+
+def test_repeated_observation_counts_each_transaction_once():
+    counts = asyncio.run(_repeated_observations())
+
+    assert counts == {0: 5, ALL_CATEGORIES: 5}
+
+
+def test_rescore_marks_only_rows_of_written_categories():
+    marked = asyncio.run(_rescore_with_newer_online_row())
+
+    assert marked["fresh"] == {True}
+    # Строку категории сохранило онлайн-состояние — её транзакции онлайн учтёт сам
+    assert marked["stale"] == {False}
@@ -0,0 +1,177 @@
+"""
+Тесты клиента API ФНС (fns_service) на заглушке proverkacheka.com
+
+Заглушка — httpx.MockTransport: ответы задаются сценарием, запросы
+считаются. Проверяются объединение одновременных запросов, кэш, повторы
+с экспоненциальной задержкой и коды ответа /parse-qr.
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Add app to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.v1 import receipts
+from app.config import settings
+from app.services.fns_service import FNSService, FNSServiceError
+
+QR = "t=20240115T1430&s=406.30&fn=9999078900004792&i=12345&fp=2876543210&n=1"
+
+RECEIPT = {"code": 1, "data": {"json": {
+    "user": "ООО \"АГРОТОРГ\" ", "userInn": "7825706086  ",
+    "dateTime": "2024-01-15T14:30:00", "totalSum": 13540,
+    "items": [
+        {"name": "Хлеб белый", "price": 4550, "quantity": 1, "sum": 4550},
+        {"name": "Молоко 3.2% 1л", "price": 8990, "quantity": 1, "sum": 8990},
+    ],
+}}}
+
+
+class StubAPI:
+    """Ответы по порядку (последний повторяется), время каждого запроса"""
+
+    def __init__(self, *responses, latency: float = 0.0):
+        self.responses = list(responses)
+        self.latency = latency
+        self.calls = []
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls.append(time.perf_counter())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        status, payload = self.responses[min(len(self.calls), len(self.responses)) - 1]
+        return httpx.Response(status, json=payload)
+
+
+def make_service(stub: StubAPI) -> FNSService:
+    service = FNSService()
+    service._client = httpx.AsyncClient(transport=httpx.MockTransport(stub), base_url="http://fns.test")
+    return service
+
+
+@pytest.fixture(autouse=True)
+def fns_settings(monkeypatch):
+    monkeypatch.setattr(settings, "FNS_API_KEY", "test-token")
+    monkeypatch.setattr(settings, "FNS_RETRIES", 2)
+    monkeypatch.setattr(settings, "FNS_RETRY_BACKOFF_SECONDS", 0.02)
+
+
+def fetch(service: FNSService, qr: str = QR):
+    return service.get_receipt(FNSService.parse_qr(qr))
+
+
+def test_concurrent_requests_are_coalesced_and_cached():
+    stub = StubAPI((200, RECEIPT), latency=0.05)
+    service = make_service(stub)
+
+    async def scenario():
+        results = await asyncio.gather(*(fetch(service) for _ in range(20)))
+        cached = await fetch(service)
+        return results, cached
+
+    results, cached = asyncio.run(scenario())
+    assert len(stub.calls) == 1
+    assert service.coalesced == 19
+    assert all(result == results[0] for result in results)
+    assert cached == results[0]
+    assert results[0]["total"] == 135.4
+    assert results[0]["retailer_name"] == "ООО \"АГРОТОРГ\""
+    assert [item["sum"] for item in results[0]["items"]] == [45.5, 89.9]
+
+
+@pytest.mark.parametrize("failure", [
+    (503, {"code": 5, "data": "temporary error"}),
+    (429, {"code": 5, "data": "too many requests"}),
+    (200, {"code": 3, "data": "request limit"}),
+    (200, {"code": 4, "data": "wait before retry"}),
+])
+def test_temporary_errors_are_retried_with_backoff(failure):
+    stub = StubAPI(failure, failure, (200, RECEIPT))
+    service = make_service(stub)
+
+    receipt = asyncio.run(fetch(service))
+
+    assert receipt["total"] == 135.4
+    assert len(stub.calls) == 3
+    # Задержка удваивается: 0.02, затем 0.04
+    first, second = stub.calls[1] - stub.calls[0], stub.calls[2] - stub.calls[1]
+    assert first >= 0.02
+    assert second >= 0.04
+
+
+def test_retries_exhausted_maps_to_503():
+    stub = StubAPI((503, {"code": 5, "data": "temporary error"}))
+    service = make_service(stub)
+
+    with pytest.raises(FNSServiceError) as error:
+        asyncio.run(fetch(service))
+
+    assert error.value.status_code == 503
+    assert len(stub.calls) == settings.FNS_RETRIES + 1
+    assert service.failures == 1
+
+
+def test_not_ready_receipt_is_not_cached():
+    stub = StubAPI((200, {"code": 2, "data": "not ready"}), (200, RECEIPT))
+    service = make_service(stub)
+
+    async def scenario():
+        with pytest.raises(FNSServiceError) as error:
+            await fetch(service)
+        return error.value, await fetch(service)
+
+    error, receipt = asyncio.run(scenario())
+    assert error.status_code == 404
+    # Код 2 не повторяется сразу и не кэшируется: следующий запрос снова идёт к API
+    assert len(stub.calls) == 2
+    assert receipt["total"] == 135.4
+
+
+def test_incorrect_receipt_maps_to_404_without_retry():
+    stub = StubAPI((200, {"code": 0, "data": "incorrect"}))
+    service = make_service(stub)
+
+    with pytest.raises(FNSServiceError) as error:
+        asyncio.run(fetch(service))
+
+    assert error.value.status_code == 404
+    assert len(stub.calls) == 1
+
+
+@pytest.mark.parametrize("responses, status_code", [
+    (((200, RECEIPT),), 200),
+    (((200, {"code": 0, "data": "incorrect"}),), 404),
+    (((503, {"code": 5, "data": "temporary error"}),), 503),
+])
+def test_parse_qr_endpoint_status(monkeypatch, responses, status_code):
+    stub = StubAPI(*responses)
+    monkeypatch.setattr(receipts, "fns_service", make_service(stub))
+    app = FastAPI()
+    app.include_router(receipts.router)
+
+    response = TestClient(app).post("/parse-qr", json={"qr_raw": QR})
+
+    assert response.status_code == status_code
+    if status_code == 200:
+        body = response.json()
+        assert body["total"] == 135.4
+        assert [item["name"] for item in body["items"]] == ["Хлеб белый", "Молоко 3.2% 1л"]
+
+
+def test_parse_qr_endpoint_rejects_incomplete_qr(monkeypatch):
+    stub = StubAPI((200, RECEIPT))
+    monkeypatch.setattr(receipts, "fns_service", make_service(stub))
+    app = FastAPI()
+    app.include_router(receipts.router)
+
+    response = TestClient(app).post("/parse-qr", json={"qr_raw": "t=20240115T1430&s=406.30"})
+
+    assert response.status_code == 400
+    assert not stub.calls